@@ -0,0 +1,273 @@
+"""Command-line client for the ClipStack daemon (``main.py --daemon``).
+
+Talks newline-delimited JSON over the daemon's Unix socket and deliberately
+imports nothing beyond the standard library, so it starts in milliseconds
+and can back dmenu/rofi pickers or shell scripts, e.g.::
+
+    clipstack_cli.py pick | rofi -dmenu | cut -f1 | xargs clipstack_cli.py copy
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+SOCKET_NAME = "clipstack.sock"
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"clipstack-{uid}.sock")
+
+
+class ClipStackError(Exception):
+    """Raised when the daemon is unreachable or rejects a request."""
+
+
+class ClipStackClient:
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = 5.0):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader: Optional[TextIO] = None
+
+    def _connect(self) -> Tuple[socket.socket, TextIO]:
+        if self._sock is not None and self._reader is not None:
+            return self._sock, self._reader
+        if not hasattr(socket, "AF_UNIX"):
+            raise ClipStackError("Unix sockets are not supported on this platform")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ClipStackError(f"ClipStack daemon not reachable at {self.socket_path}: {e}")
+        self._sock = sock
+        self._reader = sock.makefile("r", encoding="utf-8")
+        return self._sock, self._reader
+
+    def request(self, cmd: str, **params: Any) -> Any:
+        sock, reader = self._connect()
+        message = dict(params, cmd=cmd)
+        try:
+            sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+            line = reader.readline()
+        except OSError as e:
+            self.close()
+            raise ClipStackError(f"Lost connection to ClipStack daemon: {e}")
+        if not line:
+            self.close()
+            raise ClipStackError("ClipStack daemon closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise ClipStackError(response.get("error", "request failed"))
+        return response.get("result")
+
+    def stream_events(self) -> Iterator[Dict[str, Any]]:
+        """Yield change events until the daemon goes away.
+
+        The connection is dedicated to the stream once this is called.
+        """
+        sock, reader = self._connect()
+        sock.settimeout(None)
+        sock.sendall(b'{"cmd": "stream-events"}\n')
+        for line in reader:
+            yield json.loads(line)
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def _one_line(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _print_items(items: List[Dict[str, Any]]) -> None:
+    for item in items:
+        pin = "*" if item.get("pinned") else " "
+        tags = "".join(f" #{tag}" for tag in item.get("tags") or ())
+        print(f"{item['id']}\t{pin} {item.get('formatted_time', '')}\t"
+              f"{_one_line(item.get('preview', ''))}{tags}")
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """Render a metrics snapshot (the daemon's ``stats`` result) as text."""
+    state = "enabled" if stats.get("enabled") else "disabled (start with --metrics)"
+    lines = [f"Uptime {stats.get('uptime_s', 0):.0f}s, metrics {state}"]
+    if stats.get("rss_bytes") is not None:
+        budget = stats.get("memory_budget")
+        lines.append(f"Resident memory {stats['rss_bytes'] / 1e6:,.1f} MB"
+                     + (f" of a {budget / 1e6:,.1f} MB budget" if budget else ""))
+    for section in ("counters", "gauges"):
+        values = stats.get(section) or {}
+        if values:
+            lines.append(f"{section.capitalize()}:")
+            lines.extend(f"  {name:<28} {values[name]:>12,}" for name in sorted(values))
+    histograms = stats.get("histograms") or {}
+    if histograms:
+        lines.append(f"{'Latency (ms)':<30} {'count':>8} {'mean':>8} {'p50':>8} "
+                     f"{'p90':>8} {'p99':>8} {'max':>8}")
+        for name in sorted(histograms):
+            h = histograms[name]
+            lines.append(f"  {name:<28} {h['count']:>8} {h['mean_ms']:>8.3f} {h['p50_ms']:>8.3f} "
+                         f"{h['p90_ms']:>8.3f} {h['p99_ms']:>8.3f} {h['max_ms']:>8.3f}")
+    for name in stats.get("pending_profiles") or []:
+        lines.append(f"Profile of next {name} pending")
+    for name, report in sorted((stats.get("profiles") or {}).items()):
+        lines.append(f"Profile of {name}:")
+        lines.append(report.rstrip())
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="clipstack", description="Query the ClipStack daemon")
+    parser.add_argument("--socket", default=None, help="daemon socket path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_cmd = commands.add_parser("list", help="list history, newest first")
+    list_cmd.add_argument("-n", "--limit", type=int, default=50)
+    list_cmd.add_argument("--pinned", action="store_true", help="only pinned items")
+    list_cmd.add_argument("--tag", help="only items with this tag, e.g. url or secret")
+    commands.add_parser("pick", help="all items as 'id<TAB>preview' for dmenu/rofi")
+
+    search_cmd = commands.add_parser("search", help="search history")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--fuzzy", action="store_true")
+    search_cmd.add_argument("-n", "--limit", type=int, default=50)
+    search_cmd.add_argument("--tag", help="only items with this tag")
+    commands.add_parser("tags", help="list tags in use, with item counts")
+    similar_cmd = commands.add_parser("similar", help="list an item and its near-duplicates")
+    similar_cmd.add_argument("id", type=int)
+
+    for name, help_text in (("get", "print items' full content"),
+                            ("copy", "copy items to the clipboard as one clip"),
+                            ("pin", "pin items"),
+                            ("unpin", "unpin items"),
+                            ("delete", "delete items")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("ids", type=int, nargs="+", metavar="id")
+        if name in ("get", "copy"):
+            command.add_argument("--separator", default="\n",
+                                 help="between items when several are given (default: newline)")
+
+    for name, help_text in (("tag", "add a tag to items"), ("untag", "remove a tag from items")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("tag")
+        command.add_argument("ids", type=int, nargs="+", metavar="id")
+
+    commands.add_parser("events", help="print change events as JSON lines")
+
+    export_cmd = commands.add_parser(
+        "export", help="stream history to a file (.ndjson, .csv, .txt, .json or .db)"
+    )
+    export_cmd.add_argument("path")
+    export_cmd.add_argument("--format", choices=["ndjson", "csv", "txt", "json", "sqlite"],
+                            help="default: from the file extension")
+    export_cmd.add_argument("--ids", type=int, nargs="+", help="only these items")
+
+    import_cmd = commands.add_parser(
+        "import", help="bulk-import an export or another manager's history file"
+    )
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--format", choices=["json", "ndjson", "csv", "txt", "sqlite", "lines"],
+                            help="default: guessed from the file")
+
+    stats_cmd = commands.add_parser("stats", help="show the daemon's counters and latencies")
+    stats_cmd.add_argument("--json", action="store_true", help="print the raw snapshot")
+    stats_cmd.add_argument("--enable", dest="enable", action="store_const", const=True,
+                           help="start collecting metrics")
+    stats_cmd.add_argument("--disable", dest="enable", action="store_const", const=False,
+                           help="stop collecting metrics")
+    stats_cmd.add_argument("--reset", action="store_true", help="clear collected metrics")
+    profile_cmd = commands.add_parser(
+        "profile", help="cProfile the next span of a timer, e.g. history.save"
+    )
+    profile_cmd.add_argument("name")
+    args = parser.parse_args(argv)
+
+    client = ClipStackClient(args.socket)
+    try:
+        if args.command == "list":
+            _print_items(client.request("list", limit=args.limit,
+                                        pinned=True if args.pinned else None, tag=args.tag))
+        elif args.command == "pick":
+            for item in client.request("list"):
+                print(f"{item['id']}\t{_one_line(item.get('preview', ''))}")
+        elif args.command == "search":
+            _print_items(client.request("search", query=args.query, limit=args.limit,
+                                        mode="fuzzy" if args.fuzzy else "substring", tag=args.tag))
+        elif args.command == "tags":
+            counts = client.request("tags")
+            for tag in sorted(counts):
+                print(f"{tag}\t{counts[tag]}")
+        elif args.command == "similar":
+            _print_items(client.request("similar", id=args.id))
+        elif args.command == "get":
+            if len(args.ids) == 1:
+                sys.stdout.write(client.request("get", id=args.ids[0])["content"])
+            else:
+                sys.stdout.write(client.request("get", ids=args.ids,
+                                                separator=args.separator)["content"])
+        elif args.command == "copy" and len(args.ids) > 1:
+            client.request("copy", ids=args.ids, separator=args.separator)
+        elif args.command in ("copy", "pin", "unpin", "delete"):
+            # Several ids go to the daemon as one batch, and one write
+            if len(args.ids) == 1:
+                client.request(args.command, id=args.ids[0])
+            else:
+                client.request(args.command, ids=args.ids)
+        elif args.command in ("tag", "untag"):
+            client.request(args.command, ids=args.ids, tags=[args.tag])
+        elif args.command == "events":
+            for event in client.stream_events():
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+        elif args.command == "export":
+            # The daemon writes the file, possibly from another working directory
+            export_client = ClipStackClient(args.socket, timeout=None)
+            try:
+                count = export_client.request("export", path=os.path.abspath(args.path),
+                                              format=args.format, ids=args.ids)
+            finally:
+                export_client.close()
+            print(f"Exported {count} items to {args.path}")
+        elif args.command == "import":
+            import_client = ClipStackClient(args.socket, timeout=None)
+            try:
+                report = import_client.request("import", path=os.path.abspath(args.path),
+                                               format=args.format)
+            finally:
+                import_client.close()
+            rate = report["read"] / report["seconds"] if report["seconds"] else 0.0
+            print(f"Imported {report['imported']} of {report['read']} clips "
+                  f"({report['duplicates']} duplicates, {report['skipped']} skipped, "
+                  f"{report['evicted']} dropped by retention) in {report['seconds']:.2f}s, "
+                  f"{rate:,.0f} clips/s")
+        elif args.command == "stats":
+            stats = client.request("stats", enable=args.enable, reset=args.reset)
+            print(json.dumps(stats, indent=2) if args.json else format_stats(stats))
+        elif args.command == "profile":
+            client.request("profile", name=args.name)
+            print(f"Profiling the next {args.name}; see 'stats' once it has run")
+    except ClipStackError as e:
+        print(f"clipstack: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5033 @@
+import json
+import os
+import time
+import datetime
+import threading
+import sys
+import signal
+import platform
+import queue
+import array
+import bisect
+import hashlib
+import mmap
+import zlib
+import select
+import shutil
+import socketserver
+import contextlib
+import heapq
+import math
+import functools
+import re
+import collections
+import gc
+import struct
+from typing import (List, Dict, Any, Optional, Set, Callable, NamedTuple, Iterator, Iterable, Tuple,
+                    BinaryIO, TextIO, ContextManager, Sequence, Union, cast, TYPE_CHECKING)
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+from clipstack_cli import ClipStackClient, ClipStackError, default_socket_path
+
+if TYPE_CHECKING:
+    import cProfile
+    import concurrent.futures
+    import sqlite3
+    import subprocess
+
+HISTORY_FILE = "clipstack_history_data.json"
+MAX_ITEMS = 50
+MIN_POLL_INTERVAL = 0.25
+MAX_POLL_INTERVAL = 10
+POLL_BACKOFF = 1.5
+IDLE_CHECK_INTERVAL = 60
+JOURNAL_SUFFIX = ".journal"
+COMPACTING_SUFFIX = ".compacting"
+COMPACT_THRESHOLD = 500
+LOCK_SUFFIX = ".lock"
+# Ids a process reserves at a time, so concurrent instances never hand out the same one
+ID_BLOCK = 1000
+# How often history files are checked for other processes' writes without inotify
+HISTORY_WATCH_INTERVAL = 1.0
+DURABILITY = "batch"
+DURABILITY_LEVELS = ("none", "batch", "sync")
+SQLITE_FILE = "clipstack_history.db"
+STORAGE_BACKEND = "journal"
+MAX_CONTENT_LENGTH = 10_000_000
+BLOB_DIR = "clipstack_blobs"
+BLOB_THRESHOLD = 4096
+BLOB_COMPRESSION_LEVEL = 6
+INDEX_TEXT_LIMIT = 4096
+# Decompressed blob bodies kept for reuse, in bytes
+CONTENT_CACHE_BYTES = 16 * 1024 * 1024
+# Under a memory budget: bodies longer than this live in the blob store, search
+# indexes a shorter head of each clip, the content cache gets this share of
+# the budget, near-duplicate buckets are
+# fewer (see SIMILAR_BUCKET_BITS), and resident memory is checked this often
+# (seconds)
+BUDGET_BLOB_THRESHOLD = 512
+BUDGET_INDEX_TEXT_LIMIT = 256
+BUDGET_CACHE_SHARE = 0.25
+BUDGET_SIMILAR_BUCKET_BITS = 12
+MEMORY_CHECK_INTERVAL = 10.0
+# Near-duplicate grouping: MinHash in SIMILAR_BANDS bands of SIMILAR_ROWS values,
+# each band bucketed on its low SIMILAR_BUCKET_BITS bits. Clips of at least
+# SIMILAR_MIN_WORDS words are grouped when their word and word-pair sets have a
+# Jaccard similarity of SIMILAR_THRESHOLD or more; at most SIMILAR_MAX_CANDIDATES
+# are checked per clip
+SIMILAR_BANDS = 16
+SIMILAR_ROWS = 3
+SIMILAR_BUCKET_BITS = 16
+SIMILAR_MIN_WORDS = 4
+SIMILAR_THRESHOLD = 0.5
+SIMILAR_MAX_CANDIDATES = 8
+# Blobs stored as a line delta against a similar clip's blob start with this
+DELTA_MAGIC = b"CSD1"
+DELTA_DEPS_SUFFIX = ".deps"
+PREVIEW_LENGTH = 100
+SEARCH_DEBOUNCE = 0.15
+FUZZY_THRESHOLD = 0.5
+EVENT_ADDED = "added"
+EVENT_REMOVED = "removed"
+EVENT_PINNED = "pinned"
+EVENT_UNPINNED = "unpinned"
+EVENT_CLEARED = "cleared"
+EVENT_MOVED = "moved"
+EVENT_TAGGED = "tagged"
+# Another process compacted history this one had not fully read; reload everything
+EVENT_RELOADED = "reloaded"
+# Clips left out of the similarity index by an import were grouped; re-read the groups
+EVENT_REGROUPED = "regrouped"
+EXPORT_FORMATS = ("ndjson", "csv", "txt", "json", "sqlite")
+EXPORT_PAGE_SIZE = 500
+EXPORT_PROGRESS_EVERY = 100
+IMPORT_FORMATS = ("json", "ndjson", "csv", "txt", "sqlite", "lines")
+IMPORT_BATCH = 1000
+IMPORT_READ_SIZE = 1 << 20
+# Retention limits beyond MAX_ITEMS; None disables a limit
+RETENTION_MAX_BYTES: Optional[int] = None
+RETENTION_MAX_AGE: Optional[float] = None
+RETENTION_SIZE_TIERS: List[Tuple[int, float]] = []
+RETENTION_SWEEP_INTERVAL = 60.0
+# Unpinned clips tagged as secrets are kept this long; None keeps them like any other
+RETENTION_SECRET_MAX_AGE: Optional[float] = None
+CLASSIFY_WORKERS = 2
+# Type tags are decided from this much of the start of a clip; secrets are sought in all of it
+CLASSIFY_SAMPLE = 4096
+SECRET_TAG = "secret"
+# A lone token is taken for a password only if it is this long and random: bits of
+# Shannon entropy per character, over its own character frequencies
+PASSWORD_MIN_LENGTH = 16
+PASSWORD_MAX_LENGTH = 128
+PASSWORD_MIN_ENTROPY = 3.5
+# What happens to likely secrets: keep them tagged, expire them after SECRET_MAX_AGE, or skip them
+SECRET_POLICIES = ("keep", "expire", "skip")
+SECRET_POLICY = "keep"
+SECRET_MAX_AGE = 600.0
+SYNC_STATE_SUFFIX = ".sync"
+SYNC_BATCH = 500
+# How long a pull waits on the server for other machines' changes
+SYNC_LONG_POLL = 25.0
+SYNC_RETRY_INTERVAL = 5.0
+# Local changes made within this window are pushed together
+SYNC_DEBOUNCE = 0.05
+# Upper bounds of the latency histogram buckets, in milliseconds
+METRIC_BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+PROFILE_LINES = 25
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles resolve to a bucket bound."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(METRIC_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, milliseconds: float) -> None:
+        self.counts[bisect.bisect_left(METRIC_BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction: float) -> float:
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if bucket == len(METRIC_BUCKETS_MS):
+                    return self.max
+                return min(METRIC_BUCKETS_MS[bucket], self.max)
+        return 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max,
+        }
+
+
+class _NullTimer:
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics: "Metrics", name: str, profile: bool = False):
+        self.metrics = metrics
+        self.name = name
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def __enter__(self) -> "_Timer":
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+            except ValueError as e:
+                # Another profiler is already active on this thread
+                self.metrics.profiles[self.name] = f"Profiling failed: {e}"
+                self.profiler = None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        elapsed = (time.perf_counter() - self.start) * 1000
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.metrics._store_profile(self.name, self.profiler)
+        self.metrics.observe(self.name, elapsed)
+
+
+class Metrics:
+    """Process-wide counters, gauges and latency histograms for the hot paths.
+
+    Disabled by default: every recording call returns after a single
+    attribute check until ``enabled`` is set (``--metrics``). Independently,
+    ``profile_next(name)`` captures a cProfile report of the next
+    ``timer(name)`` span, e.g. ``ui.refresh`` or ``history.save``.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.profiles: Dict[str, str] = {}
+        self._profile_requests: Set[str] = set()
+        # Set by a MemoryMonitor, so stats can show resident memory against it
+        self.memory_budget: Optional[int] = None
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, value: float) -> None:
+        if self.enabled:
+            self.gauges[name] = value
+
+    def observe(self, name: str, milliseconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(milliseconds)
+
+    def timer(self, name: str) -> ContextManager[Any]:
+        """Context manager recording the duration of its block under ``name``."""
+        if self._profile_requests and name in self._profile_requests:
+            with self._lock:
+                if name in self._profile_requests:
+                    self._profile_requests.discard(name)
+                    return _Timer(self, name, profile=True)
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def profile_next(self, name: str) -> None:
+        with self._lock:
+            self._profile_requests.add(name)
+
+    def _store_profile(self, name: str, profiler: "cProfile.Profile") -> None:
+        import io
+        import pstats
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        self.profiles[name] = stream.getvalue()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "uptime_s": time.time() - self.started,
+                "rss_bytes": resident_memory(),
+                "memory_budget": self.memory_budget,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()},
+                "profiles": dict(self.profiles),
+                "pending_profiles": sorted(self._profile_requests),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.profiles.clear()
+
+
+metrics = Metrics()
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_time(seconds: int) -> str:
+    return datetime.datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def resident_memory() -> Optional[int]:
+    """This process's resident set size in bytes, where the platform reports it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # The peak rather than the current size, but the closest available; macOS reports bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def _malloc_trim() -> Optional[Callable[[int], int]]:
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes.util
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6").malloc_trim
+    except (OSError, AttributeError):
+        # Not glibc, e.g. musl
+        return None
+
+
+def release_memory() -> None:
+    """Collect garbage and hand freed heap pages back to the OS where possible."""
+    gc.collect()
+    trim = _malloc_trim()
+    if trim is not None:
+        trim(0)
+
+
+def _make_preview(content: str) -> str:
+    return content[:PREVIEW_LENGTH] + "..." if len(content) > PREVIEW_LENGTH else content
+
+
+def normalize_tags(tags: Iterable[str]) -> List[str]:
+    """Tags as stored: stripped, without blanks or duplicates."""
+    return sorted({tag.strip() for tag in tags if tag and tag.strip()})
+
+
+def _updated_tags(current: Tuple[str, ...], tags: Iterable[str], add: bool) -> Tuple[str, ...]:
+    if add:
+        return tuple(sorted(set(current).union(tags)))
+    return tuple(tag for tag in current if tag not in set(tags))
+
+
+class ClipRecord:
+    """A stored history entry with read-mostly dict-style access.
+
+    Replaces a dict per item: fields live in slots, the content string is
+    shared with whoever created the record, and ``preview`` and
+    ``formatted_time`` are derived on access. Only clips whose body is in
+    the blob store keep their preview, since it cannot be derived cheaply.
+    A missing ``content`` (None) means the body is in the blob store, and a
+    ``uid`` is only kept for clips replicated from another machine.
+    """
+
+    __slots__ = ("id", "content", "timestamp", "pinned", "hash", "size", "tags", "uid", "_preview")
+
+    def __init__(self, item_id: int, content: Optional[str], timestamp: float, pinned: bool = False,
+                 digest: Optional[str] = None, size: Optional[int] = None,
+                 preview: Optional[str] = None, tags: Tuple[str, ...] = (),
+                 uid: Optional[str] = None):
+        self.id = item_id
+        self.content = content
+        self.timestamp = timestamp
+        self.pinned = pinned
+        self.hash = digest
+        self.size = size
+        self.tags = tags
+        self.uid = uid
+        self._preview = preview if content is None else None
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "ClipRecord":
+        blob = bool(item.get("blob"))
+        return cls(item["id"], None if blob else item.get("content", ""),
+                   item.get("timestamp", 0), bool(item.get("pinned", False)), item.get("hash"),
+                   item.get("size"), item.get("preview", "") if blob else None,
+                   tuple(item.get("tags") or ()), item.get("uid"))
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "preview":
+            return self._preview if self.content is None else _make_preview(self.content)
+        if key == "formatted_time":
+            return _format_time(int(self.timestamp))
+        if key == "blob":
+            if self.content is None:
+                return True
+        elif key in ("id", "timestamp", "pinned"):
+            return getattr(self, key)
+        elif key == "tags":
+            if self.tags:
+                return self.tags
+        elif key in ("content", "hash", "size", "uid"):
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in ("id", "content", "timestamp", "pinned", "hash", "size", "tags", "uid"):
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> List[str]:
+        keys = ["id"]
+        if self.content is not None:
+            keys.append("content")
+        keys.extend(("preview", "timestamp", "formatted_time", "pinned"))
+        if self.hash is not None:
+            keys.append("hash")
+        if self.content is None:
+            keys.append("blob")
+        if self.size is not None:
+            keys.append("size")
+        if self.tags:
+            keys.append("tags")
+        if self.uid is not None:
+            keys.append("uid")
+        return keys
+
+    def __contains__(self, key: str) -> bool:
+        # Answered from the slots: this is on the content paths, so no keys() list
+        if key == "content":
+            return self.content is not None
+        if key == "blob":
+            return self.content is None
+        if key in ("id", "preview", "timestamp", "formatted_time", "pinned"):
+            return True
+        if key == "tags":
+            return bool(self.tags)
+        if key in ("hash", "size", "uid"):
+            return getattr(self, key) is not None
+        return False
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self) -> List[Any]:
+        return [self[key] for key in self.keys()]
+
+    def __repr__(self) -> str:
+        return f"ClipRecord({dict(self.items())!r})"
+
+
+class HistoryStorage:
+    """Persistence backend behind ClipboardManager.
+
+    Mutations arrive as records (``add``, ``touch``, ``remove``, ``pin``,
+    ``unpin``, ``tag``, ``untag``, ``clear``) and are applied atomically per
+    call to ``apply``. Storages that set ``resident_bodies`` also take
+    ``spill``, which drops an inline body already copied to the blob store.
+    """
+
+    # Whether clip bodies stored inline are held in this process's memory
+    resident_bodies = False
+
+    def load_history(self, pinned: Optional[bool] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        """Items in display order, without materialising more than a page at a time."""
+        return iter(self.load_history())
+
+    def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def count(self, pinned: Optional[bool] = None) -> int:
+        raise NotImplementedError
+
+    def max_id(self) -> int:
+        raise NotImplementedError
+
+    def allocate_id(self) -> int:
+        """A fresh id for an item about to be added."""
+        self._last_id = max(getattr(self, "_last_id", 0), self.max_id()) + 1
+        return self._last_id
+
+    def watch(self, listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Call ``listener`` with the records other processes apply to the same history."""
+
+    def sync(self) -> List[Dict[str, Any]]:
+        """Fold in other processes' changes now; returns the records applied."""
+        return []
+
+    def unpinned_ids(self, offset: int) -> List[int]:
+        """Ids of unpinned items past the first ``offset``, newest first."""
+        raise NotImplementedError
+
+    def search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def apply(self, records: List[Dict[str, Any]]) -> Optional["WriteTicket"]:
+        """Apply mutations; returns a ticket if they are only queued for disk, done once written."""
+        raise NotImplementedError
+
+    def compact(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FileLock:
+    """Advisory lock shared by every process using the same history files.
+
+    ``flock`` on POSIX, ``msvcrt.locking`` on Windows. The lock is also
+    reentrant within a process, since flock does not exclude threads
+    sharing one descriptor.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                self._lock_fd(self._fd)
+            except OSError:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        try:
+            if self._depth == 0 and self._fd is not None:
+                self._unlock_fd(self._fd)
+        finally:
+            self._thread_lock.release()
+
+    @staticmethod
+    def _lock_fd(fd: int) -> None:
+        if sys.platform != "win32":
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            # LK_LOCK gives up after ten seconds, so keep retrying
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    time.sleep(0.01)
+
+    @staticmethod
+    def _unlock_fd(fd: int) -> None:
+        if sys.platform != "win32":
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+    def close(self) -> None:
+        with self._thread_lock:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
+
+
+class HistoryFileWatcher:
+    """Calls ``callback`` when another process may have changed the history files.
+
+    inotify on the files' directory wakes it promptly on Linux. Elsewhere,
+    or if inotify is unavailable, the files' inode, size and mtime are
+    compared every ``interval`` seconds.
+    """
+
+    _IN_MODIFY = 0x002
+    _IN_MOVED_TO = 0x080
+    _IN_CREATE = 0x100
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+
+    def __init__(self, paths: List[str], callback: Callable[[], None],
+                 interval: float = HISTORY_WATCH_INTERVAL):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.callback = callback
+        self.interval = interval
+        self.wakeups = 0
+        self._stop = threading.Event()
+        self._inotify_fd = self._open_inotify()
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
+        if self._inotify_fd is not None:
+            self._wake_r, self._wake_w = os.pipe()
+        self.thread: Optional[threading.Thread] = None
+
+    def _open_inotify(self) -> Optional[int]:
+        if not sys.platform.startswith("linux"):
+            return None
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd: int = libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = self._IN_MODIFY | self._IN_MOVED_TO | self._IN_CREATE
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+                os.close(fd)
+                return None
+        return fd
+
+    def _signature(self) -> Tuple[Optional[Tuple[int, int, int]], ...]:
+        signature: List[Optional[Tuple[int, int, int]]] = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self.thread.start()
+
+    def _wait(self) -> None:
+        if self._inotify_fd is None:
+            self._stop.wait(self.interval)
+            return
+        fds = [fd for fd in (self._inotify_fd, self._wake_r) if fd is not None]
+        readable, _, _ = select.select(fds, [], [], self.interval)
+        if self._inotify_fd in readable:
+            # The event names are not needed; the signature says what changed
+            try:
+                while os.read(self._inotify_fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def _watch_loop(self) -> None:
+        last = self._signature()
+        while not self._stop.is_set():
+            self._wait()
+            self.wakeups += 1
+            signature = self._signature()
+            if signature == last or self._stop.is_set():
+                continue
+            last = signature
+            try:
+                self.callback()
+            except Exception as e:
+                print(f"History watch error: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"x")
+            except OSError:
+                pass
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=1)
+        self.thread = None
+        for fd in (self._inotify_fd, self._wake_r, self._wake_w):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._inotify_fd = self._wake_r = self._wake_w = None
+
+
+def _journal_generation(path: str) -> Optional[int]:
+    """Generation in a journal's opening checkpoint: 0 without one, None if there is no journal."""
+    try:
+        with open(path, "rb") as f:
+            first = f.readline()
+    except FileNotFoundError:
+        return None
+    try:
+        record = json.loads(first)
+    except ValueError:
+        return 0
+    if isinstance(record, dict) and record.get("op") == "checkpoint":
+        return int(record.get("generation", 0))
+    return 0
+
+
+class WriteTicket:
+    """Completion handle for records queued on a PersistenceWriter."""
+
+    def __init__(self) -> None:
+        self._done = threading.Event()
+        # Set before completion if the write failed, so the records may not be on disk
+        self.failed = False
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+
+class PersistenceWriter:
+    """Single writer thread that owns every write to the journal and snapshot.
+
+    Callers enqueue commands and return immediately. The writer drains
+    whatever has queued up since its last pass and coalesces it into one
+    journal write and at most one fsync. Snapshots are written to a temp
+    file, fsynced and renamed into place, so a crash never leaves a
+    truncated history file behind.
+
+    Durability levels: ``none`` leaves flushing to the OS, ``batch`` fsyncs
+    once per coalesced batch, ``sync`` additionally makes each mutation wait
+    until its batch is on disk.
+
+    With a ``file_lock`` every write holds it, so other processes sharing the
+    files never see a half-written line or compaction. ``on_append`` gets the
+    journal generation and byte range of each write plus how many queued
+    appends it covered; ``on_rotate`` gets the new journal's generation and
+    size after a snapshot. Journals are told apart by generation because a
+    compacted journal's inode can be reused by its successor.
+    """
+
+    def __init__(self, journal_file: str, history_file: str, durability: str = DURABILITY,
+                 file_lock: Optional[FileLock] = None,
+                 on_append: Optional[Callable[[Optional[int], int, int, int], None]] = None,
+                 on_rotate: Optional[Callable[[int, int], None]] = None):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability}")
+        self.journal_file = journal_file
+        self.history_file = history_file
+        self.durability = durability
+        self.file_lock = file_lock
+        self.on_append = on_append
+        self.on_rotate = on_rotate
+        self.batches = 0
+        self.records_written = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._journal: Optional[BinaryIO] = None
+        self._journal_gen = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, records: List[Dict[str, Any]]) -> WriteTicket:
+        ticket = WriteTicket()
+        self._queue.put(("append", records, ticket))
+        return ticket
+
+    def append_now(self, records: List[Dict[str, Any]]) -> None:
+        """Write records from the calling thread, which must hold the file lock."""
+        lines = [json.dumps(record, ensure_ascii=False, default=dict) + "\n" for record in records]
+        self._write_journal(lines, 0, own_handle=False)
+
+    def snapshot(self, build: Callable[[], Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]
+                 ) -> WriteTicket:
+        """Replace the snapshot and start a fresh journal.
+
+        ``build`` runs on the writer thread under the file lock and returns
+        the snapshot items, which must include every record appended before
+        this call, and the records that open the new journal.
+        """
+        ticket = WriteTicket()
+        self._queue.put(("snapshot", build, ticket))
+        return ticket
+
+    def flush(self) -> None:
+        ticket = WriteTicket()
+        self._queue.put(("flush", None, ticket))
+        ticket.wait()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            ticket = WriteTicket()
+            self._queue.put(("stop", None, ticket))
+            self._thread.join()
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            commands = [self._queue.get()]
+            while True:
+                try:
+                    commands.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            pending: List[str] = []
+            appends: List[WriteTicket] = []
+            tickets: List[WriteTicket] = []
+            for kind, payload, ticket in commands:
+                if kind == "append":
+                    pending.extend(json.dumps(record, ensure_ascii=False, default=dict) + "\n"
+                                   for record in payload)
+                    appends.append(ticket)
+                    continue
+                # Anything else is ordered after the appends queued before it
+                self._settle(appends, self._write_journal(pending, len(appends)))
+                tickets.extend(appends)
+                pending, appends = [], []
+                if kind == "snapshot":
+                    self._settle([ticket], self._write_snapshot(payload))
+                elif kind == "stop":
+                    running = False
+                tickets.append(ticket)
+            self._settle(appends, self._write_journal(pending, len(appends)))
+            tickets.extend(appends)
+            for ticket in tickets:
+                ticket._done.set()
+        self._close_journal()
+
+    @staticmethod
+    def _settle(tickets: List[WriteTicket], written: bool) -> None:
+        if not written:
+            for ticket in tickets:
+                ticket.failed = True
+
+    def _locked(self) -> ContextManager[Any]:
+        return self.file_lock if self.file_lock is not None else contextlib.nullcontext()
+
+    def _open_journal(self) -> BinaryIO:
+        if self._journal is not None:
+            try:
+                current = os.stat(self.journal_file).st_ino
+            except FileNotFoundError:
+                current = None
+            # The open handle keeps its inode from being reused, so this is reliable
+            if current != os.fstat(self._journal.fileno()).st_ino:
+                # Another process compacted; its fresh journal is the live one
+                self._close_journal()
+        if self._journal is None:
+            self._journal = self._open_for_append()
+            self._journal_gen = _journal_generation(self.journal_file) or 0
+        return self._journal
+
+    def _open_for_append(self) -> BinaryIO:
+        journal = open(self.journal_file, "ab")
+        size = os.fstat(journal.fileno()).st_size
+        if size:
+            with open(self.journal_file, "rb") as f:
+                f.seek(size - 1)
+                # Terminate a line torn by a crash so the next record stays readable
+                if f.read(1) != b"\n":
+                    journal.write(b"\n")
+        return journal
+
+    def _write_journal(self, lines: List[str], appends: int, own_handle: bool = True) -> bool:
+        """Append lines to the journal; returns False if they could not be written."""
+        if not lines:
+            return True
+        generation, start, end = None, 0, 0
+        try:
+            with self._locked(), metrics.timer("history.save"):
+                if own_handle:
+                    journal = self._open_journal()
+                    journal_gen = self._journal_gen
+                else:
+                    journal = self._open_for_append()
+                    journal_gen = _journal_generation(self.journal_file) or 0
+                try:
+                    data = "".join(lines).encode("utf-8")
+                    journal.flush()
+                    st = os.fstat(journal.fileno())
+                    journal.write(data)
+                    journal.flush()
+                    if self.durability != "none":
+                        os.fsync(journal.fileno())
+                    generation, start, end = journal_gen, st.st_size, st.st_size + len(data)
+                finally:
+                    # Windows cannot rename a journal another process holds open
+                    if not own_handle or platform.system() == 'Windows':
+                        journal.close()
+                        if own_handle:
+                            self._journal = None
+                if self.on_append is not None:
+                    self.on_append(generation, start, end, appends)
+            self.batches += 1
+            self.records_written += len(lines)
+            if metrics.enabled:
+                metrics.incr("history.records_written", len(lines))
+                metrics.incr("history.bytes_written", len(data))
+            return True
+        except (IOError, OSError) as e:
+            print(f"Error: Could not write history journal: {e}")
+            if generation is None and self.on_append is not None:
+                self.on_append(None, 0, 0, appends)
+            return False
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write_snapshot(self, build: Callable[[], Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]
+                        ) -> bool:
+        try:
+            with self._locked():
+                data, opening = build()
+                self._close_journal()
+                compacting = self.journal_file + COMPACTING_SUFFIX
+                if os.path.exists(compacting) and os.path.exists(self.journal_file):
+                    # An earlier snapshot failed after rotating, so the records
+                    # set aside then are in no snapshot yet: keep them and add
+                    # this journal's after them rather than replacing them
+                    self._append_journal(compacting)
+                elif os.path.exists(self.journal_file):
+                    os.replace(self.journal_file, compacting)
+                temp_file = self.history_file + ".tmp"
+                with metrics.timer("history.snapshot"):
+                    with open(temp_file, "w", encoding='utf-8') as f:
+                        json.dump(data, f, ensure_ascii=False)
+                        f.flush()
+                        os.fsync(f.fileno())
+                        written = f.tell()
+                    os.replace(temp_file, self.history_file)
+                    self._fsync_directory()
+                metrics.incr("history.bytes_written", written)
+                if os.path.exists(compacting):
+                    os.remove(compacting)
+                with open(self.journal_file, "wb") as f:
+                    f.write("".join(json.dumps(record) + "\n" for record in opening).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    size = f.tell()
+                if self.on_rotate is not None:
+                    self.on_rotate(_journal_generation(self.journal_file) or 0, size)
+            return True
+        except (IOError, OSError) as e:
+            print(f"Error: Could not save history file: {e}")
+            return False
+
+    def _append_journal(self, target: str) -> None:
+        """Move the journal's records onto the end of ``target``.
+
+        A crash part way leaves them in both files, which replay tolerates.
+        """
+        with open(target, "ab") as out:
+            if out.tell():
+                with open(target, "rb") as f:
+                    f.seek(out.tell() - 1)
+                    if f.read(1) != b"\n":
+                        out.write(b"\n")
+            with open(self.journal_file, "rb") as journal:
+                shutil.copyfileobj(journal, out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.remove(self.journal_file)
+
+    def _fsync_directory(self) -> None:
+        """Make the rename itself durable (POSIX only)."""
+        if platform.system() == 'Windows':
+            return
+        directory = os.path.dirname(os.path.abspath(self.history_file))
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class JournalHistoryStorage(HistoryStorage):
+    """History kept in memory, persisted as a JSON snapshot plus an append-only journal.
+
+    Several processes may share the files. Writes hold a FileLock, each
+    process reserves blocks of ids through ``reserve`` records, and records
+    other processes append are folded in by tailing the journal. A
+    compaction opens the new journal with a ``checkpoint`` record, so a
+    process that had read the old journal to its end carries on from the
+    new one instead of reloading the snapshot.
+    """
+
+    resident_bodies = True
+
+    def __init__(self, history_file: str = HISTORY_FILE, durability: str = DURABILITY):
+        self.history_file = history_file
+        self.journal_file = history_file + JOURNAL_SUFFIX
+        self.durability = durability
+        self._items: Dict[int, ClipRecord] = {}
+        # Pinned and unpinned records, each oldest first beside its (timestamp, id)
+        # key: live clips append, anything else is a bisect away
+        self._keys: Dict[bool, List[Tuple[float, int]]] = {True: [], False: []}
+        self._rows: Dict[bool, List[ClipRecord]] = {True: [], False: []}
+        self._lock = threading.RLock()
+        self._journal_records = 0
+        self._file_lock = FileLock(history_file + LOCK_SUFFIX)
+        # How far this process has read the journal of the current generation
+        self._tail_offset = 0
+        self._generation = 0
+        # Highest id any process has reserved, and this process's current block
+        self._reserved = 0
+        self._next_id = 1
+        self._block_end = 0
+        # (generation, start, end) of journal writes made here, skipped when tailing
+        self._own_writes: List[Tuple[int, int, int]] = []
+        # Records applied in memory but not yet written, re-applied after a reload
+        self._unwritten: List[List[Dict[str, Any]]] = []
+        # Other processes' records applied but not yet passed to the listener
+        self._external: List[Dict[str, Any]] = []
+        self._listener: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+        self._watcher: Optional[HistoryFileWatcher] = None
+        with self._file_lock:
+            self._replay()
+        self.writer = PersistenceWriter(self.journal_file, history_file, durability,
+                                        file_lock=self._file_lock, on_append=self._written,
+                                        on_rotate=self._rotated)
+
+    def _read_snapshot(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.history_file):
+            return []
+        try:
+            with open(self.history_file, "r", encoding='utf-8') as f:
+                items: List[Dict[str, Any]] = json.load(f)
+                return items
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not load history file: {e}")
+            return []
+    
+    def _replay(self) -> None:
+        """Rebuild in-memory history from the snapshot plus any journal records."""
+        self._items = {}
+        self._keys = {True: [], False: []}
+        self._rows = {True: [], False: []}
+        self._journal_records = 0
+        self._tail_offset = 0
+        # Snapshots are stored newest first
+        for item in reversed(self._read_snapshot()):
+            entry = ClipRecord.from_dict(item)
+            if entry.id not in self._items:
+                self._items[entry.id] = entry
+                self._place(entry)
+        # A journal left behind by an interrupted compaction is replayed first.
+        # Records are idempotent, so replaying one already folded into the
+        # snapshot leaves the history unchanged.
+        for path in (self.journal_file + COMPACTING_SUFFIX, self.journal_file):
+            if not os.path.exists(path):
+                continue
+            try:
+                records, end = self._read_journal(path, 0)
+            except IOError as e:
+                print(f"Warning: Could not read history journal: {e}")
+                continue
+            for _, record in records:
+                self._apply(record)
+                self._journal_records += 1
+            if path == self.journal_file:
+                self._tail_offset = end
+        self._generation = _journal_generation(self.journal_file) or 0
+
+    @staticmethod
+    def _read_journal(path: str, offset: int) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+        """Complete records from ``offset`` on, each with its byte offset.
+
+        Also returns the offset just past the last complete line; a trailing
+        partial line is left for the next read.
+        """
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        records = []
+        position = offset
+        for line in data[:end].split(b"\n")[:-1]:
+            start, position = position, position + len(line) + 1
+            try:
+                records.append((start, json.loads(line)))
+            except ValueError:
+                # A line torn by a crash mid-append
+                continue
+        return records, offset + end
+    
+    def _place(self, item: ClipRecord) -> None:
+        keys, rows = self._keys[item.pinned], self._rows[item.pinned]
+        key = (item.timestamp, item.id)
+        if not keys or keys[-1] < key:
+            keys.append(key)
+            rows.append(item)
+        else:
+            # An imported clip older than the newest one
+            index = bisect.bisect_left(keys, key)
+            keys.insert(index, key)
+            rows.insert(index, item)
+
+    def _unplace(self, item: ClipRecord) -> None:
+        keys, rows = self._keys[item.pinned], self._rows[item.pinned]
+        index = bisect.bisect_left(keys, (item.timestamp, item.id))
+        if index < len(rows) and rows[index] is item:
+            del keys[index]
+            del rows[index]
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        item_id = record.get("id", 0)
+        if op == "add":
+            if record["item"].get("id") not in self._items:
+                entry = ClipRecord.from_dict(record["item"])
+                self._items[entry.id] = entry
+                self._place(entry)
+        elif op == "touch":
+            item = self._items.get(item_id)
+            if item is not None:
+                # formatted_time is derived from the timestamp
+                self._unplace(item)
+                item.timestamp = record.get("timestamp", item.timestamp)
+                self._place(item)
+        elif op == "remove":
+            item = self._items.pop(item_id, None)
+            if item is not None:
+                self._unplace(item)
+        elif op == "spill":
+            # The body was moved to the blob store under a memory budget
+            item = self._items.get(item_id)
+            if item is not None and item.content is not None:
+                if item.size is None:
+                    item.size = len(item.content.encode("utf-8"))
+                item._preview = _make_preview(item.content)
+                item.content = None
+        elif op in ("pin", "unpin"):
+            item = self._items.get(item_id)
+            if item is not None and item.pinned != (op == "pin"):
+                self._unplace(item)
+                item.pinned = op == "pin"
+                self._place(item)
+        elif op in ("tag", "untag"):
+            item = self._items.get(item_id)
+            if item is not None:
+                item.tags = _updated_tags(item.tags, record.get("tags", ()), op == "tag")
+        elif op == "clear":
+            self._items = {}
+            self._keys = {True: [], False: []}
+            self._rows = {True: [], False: []}
+        elif op == "reserve":
+            self._reserved = max(self._reserved, record.get("through", 0))
+        elif op == "release":
+            # Only the newest block can be handed back
+            if self._reserved == record.get("through"):
+                self._reserved = record.get("used", 0)
+        elif op == "checkpoint":
+            self._generation = record.get("generation", 0)
+            self._reserved = max(self._reserved, record.get("reserved", 0))
+
+    def _ordered(self) -> List[ClipRecord]:
+        """Pinned items first, then the rest; newest first within each group."""
+        return self._rows[True][::-1] + self._rows[False][::-1]
+    
+    def apply(self, records: List[Dict[str, Any]]) -> Optional[WriteTicket]:
+        """Apply mutations in memory and queue them for the journal."""
+        with self._lock:
+            for record in records:
+                self._apply(record)
+            self._unwritten.append(records)
+            ticket = self.writer.append(records)
+            self._journal_records += len(records)
+            # Compacting once the journal outgrows the snapshot keeps bulk
+            # imports from rewriting the whole history every batch
+            if self._journal_records >= max(COMPACT_THRESHOLD, len(self._items)):
+                self._queue_snapshot()
+        if self.durability == "sync":
+            ticket.wait()
+        return ticket
+    
+    def _queue_snapshot(self) -> WriteTicket:
+        self._journal_records = 0
+        return self.writer.snapshot(self._snapshot_state)
+
+    def _snapshot_state(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        # Runs on the writer thread under the file lock, after the appends
+        # queued before it, so the copy covers the whole journal
+        with self._lock:
+            self._catch_up()
+            checkpoint = {
+                "op": "checkpoint",
+                "generation": self._generation + 1,
+                "reserved": max(self._reserved, self._block_end, max(self._items, default=0)),
+                "previous_size": self._tail_offset,
+            }
+            return [dict(item) for item in self._ordered()], [checkpoint]
+
+    def _written(self, generation: Optional[int], start: int, end: int, appends: int) -> None:
+        with self._lock:
+            del self._unwritten[:appends]
+            if generation is not None:
+                self._own_writes.append((generation, start, end))
+
+    def _rotated(self, generation: int, size: int) -> None:
+        with self._lock:
+            self._generation, self._tail_offset = generation, size
+            self._own_writes = []
+
+    def _catch_up(self) -> None:
+        """Apply records other processes appended since the last read.
+
+        Called with the file lock and the lock held.
+        """
+        generation = _journal_generation(self.journal_file)
+        if generation is None:
+            return
+        try:
+            if generation != self._generation:
+                records, _ = self._read_journal(self.journal_file, 0)
+                first = records[0][1] if records else {}
+                # Carry on into the next journal only if the previous one was read to its end
+                if (generation != self._generation + 1
+                        or first.get("previous_size") != self._tail_offset):
+                    self._reload()
+                    return
+                self._tail_offset = 0
+            elif os.path.getsize(self.journal_file) < self._tail_offset:
+                # Replaced without a checkpoint, e.g. after a failed compaction
+                self._reload()
+                return
+            records, end = self._read_journal(self.journal_file, self._tail_offset)
+        except IOError as e:
+            print(f"Warning: Could not read history journal: {e}")
+            return
+        own = [(start, stop) for own_gen, start, stop in self._own_writes if own_gen == generation]
+        for start, record in records:
+            if any(own_start <= start < own_stop for own_start, own_stop in own):
+                continue
+            self._apply(record)
+            self._journal_records += 1
+            if record.get("op") not in ("reserve", "release", "checkpoint"):
+                self._external.append(record)
+        self._generation, self._tail_offset = generation, end
+        self._own_writes = [write for write in self._own_writes
+                            if write[0] == generation and write[2] > end]
+
+    def _reload(self) -> None:
+        """Re-read everything after missing part of a journal another process compacted."""
+        unwritten = [record for records in self._unwritten for record in records]
+        self._replay()
+        for record in unwritten:
+            self._apply(record)
+        self._own_writes = [write for write in self._own_writes
+                            if write[0] == self._generation and write[2] > self._tail_offset]
+        # Supersedes any records not yet passed on
+        self._external = [{"op": "reload"}]
+        metrics.incr("history.reloads")
+
+    def sync(self) -> List[Dict[str, Any]]:
+        with self._file_lock:
+            with self._lock:
+                self._catch_up()
+                records, self._external = self._external, []
+        return records
+
+    def watch(self, listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+        self._listener = listener
+        if self._watcher is None:
+            self._watcher = HistoryFileWatcher([self.journal_file, self.history_file],
+                                               self._external_changed)
+            self._watcher.start()
+
+    def _external_changed(self) -> None:
+        records = self.sync()
+        if records and self._listener is not None:
+            self._listener(records)
+
+    def allocate_id(self) -> int:
+        with self._lock:
+            if self._next_id <= self._block_end:
+                self._next_id += 1
+                return self._next_id - 1
+        with self._file_lock:
+            with self._lock:
+                # Catch up first, so the block starts past every other process's
+                self._catch_up()
+                start = max(self._reserved, self._block_end, max(self._items, default=0)) + 1
+                record: Dict[str, Any] = {"op": "reserve", "through": start + ID_BLOCK - 1}
+                self.writer.append_now([record])
+                self._apply(record)
+                self._journal_records += 1
+                self._next_id, self._block_end = start + 1, record["through"]
+                return start
+    
+    def compact(self) -> None:
+        """Fold the journal into a fresh snapshot and wait for it to land."""
+        with self._lock:
+            ticket = self._queue_snapshot()
+        ticket.wait()
+
+    def load_history(self, pinned: Optional[bool] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._ordered() if pinned is None else self._rows[bool(pinned)][::-1]
+        # Records stand in for the dicts other storages return
+        return cast(List[Dict[str, Any]], rows)
+
+    def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return cast(Optional[Dict[str, Any]], self._items.get(item_id))
+
+    def count(self, pinned: Optional[bool] = None) -> int:
+        with self._lock:
+            if pinned is None:
+                return len(self._items)
+            return len(self._rows[bool(pinned)])
+
+    def max_id(self) -> int:
+        with self._lock:
+            return max(self._items, default=0)
+
+    def unpinned_ids(self, offset: int) -> List[int]:
+        with self._lock:
+            unpinned = self._rows[False]
+            return [item.id for item in reversed(unpinned[:max(len(unpinned) - offset, 0)])]
+
+    def search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
+        needle = query.lower()
+        with self._lock:
+            results = [item for item in self._ordered() if needle in (item.content or "").lower()]
+        return cast(List[Dict[str, Any]], results[:limit])
+
+    def _release_ids(self) -> None:
+        """Hand back the unused part of this process's block, if no one reserved past it."""
+        with self._file_lock:
+            with self._lock:
+                self._catch_up()
+                if self._next_id > self._block_end or self._reserved != self._block_end:
+                    return
+                record = {"op": "release", "through": self._block_end, "used": self._next_id - 1}
+                self.writer.append_now([record])
+                self._apply(record)
+                self._block_end = self._next_id - 1
+
+    def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        self._release_ids()
+        self.writer.close()
+        self._file_lock.close()
+
+
+class SQLiteHistoryStorage(HistoryStorage):
+    """History stored in SQLite with an FTS5 index over item content."""
+
+    _COLUMNS = "id, content, preview, timestamp, formatted_time, pinned, hash, blob, size, tags, uid"
+
+    _SYNCHRONOUS = {"none": "OFF", "batch": "NORMAL", "sync": "FULL"}
+
+    def __init__(self, db_file: str = SQLITE_FILE, durability: str = DURABILITY):
+        import sqlite3
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={self._SYNCHRONOUS[durability]}")
+        self._fts = True
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        import sqlite3
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "id INTEGER PRIMARY KEY, content TEXT NOT NULL, preview TEXT, "
+                "timestamp REAL NOT NULL, formatted_time TEXT, "
+                "pinned INTEGER NOT NULL DEFAULT 0, hash TEXT, "
+                "blob INTEGER NOT NULL DEFAULT 0, size INTEGER, tags TEXT, uid TEXT)"
+            )
+            # Columns added after the first release of the schema
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(history)")}
+            for column, declaration in (("hash", "TEXT"), ("blob", "INTEGER NOT NULL DEFAULT 0"),
+                                        ("size", "INTEGER"), ("tags", "TEXT"), ("uid", "TEXT")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE history ADD COLUMN {column} {declaration}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_hash ON history (hash)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_history_order "
+                "ON history (pinned DESC, timestamp DESC, id DESC)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp)"
+            )
+            try:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                    "content, content='history', content_rowid='id')"
+                )
+            except sqlite3.OperationalError as e:
+                print(f"Warning: SQLite FTS5 unavailable, search falls back to LIKE: {e}")
+                self._fts = False
+                return
+            self._conn.executescript(
+                "CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN "
+                "INSERT INTO history_fts(rowid, content) VALUES (new.id, new.content); END;"
+                "CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN "
+                "INSERT INTO history_fts(history_fts, rowid, content) "
+                "VALUES ('delete', old.id, old.content); END;"
+            )
+
+    @staticmethod
+    def _row_to_item(row: "sqlite3.Row") -> ClipRecord:
+        blob = bool(row["blob"])
+        # A blob row's body lives in the blob store; size is NULL in rows
+        # written before sizes were recorded
+        return ClipRecord(row["id"], None if blob else row["content"], row["timestamp"],
+                          bool(row["pinned"]), row["hash"], row["size"],
+                          row["preview"] if blob else None,
+                          tuple(json.loads(row["tags"])) if row["tags"] else (), row["uid"])
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [self._row_to_item(row) for row in self._conn.execute(sql, params)]
+        return cast(List[Dict[str, Any]], rows)
+
+    def load_history(self, pinned: Optional[bool] = None) -> List[Dict[str, Any]]:
+        order = " ORDER BY pinned DESC, timestamp DESC, id DESC"
+        if pinned is None:
+            return self._query(f"SELECT {self._COLUMNS} FROM history" + order)
+        return self._query(
+            f"SELECT {self._COLUMNS} FROM history WHERE pinned = ?" + order, (int(pinned),)
+        )
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        # Keyset pagination: the lock is only held per page, so writers are not
+        # stalled for the length of a large export
+        page = self._query(
+            f"SELECT {self._COLUMNS} FROM history "
+            "ORDER BY pinned DESC, timestamp DESC, id DESC LIMIT ?", (EXPORT_PAGE_SIZE,)
+        )
+        while page:
+            yield from page
+            last = page[-1]
+            page = self._query(
+                f"SELECT {self._COLUMNS} FROM history WHERE (pinned, timestamp, id) < (?, ?, ?) "
+                "ORDER BY pinned DESC, timestamp DESC, id DESC LIMIT ?",
+                (int(last["pinned"]), last["timestamp"], last["id"], EXPORT_PAGE_SIZE)
+            )
+
+    def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query(f"SELECT {self._COLUMNS} FROM history WHERE id = ?", (item_id,))
+        return rows[0] if rows else None
+
+    def count(self, pinned: Optional[bool] = None) -> int:
+        with self._lock:
+            if pinned is None:
+                return int(self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0])
+            return int(self._conn.execute(
+                "SELECT COUNT(*) FROM history WHERE pinned = ?", (int(pinned),)
+            ).fetchone()[0])
+
+    def max_id(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0])
+
+    def unpinned_ids(self, offset: int) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM history WHERE pinned = 0 "
+                "ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?", (offset,)
+            )]
+
+    def search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
+        terms = query.split()
+        if not terms:
+            return []
+        if not self._fts:
+            return self._query(
+                f"SELECT {self._COLUMNS} FROM history WHERE content LIKE ? "
+                "ORDER BY timestamp DESC LIMIT ?", (f"%{query}%", limit)
+            )
+        # Quote every term so user input is never parsed as FTS5 syntax
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        return self._query(
+            "SELECT h.id, h.content, h.preview, h.timestamp, h.formatted_time, h.pinned, h.hash, h.blob, "
+            "h.size, h.tags, h.uid "
+            "FROM history_fts JOIN history h ON h.id = history_fts.rowid "
+            "WHERE history_fts MATCH ? ORDER BY rank LIMIT ?", (match, limit)
+        )
+
+    def apply(self, records: List[Dict[str, Any]]) -> Optional[WriteTicket]:
+        # The timer closes after the commit on leaving the connection context
+        with self._lock, metrics.timer("history.save"), self._conn:
+            for record in records:
+                op = record.get("op")
+                if op == "add":
+                    item = record["item"]
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO history "
+                        "(id, content, preview, timestamp, formatted_time, pinned, hash, blob, size, "
+                        "tags, uid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (item["id"], item.get("content", ""), item.get("preview"),
+                         item.get("timestamp", time.time()), item.get("formatted_time"),
+                         int(bool(item.get("pinned"))), item.get("hash"),
+                         int(bool(item.get("blob"))), item.get("size"),
+                         json.dumps(list(item["tags"])) if item.get("tags") else None,
+                         item.get("uid"))
+                    )
+                elif op == "touch":
+                    self._conn.execute(
+                        "UPDATE history SET timestamp = ?, formatted_time = ? WHERE id = ?",
+                        (record.get("timestamp"), record.get("formatted_time"), record.get("id"))
+                    )
+                elif op == "remove":
+                    self._conn.execute("DELETE FROM history WHERE id = ?", (record.get("id"),))
+                elif op in ("pin", "unpin"):
+                    self._conn.execute(
+                        "UPDATE history SET pinned = ? WHERE id = ?",
+                        (int(op == "pin"), record.get("id"))
+                    )
+                elif op in ("tag", "untag"):
+                    row = self._conn.execute(
+                        "SELECT tags FROM history WHERE id = ?", (record.get("id"),)
+                    ).fetchone()
+                    if row is not None:
+                        tags = _updated_tags(tuple(json.loads(row[0])) if row[0] else (),
+                                             record.get("tags", ()), op == "tag")
+                        self._conn.execute(
+                            "UPDATE history SET tags = ? WHERE id = ?",
+                            (json.dumps(list(tags)) if tags else None, record.get("id"))
+                        )
+                elif op == "clear":
+                    self._conn.execute("DELETE FROM history")
+        # Already committed
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_storage(backend: str = STORAGE_BACKEND, history_file: str = HISTORY_FILE,
+                   db_file: str = SQLITE_FILE, durability: str = DURABILITY) -> HistoryStorage:
+    if backend == "sqlite":
+        return SQLiteHistoryStorage(db_file, durability)
+    return JournalHistoryStorage(history_file, durability)
+
+
+def migrate_json_to_sqlite(history_file: str = HISTORY_FILE, db_file: str = SQLITE_FILE) -> int:
+    """Copy the JSON history (snapshot plus journal) into a SQLite database.
+
+    Returns the number of items migrated. Items already present in the
+    database are left untouched, so the migration can safely be re-run.
+    """
+    source = JournalHistoryStorage(history_file)
+    target = SQLiteHistoryStorage(db_file)
+    try:
+        history = source.load_history()
+        # Oldest first so that ordering by timestamp matches the source
+        target.apply([{"op": "add", "item": item} for item in reversed(history)])
+        return len(history)
+    finally:
+        source.close()
+        target.close()
+
+
+class ChangeEvent(NamedTuple):
+    """A single history mutation published by ClipboardManager."""
+    kind: str
+    item_id: Optional[int] = None
+    item: Optional[Dict[str, Any]] = None
+    # For an added item, the key of the group of similar clips it joined
+    group: Optional[int] = None
+
+
+def _history_sort_key(item: Dict[str, Any]) -> tuple:
+    return (not item.get("pinned", False), -item.get("timestamp", 0), -item.get("id", 0))
+
+
+def apply_change_events(rows: List[Dict[str, Any]], events: List[ChangeEvent]) -> List[Dict[str, Any]]:
+    """Fold a burst of change events into an ordered row list.
+
+    Events are coalesced per item first, so an item added and removed within
+    the same burst never touches the list, and the list is filtered at most
+    once however many removals arrive.
+    """
+    for i in range(len(events) - 1, -1, -1):
+        if events[i].kind == EVENT_CLEARED:
+            rows = []
+            events = events[i + 1:]
+            break
+    final: Dict[int, ChangeEvent] = {}
+    for event in events:
+        if event.item_id is not None:
+            final[event.item_id] = event
+    if not final:
+        return rows
+    rows = [row for row in rows if row.get("id") not in final]
+    for event in final.values():
+        if event.kind != EVENT_REMOVED and event.item is not None:
+            bisect.insort(rows, event.item, key=_history_sort_key)
+    return rows
+
+
+def _in_sorted(values: Sequence[int], value: int) -> bool:
+    index = bisect.bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+
+class TrigramIndex:
+    """Incrementally maintained trigram index over the head of each item's content.
+
+    Substring queries intersect the posting lists of the query's trigrams and
+    verify the survivors against ``text_of``; fuzzy queries rank items by the
+    fraction of query trigrams they share. Texts are not kept here: a posting
+    is a lone id or a sorted ``array('I')`` of ids, a few bytes per trigram
+    occurrence. Texts shorter than a trigram are posted under themselves.
+    """
+
+    def __init__(self, text_of: Callable[[int], Optional[str]],
+                 max_chars: int = INDEX_TEXT_LIMIT):
+        # An item's text as indexed: lowercased and cut to max_chars
+        self.text_of = text_of
+        self.max_chars = max_chars
+        self._postings: Dict[str, Any] = {}
+        self._ids: Set[int] = set()
+        # Items removed without their text; their postings stay until a sweep
+        self._stale = 0
+
+    @staticmethod
+    def _trigrams(text: str) -> Set[str]:
+        if len(text) < 3:
+            return {text} if text else set()
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, item_id: int, content: str) -> None:
+        if item_id in self._ids:
+            return
+        self._ids.add(item_id)
+        postings = self._postings
+        for gram in self._trigrams(content[:self.max_chars].lower()):
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = item_id
+            elif type(posting) is int:
+                postings[gram] = array.array("I", sorted((posting, item_id)))
+            elif posting[-1] < item_id:
+                posting.append(item_id)
+            else:
+                bisect.insort(posting, item_id)
+
+    def add_many(self, items: Iterable[Tuple[int, str]], chunk: int = 1000) -> None:
+        """Index ``(item_id, content)`` pairs in id order, merging postings ``chunk`` items at a time."""
+        added: Dict[str, List[int]] = {}
+        for n, (item_id, content) in enumerate(items, 1):
+            if item_id in self._ids:
+                continue
+            self._ids.add(item_id)
+            for gram in self._trigrams(content[:self.max_chars].lower()):
+                ids = added.get(gram)
+                if ids is None:
+                    added[gram] = [item_id]
+                else:
+                    ids.append(item_id)
+            if n % chunk == 0:
+                self._merge(added)
+                added = {}
+        self._merge(added)
+
+    def _merge(self, added: Dict[str, List[int]]) -> None:
+        postings = self._postings
+        for gram, ids in added.items():
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = ids[0] if len(ids) == 1 else array.array("I", ids)
+            elif type(posting) is not int and posting[-1] < ids[0]:
+                posting.extend(ids)
+            else:
+                postings[gram] = array.array("I", sorted([*self._posting(gram), *ids]))
+
+    def remove(self, item_id: int, content: Optional[str] = None) -> None:
+        """Drop an item; without the ``content`` it was added with, its postings go in a later sweep."""
+        if item_id not in self._ids:
+            return
+        self._ids.discard(item_id)
+        if content is None:
+            self._stale += 1
+            if self._stale > max(len(self._ids), 100):
+                self._sweep()
+            return
+        postings = self._postings
+        for gram in self._trigrams(content[:self.max_chars].lower()):
+            posting = postings.get(gram)
+            if posting is None:
+                continue
+            if type(posting) is int:
+                if posting == item_id:
+                    del postings[gram]
+                continue
+            # Retention removes the oldest item, usually first in the posting
+            index = 0 if posting[0] == item_id else bisect.bisect_left(posting, item_id)
+            if index < len(posting) and posting[index] == item_id:
+                del posting[index]
+                if len(posting) == 1:
+                    postings[gram] = posting[0]
+
+    def _sweep(self) -> None:
+        """Drop postings of items that were removed without their text."""
+        ids = self._ids
+        for gram, posting in list(self._postings.items()):
+            if type(posting) is int:
+                if posting not in ids:
+                    del self._postings[gram]
+                continue
+            kept = [item_id for item_id in posting if item_id in ids]
+            if len(kept) == len(posting):
+                continue
+            if not kept:
+                del self._postings[gram]
+            elif len(kept) == 1:
+                self._postings[gram] = kept[0]
+            else:
+                self._postings[gram] = array.array("I", kept)
+        self._stale = 0
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._ids.clear()
+        self._stale = 0
+
+    def _posting(self, gram: str) -> Sequence[int]:
+        posting = self._postings.get(gram, ())
+        return (posting,) if type(posting) is int else posting
+
+    def _candidates(self, grams: Set[str]) -> Set[int]:
+        postings = sorted((self._posting(gram) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if len(posting) > 16 * len(result):
+                # Look the few survivors up in a long posting rather than walk it
+                result = {item_id for item_id in result if _in_sorted(posting, item_id)}
+            else:
+                result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def query(self, query: str, mode: str = "substring", limit: int = 100,
+              cancelled: Optional[threading.Event] = None,
+              allowed: Optional[Set[int]] = None) -> List[int]:
+        """Return matching item ids, best match first, from ``allowed`` if given."""
+        needle = query.lower().strip()[:self.max_chars]
+        if not needle:
+            return []
+        scored = []
+        if mode == "fuzzy" and len(needle) >= 3:
+            grams = self._trigrams(needle)
+            counts: Dict[int, int] = {}
+            threshold = max(1, int(len(grams) * FUZZY_THRESHOLD))
+            for gram in grams:
+                posting: Iterable[int] = self._posting(gram)
+                if allowed is not None:
+                    posting = allowed.intersection(posting)
+                for item_id in posting:
+                    counts[item_id] = counts.get(item_id, 0) + 1
+            for item_id, shared in counts.items():
+                if shared >= threshold and item_id in self._ids:
+                    exact = needle in (self.text_of(item_id) or "")
+                    scored.append((exact, shared / len(grams), item_id))
+        else:
+            if len(needle) >= 3:
+                candidates = self._candidates(self._trigrams(needle))
+            else:
+                # Shorter than a trigram: every item with a trigram containing it
+                candidates = set()
+                for gram in [gram for gram in self._postings if needle in gram]:
+                    candidates.update(self._posting(gram))
+            candidates &= self._ids if allowed is None else self._ids & allowed
+            for n, item_id in enumerate(candidates):
+                if cancelled is not None and n % 1000 == 0 and cancelled.is_set():
+                    return []
+                position = (self.text_of(item_id) or "").find(needle)
+                if position >= 0:
+                    # Earlier matches rank higher, newer items break ties
+                    scored.append((True, -position, item_id))
+        scored.sort(reverse=True)
+        return [item_id for _, _, item_id in scored[:limit]]
+
+
+class SimilarityIndex:
+    """Groups near-duplicate clips, e.g. a log line with another timestamp.
+
+    A clip's features are its words and adjacent word pairs. One-permutation
+    MinHash turns them into ``SIMILAR_BANDS`` bands of ``SIMILAR_ROWS``
+    minima, and each band is bucketed, so a new clip is only compared with
+    the clips sharing a band with it rather than the whole history. Those
+    candidates are confirmed by the Jaccard similarity of the two feature
+    sets. Each group has one base in the buckets; the other members hang
+    off it and are never compared with directly. Features and bands are
+    hashed with unsalted hashes, so every process groups clips the same way.
+    """
+
+    _WORD = re.compile(r"\w+")
+    _MASK = (1 << 64) - 1
+    # Added per bin skipped when an empty bin borrows a neighbour's minimum
+    _DENSIFY_STEP = 0x9E3779B97F4A7C15
+    _BAND_FORMAT = f"<{SIMILAR_BANDS}I"
+    _ROWS_FORMAT = f"<{SIMILAR_ROWS}Q"
+
+    def __init__(self, text_of: Callable[[int], Optional[str]],
+                 threshold: float = SIMILAR_THRESHOLD, bucket_bits: int = SIMILAR_BUCKET_BITS):
+        self.text_of = text_of
+        self.threshold = threshold
+        self._bucket_mask = (1 << bucket_bits) - 1
+        # Packed band values of every grouped-or-groupable item
+        self._signatures: Dict[int, bytes] = {}
+        # Per band, a slot per bucket holding None, a base id or a list of them
+        self._buckets: List[Optional[List[Any]]] = [None] * SIMILAR_BANDS
+        # Member -> group key, and key -> [base id, member ids], for groups of two or more
+        self._group_of: Dict[int, int] = {}
+        self._groups: Dict[int, List[Any]] = {}
+
+    @classmethod
+    def _features(cls, text: str) -> Optional[Set[str]]:
+        words = cls._WORD.findall(text)
+        if len(words) < SIMILAR_MIN_WORDS:
+            return None
+        features = set(words)
+        features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        return features
+
+    @classmethod
+    def _signature(cls, features: Set[str]) -> bytes:
+        bins = SIMILAR_BANDS * SIMILAR_ROWS
+        empty = cls._MASK
+        minima = [empty] * bins
+        for feature in features:
+            value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(),
+                                   "little")
+            slot = value % bins
+            if value < minima[slot]:
+                minima[slot] = value
+        if empty in minima:
+            # Short clips leave bins empty; each borrows the minimum of the next filled
+            # bin round the ring, walking it backwards twice to wrap
+            filled = list(minima)
+            nearest, step = empty, 0
+            for slot in range(2 * bins - 1, -1, -1):
+                value = minima[slot % bins]
+                if value != empty:
+                    nearest, step = value, 0
+                else:
+                    step += 1
+                    if slot < bins and nearest != empty:
+                        filled[slot] = (nearest + step * cls._DENSIFY_STEP) & cls._MASK
+            minima = filled
+        return struct.pack(cls._BAND_FORMAT, *(
+            zlib.crc32(struct.pack(cls._ROWS_FORMAT,
+                                   *minima[band * SIMILAR_ROWS:(band + 1) * SIMILAR_ROWS]))
+            for band in range(SIMILAR_BANDS)
+        ))
+
+    def _bucket(self, item_id: int, signature: bytes) -> None:
+        for band, value in enumerate(struct.unpack(self._BAND_FORMAT, signature)):
+            slots = self._buckets[band]
+            if slots is None:
+                slots = self._buckets[band] = [None] * (self._bucket_mask + 1)
+            index = value & self._bucket_mask
+            entry = slots[index]
+            if entry is None:
+                slots[index] = item_id
+            elif type(entry) is list:
+                entry.append(item_id)
+            else:
+                slots[index] = [entry, item_id]
+
+    def _unbucket(self, item_id: int, signature: bytes) -> None:
+        for band, value in enumerate(struct.unpack(self._BAND_FORMAT, signature)):
+            slots = self._buckets[band]
+            if slots is None:
+                continue
+            index = value & self._bucket_mask
+            entry = slots[index]
+            if type(entry) is list:
+                entry.remove(item_id)
+                if len(entry) == 1:
+                    slots[index] = entry[0]
+            elif entry == item_id:
+                slots[index] = None
+
+    def _match(self, features: Set[str], signature: bytes) -> Optional[int]:
+        """The base most similar to a clip, if any is similar enough."""
+        hits: Dict[int, int] = {}
+        for band, value in enumerate(struct.unpack(self._BAND_FORMAT, signature)):
+            slots = self._buckets[band]
+            if slots is None:
+                continue
+            entry = slots[value & self._bucket_mask]
+            if entry is None:
+                continue
+            for base in entry if type(entry) is list else (entry,):
+                # Slots only hold the low bits; a real band match has the whole value
+                if self._signatures[base][band * 4:band * 4 + 4] == signature[band * 4:band * 4 + 4]:
+                    hits[base] = hits.get(base, 0) + 1
+        best, best_similarity = None, self.threshold
+        ranked = sorted(hits, key=lambda base: hits[base], reverse=True)
+        for base in ranked[:SIMILAR_MAX_CANDIDATES]:
+            other = self._features(self.text_of(base) or "")
+            if other is None:
+                continue
+            similarity = len(features & other) / len(features | other)
+            if similarity >= best_similarity:
+                best, best_similarity = base, similarity
+        metrics.incr("similar.candidates", len(hits))
+        return best
+
+    def match(self, text: str) -> Optional[int]:
+        """The base of the group a clip with this (lowercased) text would join."""
+        features = self._features(text)
+        if features is None:
+            return None
+        return self._match(features, self._signature(features))
+
+    def add(self, item_id: int, text: Optional[str] = None) -> Optional[int]:
+        """Index an item; returns the base of the group it joined, if any.
+
+        ``text`` is its lowercased text, fetched through ``text_of`` if not given.
+        """
+        if item_id in self._signatures:
+            return None
+        features = self._features((self.text_of(item_id) if text is None else text) or "")
+        if features is None:
+            return None
+        signature = self._signature(features)
+        base = self._match(features, signature)
+        self._signatures[item_id] = signature
+        if base is None:
+            self._bucket(item_id, signature)
+            return None
+        key = self._group_of.get(base, base)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = [base, {base}]
+            self._group_of[base] = key
+        group[1].add(item_id)
+        self._group_of[item_id] = key
+        metrics.incr("similar.grouped")
+        return base
+
+    def remove(self, item_id: int) -> None:
+        signature = self._signatures.pop(item_id, None)
+        if signature is None:
+            return
+        key = self._group_of.pop(item_id, None)
+        if key is None:
+            self._unbucket(item_id, signature)
+            return
+        group = self._groups[key]
+        members = group[1]
+        members.discard(item_id)
+        if group[0] == item_id:
+            # Another member takes over as the base; the group keeps its key
+            self._unbucket(item_id, signature)
+            group[0] = next(iter(members))
+            self._bucket(group[0], self._signatures[group[0]])
+        if len(members) == 1:
+            del self._groups[key]
+            del self._group_of[group[0]]
+
+    def clear(self) -> None:
+        self._signatures.clear()
+        self._buckets = [None] * SIMILAR_BANDS
+        self._group_of.clear()
+        self._groups.clear()
+
+    def groups(self) -> Dict[int, int]:
+        """Item id -> group key, for every item with at least one similar item."""
+        return dict(self._group_of)
+
+    def members(self, item_id: int) -> List[int]:
+        """The item's group, base first, or just the item if it has none."""
+        key = self._group_of.get(item_id)
+        if key is None:
+            return [item_id]
+        base, members = self._groups[key]
+        return [base] + sorted((member for member in members if member != base), reverse=True)
+
+    def base_of(self, item_id: int) -> Optional[int]:
+        key = self._group_of.get(item_id)
+        return self._groups[key][0] if key is not None else None
+
+    def group_of(self, item_id: int) -> Optional[int]:
+        """The item's group key; a group is keyed by its first base, even once that is gone."""
+        return self._group_of.get(item_id)
+
+
+class BlobStore:
+    """Content-addressed, zlib-compressed storage for large clip bodies.
+
+    Blobs live at ``<directory>/<hash[:2]>/<hash>`` and are read through
+    mmap, so a clip body is only paged in when it is actually needed.
+
+    A blob may instead hold a line delta against a base blob, when that is
+    less than half the size of the whole body. Such a blob is registered in
+    ``<base path>.deps``, and deleting the base first rewrites each
+    dependent blob in full, so deltas are never more than one level deep.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._delta_lock: Optional[FileLock] = None
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _lock(self) -> FileLock:
+        # Shared with other processes storing deltas in the same directory
+        if self._delta_lock is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._delta_lock = FileLock(os.path.join(self.directory, "deltas" + LOCK_SUFFIX))
+        return self._delta_lock
+
+    def _write(self, digest: str, data: bytes) -> None:
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = path + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+        metrics.incr("blobs.bytes_written", len(data))
+
+    def put(self, digest: str, content: str, base: Optional[Tuple[str, str]] = None) -> None:
+        """Store a body, as a delta against ``base`` (its digest and content) if that is much smaller."""
+        path = self._path(digest)
+        if os.path.exists(path):
+            return
+        data = zlib.compress(content.encode("utf-8"), BLOB_COMPRESSION_LEVEL)
+        if base is None or base[0] == digest:
+            self._write(digest, data)
+            return
+        base_digest, base_content = base
+        delta = self._delta(base_content, content)
+        if len(delta) * 2 >= len(data):
+            self._write(digest, data)
+            return
+        with self._lock():
+            if not os.path.exists(self._path(base_digest)) or self._delta_base(base_digest):
+                # The base went away meanwhile, or is a delta itself
+                self._write(digest, data)
+                return
+            deps = self._path(base_digest) + DELTA_DEPS_SUFFIX
+            os.makedirs(deps, exist_ok=True)
+            open(os.path.join(deps, digest), "wb").close()
+            self._write(digest, DELTA_MAGIC + base_digest.encode("ascii") + b"\n" + delta)
+        metrics.incr("blobs.deltas")
+
+    @staticmethod
+    def _delta(base: str, content: str) -> bytes:
+        """Line ranges copied from ``base`` and literal text in between, compressed."""
+        import difflib
+        base_lines = base.splitlines(keepends=True)
+        lines = content.splitlines(keepends=True)
+        ops: List[Any] = []
+        matcher = difflib.SequenceMatcher(None, base_lines, lines)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([i1, i2])
+            elif j2 > j1:
+                ops.append("".join(lines[j1:j2]))
+        return zlib.compress(json.dumps(ops, ensure_ascii=False).encode("utf-8"),
+                             BLOB_COMPRESSION_LEVEL)
+
+    def _delta_base(self, digest: str) -> Optional[str]:
+        """The base a blob is stored against, or None for a whole blob."""
+        with open(self._path(digest), "rb") as f:
+            head = f.read(len(DELTA_MAGIC) + 64)
+        if not head.startswith(DELTA_MAGIC):
+            return None
+        return head[len(DELTA_MAGIC):].split(b"\n", 1)[0].decode("ascii")
+
+    def _read_delta(self, data: bytes) -> str:
+        header, delta = data[len(DELTA_MAGIC):].split(b"\n", 1)
+        base_lines = self.get(header.decode("ascii")).splitlines(keepends=True)
+        parts = []
+        for op in json.loads(zlib.decompress(delta)):
+            parts.append(op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]]))
+        return "".join(parts)
+
+    def get(self, digest: str, max_chars: Optional[int] = None) -> str:
+        """Return a blob's text, or only its first ``max_chars`` characters."""
+        with open(self._path(digest), "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(DELTA_MAGIC)] == DELTA_MAGIC:
+                text = self._read_delta(data[:])
+                return text if max_chars is None else text[:max_chars]
+            if max_chars is None:
+                return zlib.decompress(data).decode("utf-8")
+            # UTF-8 needs at most 4 bytes per character
+            prefix = zlib.decompressobj().decompress(data, max_chars * 4)
+            return prefix.decode("utf-8", errors="ignore")[:max_chars]
+
+    def size(self, digest: str) -> int:
+        """Uncompressed size of a blob in bytes, without holding it all in memory."""
+        decompressor = zlib.decompressobj()
+        total = 0
+        with open(self._path(digest), "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(DELTA_MAGIC)] == DELTA_MAGIC:
+                return len(self._read_delta(data[:]).encode("utf-8"))
+            for start in range(0, len(data), IMPORT_READ_SIZE):
+                total += len(decompressor.decompress(data[start:start + IMPORT_READ_SIZE]))
+        return total + len(decompressor.flush())
+
+    def delete(self, digest: str) -> None:
+        path = self._path(digest)
+        deps = path + DELTA_DEPS_SUFFIX
+        try:
+            base = self._delta_base(digest)
+        except OSError:
+            return
+        if base is None and not os.path.isdir(deps):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return
+        with self._lock():
+            if os.path.isdir(deps):
+                for dependent in os.listdir(deps):
+                    # Variants stored against this blob are rewritten whole first
+                    if os.path.exists(self._path(dependent)):
+                        try:
+                            content = self.get(dependent)
+                            self._write(dependent, zlib.compress(content.encode("utf-8"),
+                                                                 BLOB_COMPRESSION_LEVEL))
+                        except (OSError, ValueError, zlib.error) as e:
+                            print(f"Warning: Could not rewrite blob {dependent}: {e}")
+                    os.remove(os.path.join(deps, dependent))
+                with contextlib.suppress(OSError):
+                    os.rmdir(deps)
+            if base is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self._path(base) + DELTA_DEPS_SUFFIX, digest))
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ContentCache:
+    """Recently read blob bodies by content hash, least recently used out first.
+
+    Bounded by the memory the strings take rather than by their number, so a
+    few huge clips cannot crowd out the budget.
+    """
+
+    def __init__(self, max_bytes: int = CONTENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._bodies: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            content = self._bodies.get(digest)
+            if content is not None:
+                self._bodies.move_to_end(digest)
+        metrics.incr("content_cache.hits" if content is not None else "content_cache.misses")
+        return content
+
+    def put(self, digest: str, content: str) -> None:
+        cost = sys.getsizeof(content)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._bodies.pop(digest, None)
+            if previous is not None:
+                self.size -= sys.getsizeof(previous)
+            self._bodies[digest] = content
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self.size -= sys.getsizeof(evicted)
+
+    def discard(self, digest: str) -> None:
+        with self._lock:
+            content = self._bodies.pop(digest, None)
+            if content is not None:
+                self.size -= sys.getsizeof(content)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bodies.clear()
+            self.size = 0
+
+
+class RetentionPolicy:
+    """Limits on the unpinned history; pinned items are never evicted.
+
+    ``size_tiers`` is a list of ``(min_bytes, max_age)`` pairs, so e.g.
+    ``[(1_000_000, 86400)]`` keeps clips of 1 MB and over for a day only.
+    ``secret_max_age`` applies to clips tagged ``SECRET_TAG``.
+    """
+
+    def __init__(self, max_items: int = MAX_ITEMS, max_bytes: Optional[int] = RETENTION_MAX_BYTES,
+                 max_age: Optional[float] = RETENTION_MAX_AGE,
+                 size_tiers: Iterable[Tuple[int, float]] = RETENTION_SIZE_TIERS,
+                 secret_max_age: Optional[float] = RETENTION_SECRET_MAX_AGE):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.size_tiers = sorted(size_tiers)
+        self.secret_max_age = secret_max_age
+
+    def max_age_for(self, size: int, secret: bool = False) -> Optional[float]:
+        ages = [age for min_size, age in self.size_tiers if size >= min_size]
+        if self.max_age is not None:
+            ages.append(self.max_age)
+        if secret and self.secret_max_age is not None:
+            ages.append(self.secret_max_age)
+        return min(ages) if ages else None
+
+    def admits(self, size: int) -> bool:
+        """Whether a clip of ``size`` bytes may be kept at all."""
+        max_age = self.max_age_for(size)
+        return ((self.max_bytes is None or size <= self.max_bytes)
+                and (max_age is None or max_age > 0))
+
+
+class RetentionIndex:
+    """Eviction order for unpinned items under a RetentionPolicy.
+
+    Two heaps hold ``(timestamp, id)`` oldest first and ``(expires_at,
+    timestamp, id)`` soonest first. Removals, pins and touches only update
+    ``_live`` and leave a stale heap entry behind that is skipped when it
+    surfaces, so every operation is O(log n); the heaps are rebuilt once
+    stale entries outnumber live ones.
+    """
+
+    def __init__(self, policy: RetentionPolicy):
+        self.policy = policy
+        # id -> (timestamp, size in bytes, whether it is a secret)
+        self._live: Dict[int, Tuple[float, int, bool]] = {}
+        self._by_age: List[Tuple[float, int]] = []
+        self._expiry: List[Tuple[float, float, int]] = []
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._live
+
+    def add(self, item_id: int, timestamp: float, size: int, secret: bool = False) -> None:
+        current = self._live.get(item_id)
+        if current == (timestamp, size, secret):
+            return
+        if current is not None:
+            self.total_bytes -= current[1]
+        self._live[item_id] = (timestamp, size, secret)
+        self.total_bytes += size
+        heapq.heappush(self._by_age, (timestamp, item_id))
+        max_age = self.policy.max_age_for(size, secret)
+        if max_age is not None:
+            heapq.heappush(self._expiry, (timestamp + max_age, timestamp, item_id))
+        if len(self._by_age) > 2 * len(self._live) + 64:
+            self._rebuild()
+
+    def touch(self, item_id: int, timestamp: float) -> None:
+        current = self._live.get(item_id)
+        if current is not None:
+            self.add(item_id, timestamp, current[1], current[2])
+
+    def discard(self, item_id: int) -> None:
+        current = self._live.pop(item_id, None)
+        if current is not None:
+            self.total_bytes -= current[1]
+
+    def clear(self) -> None:
+        self._live.clear()
+        self._by_age = []
+        self._expiry = []
+        self.total_bytes = 0
+
+    def _rebuild(self) -> None:
+        self._by_age = [(timestamp, item_id) for item_id, (timestamp, _, _) in self._live.items()]
+        heapq.heapify(self._by_age)
+        self._expiry = []
+        for item_id, (timestamp, size, secret) in self._live.items():
+            max_age = self.policy.max_age_for(size, secret)
+            if max_age is not None:
+                self._expiry.append((timestamp + max_age, timestamp, item_id))
+        heapq.heapify(self._expiry)
+
+    def _is_live(self, timestamp: float, item_id: int) -> bool:
+        current = self._live.get(item_id)
+        return current is not None and current[0] == timestamp
+
+    def _expires(self, expires_at: float, timestamp: float, item_id: int) -> bool:
+        """Whether an expiry heap entry still holds, e.g. the item was not untagged as a secret."""
+        current = self._live.get(item_id)
+        if current is None or current[0] != timestamp:
+            return False
+        max_age = self.policy.max_age_for(current[1], current[2])
+        return max_age is not None and timestamp + max_age == expires_at
+
+    def evict(self, now: float) -> List[int]:
+        """Drop and return the ids the policy no longer allows, oldest first."""
+        victims = []
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, timestamp, item_id = heapq.heappop(self._expiry)
+            if self._expires(expires_at, timestamp, item_id):
+                victims.append(item_id)
+                self.discard(item_id)
+        max_bytes = self.policy.max_bytes
+        while self._by_age and (len(self._live) > self.policy.max_items
+                                or (max_bytes is not None and self.total_bytes > max_bytes)):
+            timestamp, item_id = heapq.heappop(self._by_age)
+            if self._is_live(timestamp, item_id):
+                victims.append(item_id)
+                self.discard(item_id)
+        return victims
+
+    def next_expiry(self) -> Optional[float]:
+        while self._expiry and not self._expires(*self._expiry[0]):
+            heapq.heappop(self._expiry)
+        return self._expiry[0][0] if self._expiry else None
+
+
+_SIZE_UNITS = {"": 1, "k": 1000, "m": 1000 ** 2, "g": 1000 ** 3}
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def _parse_with_unit(text: str, units: Dict[str, int]) -> float:
+    unit = text[-1:] if text[-1:].isalpha() else ""
+    if unit not in units:
+        raise ValueError(f"Unknown unit in {text!r}")
+    return float(text[:len(text) - len(unit)]) * units[unit]
+
+
+def parse_size(text: str) -> int:
+    """``"500k"``, ``"10MB"`` or a plain byte count."""
+    text = text.strip().lower()
+    return int(_parse_with_unit(text[:-1] if text.endswith("b") else text, _SIZE_UNITS))
+
+
+def parse_duration(text: str) -> float:
+    """``"90s"``, ``"12h"``, ``"7d"``, ``"2w"`` or plain seconds."""
+    return _parse_with_unit(text.strip().lower(), _DURATION_UNITS)
+
+
+def parse_size_tier(text: str) -> Tuple[int, float]:
+    """``"MIN_SIZE:MAX_AGE"``, e.g. ``"1M:1d"``."""
+    size, _, age = text.partition(":")
+    if not age:
+        raise ValueError(f"Expected MIN_SIZE:MAX_AGE, got {text!r}")
+    return parse_size(size), parse_duration(age)
+
+
+class ImportReport(NamedTuple):
+    read: int
+    imported: int
+    duplicates: int
+    skipped: int
+    evicted: int
+    seconds: float
+
+    def describe(self, source_bytes: Optional[int] = None) -> str:
+        rate = self.read / self.seconds if self.seconds else 0.0
+        text = (f"Imported {self.imported:,} of {self.read:,} clips "
+                f"({self.duplicates:,} duplicates, {self.skipped:,} skipped, "
+                f"{self.evicted:,} dropped by retention) in {self.seconds:.2f}s, "
+                f"{rate:,.0f} clips/s")
+        if source_bytes and self.seconds:
+            text += f", {source_bytes / self.seconds / 1e6:.1f} MB/s"
+        return text
+
+
+class ClipboardManager:    
+    is_remote = False
+
+    def __init__(self, history_file: str = HISTORY_FILE, max_items: int = MAX_ITEMS,
+                 storage: Optional[HistoryStorage] = None, blob_store: Optional[BlobStore] = None,
+                 retention: Optional[RetentionPolicy] = None,
+                 memory_budget: Optional[int] = None, group_similar: bool = True,
+                 delta_variants: bool = False):
+        self.history_file = history_file
+        self.retention = retention or RetentionPolicy(max_items)
+        self.storage = storage if storage is not None else JournalHistoryStorage(history_file)
+        self.blob_store = blob_store or BlobStore(
+            os.path.join(os.path.dirname(os.path.abspath(history_file)), BLOB_DIR)
+        )
+        self.last_copied = ""
+        self.current_id = 1
+        # A SyncClient replicating this history to other machines, once started
+        self.replicator: Optional["SyncClient"] = None
+        # A ClassificationPipeline new clips pass through before they are stored, once started
+        self.classifier: Optional["ClassificationPipeline"] = None
+        self._lock = threading.RLock()
+        # Guards last_copied alone, so capture never waits on a store in progress
+        self._capture_lock = threading.Lock()
+        # Under a budget, search indexes less of each clip, and bodies held in
+        # memory by the storage go to the blob store sooner
+        self.memory_budget = memory_budget
+        self._index = TrigramIndex(self._search_text, INDEX_TEXT_LIMIT if memory_budget is None
+                                   else BUDGET_INDEX_TEXT_LIMIT)
+        self.blob_threshold = BLOB_THRESHOLD
+        if memory_budget is not None and self.storage.resident_bodies:
+            self.blob_threshold = BUDGET_BLOB_THRESHOLD
+        self.content_cache = ContentCache(CONTENT_CACHE_BYTES if memory_budget is None
+                                          else int(memory_budget * BUDGET_CACHE_SHARE))
+        # Groups near-duplicate clips; with delta_variants, a blob-stored clip is
+        # stored as a delta against its group's base when that saves enough
+        self._similar = None
+        if group_similar:
+            self._similar = SimilarityIndex(self._search_text, bucket_bits=SIMILAR_BUCKET_BITS
+                                            if memory_budget is None else BUDGET_SIMILAR_BUCKET_BITS)
+        self.delta_variants = delta_variants and group_similar
+        self._listeners: List[Callable[[ChangeEvent], None]] = []
+        # Content hash -> item id, and the reverse for removals
+        self._hash_index: Dict[str, int] = {}
+        self._item_hashes: Dict[int, str] = {}
+        # Tag -> ids of the items carrying it, and the reverse for removals
+        self._tag_index: Dict[str, Set[int]] = {}
+        self._item_tags: Dict[int, Tuple[str, ...]] = {}
+        self._retention_index = RetentionIndex(self.retention)
+        # Imported clips not yet in the search and similarity indexes; indexed on first use
+        self._unindexed: Set[int] = set()
+        # Blobs records no longer reference, with the ticket of the write that has to be
+        # on disk before they go (None if nothing does)
+        self._dropped_blobs: List[Tuple[Optional[WriteTicket], List[str]]] = []
+        self._load_indexes()
+        self._load_current_id()
+        if self.blob_threshold < BLOB_THRESHOLD:
+            self._spill_bodies()
+        # Changes other processes make to the same history arrive on a watcher thread
+        self.storage.watch(self._apply_external)
+
+    def _load_indexes(self) -> None:
+        self._index.clear()
+        self._hash_index.clear()
+        self._item_hashes.clear()
+        self._tag_index.clear()
+        self._item_tags.clear()
+        self._retention_index.clear()
+        self._unindexed.clear()
+        if self._similar is not None:
+            self._similar.clear()
+        # In id order, so each group's base is its earliest clip, as when clips arrive live
+        items = sorted(self.storage.load_history(), key=lambda item: item["id"])
+        for item in items:
+            self._track_hash(item)
+            self._track_tags(item["id"], tuple(item.get("tags") or ()))
+            if not item.get("pinned", False):
+                self._retain(item)
+        self._index_items(items)
+
+    def _index_items(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Add items, in id order, to the search and similarity indexes."""
+        def texts() -> Iterator[Tuple[int, str]]:
+            for item in items:
+                text = self._index_text(item)
+                if self._similar is not None:
+                    self._similar.add(item["id"], text.lower())
+                yield item["id"], text
+        self._index.add_many(texts())
+
+    def _index_pending(self) -> None:
+        """Index the clips a bulk import left out; called with the lock held before a query."""
+        if not self._unindexed:
+            return
+        with metrics.timer("index.pending"):
+            items = (self.storage.get_item(item_id) for item_id in sorted(self._unindexed))
+            self._index_items(item for item in items if item is not None)
+        self._unindexed.clear()
+        if self._similar is not None:
+            self._notify([ChangeEvent(EVENT_REGROUPED)])
+
+    @property
+    def max_items(self) -> int:
+        return self.retention.max_items
+
+    @max_items.setter
+    def max_items(self, value: int) -> None:
+        self.retention.max_items = value
+    
+    def _load_current_id(self) -> None:
+        self.current_id = self.storage.max_id() + 1
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _track_hash(self, item: Dict[str, Any]) -> None:
+        digest = item.get("hash")
+        if not digest:
+            # Items saved before hashes were recorded
+            digest = item["hash"] = self.content_hash(item.get("content", ""))
+        self._hash_index[digest] = item["id"]
+        self._item_hashes[item["id"]] = digest
+
+    def _untrack_hash(self, item_id: int) -> None:
+        digest = self._item_hashes.pop(item_id, None)
+        if digest is not None and self._hash_index.get(digest) == item_id:
+            del self._hash_index[digest]
+
+    def _track_tags(self, item_id: int, tags: Tuple[str, ...]) -> None:
+        """Point the tag index at ``tags`` as the item's current tags."""
+        for tag in self._item_tags.pop(item_id, ()):
+            tagged = self._tag_index.get(tag)
+            if tagged is not None:
+                tagged.discard(item_id)
+                if not tagged:
+                    del self._tag_index[tag]
+        if tags:
+            self._item_tags[item_id] = tags
+            for tag in tags:
+                self._tag_index.setdefault(tag, set()).add(item_id)
+
+    def _retain(self, item: Dict[str, Any]) -> None:
+        """Put an unpinned item under the retention policy."""
+        self._retention_index.add(item["id"], item.get("timestamp", 0), self._item_size(item),
+                                  SECRET_TAG in (item.get("tags") or ()))
+
+    def _item_size(self, item: Dict[str, Any]) -> int:
+        if item.get("size") is not None:
+            return int(item["size"])
+        # Items saved before sizes were recorded
+        if "content" in item:
+            return len(item["content"].encode("utf-8"))
+        try:
+            return self.blob_store.size(item["hash"])
+        except (OSError, ValueError, zlib.error):
+            return 0
+
+    def _index_text(self, item: Dict[str, Any]) -> str:
+        """Text the search index sees: large clips are indexed by their head only."""
+        if "content" in item:
+            return str(item["content"][:self._index.max_chars])
+        cached = self.content_cache.get(item["hash"])
+        if cached is not None:
+            return cached[:self._index.max_chars]
+        try:
+            return self.blob_store.get(item["hash"], max_chars=self._index.max_chars)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Warning: Could not read blob for item {item.get('id')}: {e}")
+            return str(item.get("preview", ""))
+
+    def _search_text(self, item_id: int) -> Optional[str]:
+        """An item's text as the search and similarity indexes see it, lowercased."""
+        item = self.storage.get_item(item_id)
+        return self._index_text(item).lower() if item is not None else None
+
+    def get_content(self, item_id: int) -> Optional[str]:
+        """Full content of an item, loading it from the blob store if needed."""
+        item = self.storage.get_item(item_id)
+        if item is None:
+            return None
+        return self._item_content(item)
+
+    def _item_content(self, item: Dict[str, Any]) -> Optional[str]:
+        if "content" in item:
+            return str(item["content"])
+        content = self.content_cache.get(item["hash"])
+        if content is not None:
+            return content
+        try:
+            content = self.blob_store.get(item["hash"])
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Warning: Could not read blob for item {item.get('id')}: {e}")
+            return None
+        self.content_cache.put(item["hash"], content)
+        return content
+
+    def _spill_bodies(self) -> None:
+        """Move inline bodies over the blob threshold to the blob store, e.g. once a budget is set."""
+        with self._lock:
+            records = []
+            for item in self.storage.load_history():
+                content = item.get("content")
+                if content is not None and len(content) > self.blob_threshold:
+                    self.blob_store.put(item["hash"], content)
+                    records.append({"op": "spill", "id": item["id"]})
+            if records:
+                self.storage.apply(records)
+                metrics.incr("memory.spilled", len(records))
+
+    def _delta_base(self, content: str) -> Optional[Tuple[str, str]]:
+        """Digest and content of the blob-stored clip a new body could be a delta against."""
+        if not self.delta_variants or self._similar is None:
+            return None
+        with self._lock:
+            self._index_pending()
+            base_id = self._similar.match(content[:self._index.max_chars].lower())
+            base = self.storage.get_item(base_id) if base_id is not None else None
+        if base is None or not base.get("blob"):
+            return None
+        base_content = self._item_content(base)
+        return (base["hash"], base_content) if base_content is not None else None
+
+    def similar_groups(self) -> Dict[int, int]:
+        """Item id -> group key for every item that has near-duplicates in the history."""
+        with self._lock:
+            self._index_pending()
+            return self._similar.groups() if self._similar is not None else {}
+
+    def similar_items(self, item_id: int) -> List[Dict[str, Any]]:
+        """The item and its near-duplicates, the group's base first, then newest first."""
+        with self._lock:
+            self._index_pending()
+            ids = self._similar.members(item_id) if self._similar is not None else [item_id]
+        items = [self.storage.get_item(member) for member in ids]
+        return [item for item in items if item is not None]
+
+    def trim_memory(self) -> None:
+        """Drop cached clip bodies and hand freed memory back to the OS."""
+        self.content_cache.clear()
+        release_memory()
+
+    def find_by_content(self, content: str) -> Optional[int]:
+        with self._lock:
+            return self._hash_index.get(self.content_hash(content))
+    
+    def load_history(self, pinned: Optional[bool] = None,
+                     tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        with metrics.timer("history.load"):
+            if tag is None:
+                return self.storage.load_history(pinned)
+            with self._lock:
+                ids = list(self._tag_index.get(tag, ()))
+            found = [self.storage.get_item(item_id) for item_id in ids]
+            items = [item for item in found
+                     if item is not None and (pinned is None or item["pinned"] == pinned)]
+            items.sort(key=_history_sort_key)
+            return items
+
+    def tag_counts(self) -> Dict[str, int]:
+        """Every tag in use and how many items carry it."""
+        with self._lock:
+            return {tag: len(ids) for tag, ids in self._tag_index.items()}
+
+    def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        return self.storage.get_item(item_id)
+
+    def count(self, pinned: Optional[bool] = None) -> int:
+        return self.storage.count(pinned)
+
+    def search(self, query: str, limit: int = 100, mode: str = "substring",
+               cancelled: Optional[threading.Event] = None,
+               tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Items matching ``query``; with ``tag``, only items carrying it (all of them if no query)."""
+        if tag is not None and not query.strip():
+            return self.load_history(tag=tag)[:limit]
+        with self._lock:
+            self._index_pending()
+            allowed = set(self._tag_index.get(tag, ())) if tag is not None else None
+            ids = self._index.query(query, mode=mode, limit=limit, cancelled=cancelled,
+                                    allowed=allowed)
+        items = [self.storage.get_item(item_id) for item_id in ids]
+        return [item for item in items if item is not None]
+
+    def add_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        """Register a callback for change events.
+
+        Callbacks run on whichever thread made the change and must not block.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _apply(self, records: List[Dict[str, Any]], index_texts: Optional[Dict[int, str]] = None,
+               replicate: bool = True, defer_index: bool = False) -> None:
+        with self._lock:
+            removed = []
+            # What removed items were indexed by, so their postings go with them
+            removed_texts = {}
+            for record in records:
+                if record.get("op") == "remove":
+                    item = self.storage.get_item(record.get("id", 0))
+                    if item is not None:
+                        removed.append(item)
+                        if item["id"] not in self._unindexed:
+                            removed_texts[item["id"]] = self._index_text(item)
+                elif record.get("op") == "clear":
+                    removed.extend(self.storage.load_history())
+            ticket = self.storage.apply(records)
+            events = self._index_records(records, index_texts, removed_texts, defer_index)
+            if replicate and self.replicator is not None:
+                self.replicator.record(records, removed)
+            self._drop_blobs([item["hash"] for item in removed if item.get("blob")], ticket)
+        self._notify(events)
+
+    def _drop_blobs(self, digests: List[str], ticket: Optional[WriteTicket] = None) -> None:
+        """Queue blobs for deletion and delete those whose records are on disk.
+
+        A blob only goes once the write that stops referencing it is done, so
+        a crash before then never leaves a stored clip without its body. Those
+        still waiting are deleted by a later call, or on close. Called with the
+        lock held.
+        """
+        if digests:
+            self._dropped_blobs.append((ticket, digests))
+            for digest in digests:
+                self.content_cache.discard(digest)
+        ready: List[str] = []
+        waiting: List[Tuple[Optional[WriteTicket], List[str]]] = []
+        for pending, dropped in self._dropped_blobs:
+            if pending is not None and not pending.done():
+                waiting.append((pending, dropped))
+            elif pending is None or not pending.failed:
+                # After a failed write the old records may still be live, so their blobs stay
+                ready.extend(dropped)
+        self._dropped_blobs = waiting
+        held = {digest for _, dropped in waiting for digest in dropped}
+        for digest in ready:
+            # Re-added content shares the blob of the clip it replaced
+            if digest not in held and digest not in self._hash_index:
+                self.blob_store.delete(digest)
+
+    def _apply_external(self, records: List[Dict[str, Any]]) -> None:
+        """Index and publish records another process applied to the shared history.
+
+        That process already stored them and deleted any blobs they dropped.
+        """
+        with self._lock:
+            if any(record.get("op") == "reload" for record in records):
+                self._load_indexes()
+                events = [ChangeEvent(EVENT_RELOADED)]
+            else:
+                events = self._index_records(records)
+        metrics.incr("history.external_records", len(records))
+        self._notify(events)
+
+    def _index_records(self, records: List[Dict[str, Any]],
+                       index_texts: Optional[Dict[int, str]] = None,
+                       removed_texts: Optional[Dict[int, str]] = None,
+                       defer_index: bool = False) -> List[ChangeEvent]:
+        """Bring the search, hash and retention indexes up to date; returns the events.
+
+        With ``defer_index``, added items go into the search and similarity
+        indexes only when they are next queried.
+        """
+        events = []
+        for record in records:
+            op, item_id = record.get("op"), record.get("id", 0)
+            if op == "add":
+                item_id = record["item"]["id"]
+                group = None
+                if defer_index:
+                    self._unindexed.add(item_id)
+                else:
+                    if index_texts and item_id in index_texts:
+                        text = index_texts[item_id][:self._index.max_chars]
+                    else:
+                        text = self._index_text(record["item"])
+                    self._index.add(item_id, text)
+                    if self._similar is not None and self._similar.add(item_id, text.lower()):
+                        group = self._similar.group_of(item_id)
+                self._track_hash(record["item"])
+                # Listeners keep the compact form, sharing the content string
+                added = ClipRecord.from_dict(record["item"])
+                self._track_tags(item_id, added.tags)
+                if not added.pinned:
+                    self._retain(record["item"])
+                events.append(ChangeEvent(EVENT_ADDED, item_id, cast(Dict[str, Any], added), group))
+            elif op == "touch":
+                self._retention_index.touch(item_id, record["timestamp"])
+                item = self.storage.get_item(item_id)
+                if item is not None:
+                    events.append(ChangeEvent(EVENT_MOVED, item["id"], item))
+            elif op == "remove":
+                if item_id in self._unindexed:
+                    self._unindexed.discard(item_id)
+                else:
+                    if self._similar is not None:
+                        self._similar.remove(item_id)
+                    self._index.remove(item_id, (removed_texts or {}).get(item_id))
+                self._untrack_hash(item_id)
+                self._track_tags(item_id, ())
+                self._retention_index.discard(item_id)
+                events.append(ChangeEvent(EVENT_REMOVED, item_id))
+            elif op in ("tag", "untag"):
+                item = self.storage.get_item(item_id)
+                if item is not None:
+                    self._track_tags(item["id"], tuple(item.get("tags") or ()))
+                    if item["id"] in self._retention_index:
+                        # Tagging or untagging a secret changes when it expires
+                        self._retain(item)
+                    events.append(ChangeEvent(EVENT_TAGGED, item["id"], item))
+            elif op in ("pin", "unpin"):
+                item = self.storage.get_item(item_id)
+                if op == "pin":
+                    self._retention_index.discard(item_id)
+                elif item is not None:
+                    self._retain(item)
+                if item is not None:
+                    kind = EVENT_PINNED if op == "pin" else EVENT_UNPINNED
+                    events.append(ChangeEvent(kind, item["id"], item))
+            elif op == "clear":
+                self._index.clear()
+                self._unindexed.clear()
+                if self._similar is not None:
+                    self._similar.clear()
+                self._hash_index.clear()
+                self._item_hashes.clear()
+                self._tag_index.clear()
+                self._item_tags.clear()
+                self._retention_index.clear()
+                events.append(ChangeEvent(EVENT_CLEARED))
+        return events
+
+    def _notify(self, events: List[ChangeEvent]) -> None:
+        for event in events:
+            for callback in list(self._listeners):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Change listener error: {e}")
+
+    def close(self) -> None:
+        if self.classifier is not None:
+            # Stores whatever is still being classified
+            self.classifier.stop()
+        if self.replicator is not None:
+            self.replicator.stop()
+        self.storage.close()
+        with self._lock:
+            # Every queued write is done now
+            self._drop_blobs([])
+
+    def add_clipboard_item(self, item_content: str) -> bool:
+        if not item_content or len(item_content.strip()) == 0:
+            return False
+        
+        if len(item_content) > MAX_CONTENT_LENGTH:
+            return False 
+        with metrics.timer("dedup.check"):
+            digest = self.content_hash(item_content)
+        # last_copied is shared by the monitor and Tk threads
+        with self._capture_lock:
+            if self.last_copied == item_content:
+                return False
+            self.last_copied = item_content
+            classifier = self.classifier
+        if classifier is None:
+            return self._store_clip(item_content, digest)
+        # Stored by the pipeline once classified, so capture never waits on the scan
+        classifier.submit(item_content, digest)
+        return True
+
+    def _store_clip(self, item_content: str, digest: str, tags: Iterable[str] = ()) -> bool:
+        """Store a captured clip, or move an existing copy of it to the top."""
+        with self._lock:
+            existing_id = self._hash_index.get(digest)
+            if existing_id is not None:
+                metrics.incr("dedup.hits")
+                # Re-copied content moves its existing entry to the top
+                now = time.time()
+                self._apply([{
+                    "op": "touch",
+                    "id": existing_id,
+                    "timestamp": now,
+                    "formatted_time": _format_time(int(now)),
+                }])
+                return True
+            
+            self.current_id = self.storage.allocate_id()
+            entry = self._new_entry(self.current_id, item_content, digest)
+            tags = normalize_tags(tags)
+            if tags:
+                entry["tags"] = tags
+            if not self.retention.admits(entry["size"]):
+                print(f"Warning: Clip of {entry['size']:,} bytes exceeds the retention policy")
+                return False
+            try:
+                self._store_body(entry)
+            except (IOError, OSError) as e:
+                print(f"Error: Could not store clip body: {e}")
+                return False
+            # The new clip is the newest, so it is never among the evicted
+            self._retain(entry)
+            evicted = self._retention_index.evict(entry["timestamp"])
+            metrics.incr("clips.added")
+            metrics.incr("retention.evicted", len(evicted))
+            records: List[Dict[str, Any]] = [{"op": "add", "item": entry}]
+            # Retention is per machine, so evictions are marked to keep them out of sync
+            records.extend({"op": "remove", "id": evicted_id, "evicted": True}
+                           for evicted_id in evicted)
+            # Index from the text in hand rather than re-reading a fresh blob
+            self._apply(records, index_texts={entry["id"]: item_content[:self._index.max_chars]})
+            return True
+
+    @staticmethod
+    def _new_entry(item_id: int, content: str, digest: str, timestamp: Optional[float] = None,
+                   pinned: bool = False) -> Dict[str, Any]:
+        timestamp = time.time() if timestamp is None else timestamp
+        return {
+            "id": item_id,
+            "hash": digest,
+            "content": content,
+            "preview": _make_preview(content),
+            "timestamp": timestamp,
+            "formatted_time": _format_time(int(timestamp)),
+            "pinned": pinned,
+            "size": len(content.encode("utf-8"))
+        }
+
+    def _store_body(self, entry: Dict[str, Any]) -> None:
+        """Move a large body out to the blob store, leaving a reference behind."""
+        if len(entry["content"]) > self.blob_threshold:
+            self.blob_store.put(entry["hash"], entry["content"], self._delta_base(entry["content"]))
+            del entry["content"]
+            entry["blob"] = True
+
+    def import_clips(self, clips: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH,
+                     progress: Optional[Callable[[ImportReport], None]] = None) -> ImportReport:
+        """Bulk-add a stream of ``{"content", "timestamp", "pinned"}`` clips.
+
+        Clips already in the history or seen earlier in the batch are skipped.
+        The retention policy is applied per batch: clips it would evict
+        straight away are dropped before anything is written, and existing
+        items they push out are removed in the same ``storage.apply`` call, so
+        each batch is a single journal write or transaction. Imported clips
+        are added to the search and similarity indexes in one pass when they
+        are next searched or grouped.
+        """
+        start = time.perf_counter()
+        counts = {"read": 0, "imported": 0, "duplicates": 0, "skipped": 0, "evicted": 0}
+        batch: List[Tuple[str, str, Optional[float], bool]] = []
+        batch_hashes: Set[str] = set()
+        # Ids added by this import, so later batches that push them out count as evictions
+        imported_ids: Set[int] = set()
+
+        def report() -> ImportReport:
+            return ImportReport(seconds=time.perf_counter() - start, **counts)
+
+        for clip in clips:
+            counts["read"] += 1
+            content = clip.get("content")
+            if not isinstance(content, str) or not content.strip() or len(content) > MAX_CONTENT_LENGTH:
+                counts["skipped"] += 1
+                continue
+            digest = self.content_hash(content)
+            if digest in batch_hashes or digest in self._hash_index:
+                counts["duplicates"] += 1
+                continue
+            batch_hashes.add(digest)
+            batch.append((content, digest, clip.get("timestamp"), bool(clip.get("pinned"))))
+            if len(batch) >= batch_size:
+                self._import_batch(batch, counts, imported_ids)
+                batch, batch_hashes = [], set()
+                if progress is not None:
+                    progress(report())
+        if batch:
+            self._import_batch(batch, counts, imported_ids)
+        metrics.incr("clips.imported", counts["imported"])
+        return report()
+
+    def _import_batch(self, batch: List[Tuple[str, str, Optional[float], bool]],
+                      counts: Dict[str, int], imported_ids: Set[int]) -> None:
+        with self._lock:
+            now = time.time()
+            entries = {}
+            for content, digest, timestamp, pinned in batch:
+                self.current_id = self.storage.allocate_id()
+                entries[self.current_id] = self._new_entry(
+                    self.current_id, content, digest, now if timestamp is None else timestamp, pinned
+                )
+            records = []
+            for item_id, entry in entries.items():
+                if not entry["pinned"]:
+                    self._retention_index.add(item_id, entry["timestamp"], entry["size"])
+            for item_id in self._retention_index.evict(now):
+                if entries.pop(item_id, None) is not None:
+                    counts["evicted"] += 1
+                    continue
+                records.append({"op": "remove", "id": item_id, "evicted": True})
+                if item_id in imported_ids:
+                    imported_ids.discard(item_id)
+                    counts["imported"] -= 1
+                    counts["evicted"] += 1
+            for item_id, entry in entries.items():
+                try:
+                    self._store_body(entry)
+                except (IOError, OSError) as e:
+                    print(f"Error: Could not store clip body: {e}")
+                    self._retention_index.discard(item_id)
+                    counts["skipped"] += 1
+                    continue
+                records.append({"op": "add", "item": entry})
+                imported_ids.add(item_id)
+                counts["imported"] += 1
+            if records:
+                # Searching and grouping index the batch on first use, not per clip here
+                self._apply(records, defer_index=True)
+
+    def enforce_retention(self) -> int:
+        """Evict whatever the policy no longer allows, e.g. clips past their age."""
+        with self._lock:
+            evicted = self._retention_index.evict(time.time())
+            if evicted:
+                metrics.incr("retention.evicted", len(evicted))
+                self._apply([{"op": "remove", "id": item_id, "evicted": True}
+                             for item_id in evicted])
+            metrics.gauge("retention.bytes", self._retention_index.total_bytes)
+            return len(evicted)
+
+    def next_expiry(self) -> Optional[float]:
+        with self._lock:
+            return self._retention_index.next_expiry()
+
+    def import_file(self, path: str, fmt: Optional[str] = None,
+                    progress: Optional[Callable[[ImportReport], None]] = None) -> ImportReport:
+        return self.import_clips(iter_import_file(path, fmt), progress=progress)
+
+    def remove_item(self, item_id: int) -> None:
+        self._apply([{"op": "remove", "id": item_id}])
+
+    def _apply_to_ids(self, op: str, item_ids: Iterable[int], **fields: Any) -> int:
+        """Apply one operation to many items as a single storage write."""
+        records = [dict(fields, op=op, id=item_id) for item_id in sorted(set(item_ids))]
+        if records:
+            self._apply(records)
+        return len(records)
+
+    def remove_items(self, item_ids: Iterable[int]) -> int:
+        return self._apply_to_ids("remove", item_ids)
+
+    def pin_items(self, item_ids: Iterable[int]) -> int:
+        return self._apply_to_ids("pin", item_ids)
+
+    def unpin_items(self, item_ids: Iterable[int]) -> int:
+        return self._apply_to_ids("unpin", item_ids)
+
+    def tag_items(self, item_ids: Iterable[int], tags: Iterable[str]) -> int:
+        tags = normalize_tags(tags)
+        return self._apply_to_ids("tag", item_ids, tags=tags) if tags else 0
+
+    def untag_items(self, item_ids: Iterable[int], tags: Iterable[str]) -> int:
+        tags = normalize_tags(tags)
+        return self._apply_to_ids("untag", item_ids, tags=tags) if tags else 0
+
+    def concatenated_content(self, item_ids: Iterable[int], separator: str = "\n") -> str:
+        """The items' contents joined in history order, for copying as one clip."""
+        items = [item for item in (self.storage.get_item(item_id) for item_id in set(item_ids))
+                 if item is not None]
+        items.sort(key=_history_sort_key)
+        contents = (self._item_content(item) for item in items)
+        return separator.join(content for content in contents if content is not None)
+
+    def pin_item(self, item_id: int) -> None:
+        self._apply([{"op": "pin", "id": item_id}])
+
+    def unpin_item(self, item_id: int) -> None:
+        self._apply([{"op": "unpin", "id": item_id}])
+
+    def clear_history(self) -> None:
+        self._apply([{"op": "clear"}])
+
+    def merge_remote(self, changes: List[Dict[str, Any]], replicator: "SyncClient") -> int:
+        """Apply changes pulled from other machines as one write; returns the records applied.
+
+        Clips are matched by uid, or by content for a clip both machines
+        captured. Deletes win over concurrent edits because changes to a
+        missing clip are dropped. Pins are last-writer-wins on their
+        ``(time, node)`` stamp, and touches only ever move a clip forward.
+        """
+        with self._lock:
+            records = []
+            index_texts = {}
+            # Clips added by this batch, by uid and by content hash
+            added: Dict[str, int] = {}
+            added_hashes: Dict[str, int] = {}
+            now = time.time()
+            for change in changes:
+                op, uid = change.get("op"), change.get("uid", "")
+                item_id = added.get(uid) or replicator.local_id(uid)
+                if op == "add":
+                    content = change.get("content")
+                    if item_id is not None or not isinstance(content, str) or not content.strip() \
+                            or len(content) > MAX_CONTENT_LENGTH:
+                        continue
+                    digest = self.content_hash(content)
+                    existing_id = self._hash_index.get(digest) or added_hashes.get(digest)
+                    if existing_id is not None:
+                        replicator.alias(uid, existing_id)
+                        item = self.storage.get_item(existing_id)
+                        if item is not None and change.get("timestamp", 0) > item["timestamp"]:
+                            records.append({"op": "touch", "id": existing_id,
+                                            "timestamp": change["timestamp"],
+                                            "formatted_time": _format_time(int(change["timestamp"]))})
+                        continue
+                    item_id = self.storage.allocate_id()
+                    entry = self._new_entry(item_id, content, digest, change.get("timestamp", now),
+                                            bool(change.get("pinned")))
+                    entry["uid"] = uid
+                    tags = normalize_tags(change.get("tags") or ())
+                    if tags:
+                        entry["tags"] = tags
+                    if not self.retention.admits(entry["size"]):
+                        continue
+                    index_texts[item_id] = content[:self._index.max_chars]
+                    try:
+                        self._store_body(entry)
+                    except (IOError, OSError) as e:
+                        print(f"Error: Could not store clip body: {e}")
+                        continue
+                    if entry["pinned"]:
+                        replicator.newer_pin(item_id, change.get("stamp"))
+                    else:
+                        self._retain(entry)
+                    added[uid] = added_hashes[digest] = item_id
+                    records.append({"op": "add", "item": entry})
+                    continue
+                if item_id is None:
+                    continue
+                item = self.storage.get_item(item_id)
+                if item is None and uid not in added:
+                    continue
+                if op == "remove":
+                    records.append({"op": "remove", "id": item_id})
+                elif op == "touch":
+                    if item is None or change.get("timestamp", 0) > item["timestamp"]:
+                        records.append({"op": "touch", "id": item_id,
+                                        "timestamp": change.get("timestamp", now),
+                                        "formatted_time": _format_time(int(change.get("timestamp", now)))})
+                elif op in ("pin", "unpin"):
+                    if replicator.newer_pin(item_id, change.get("stamp")):
+                        records.append({"op": op, "id": item_id})
+                elif op in ("tag", "untag"):
+                    tags = normalize_tags(change.get("tags") or ())
+                    if tags:
+                        records.append({"op": op, "id": item_id, "tags": tags})
+            dropped = set()
+            for item_id in self._retention_index.evict(now):
+                if item_id in index_texts:
+                    # Pulled clips the policy would evict straight away are never stored
+                    dropped.add(item_id)
+                else:
+                    records.append({"op": "remove", "id": item_id, "evicted": True})
+            dropped_blobs = []
+            if dropped:
+                dropped_blobs = [record["item"]["hash"] for record in records
+                                 if record["op"] == "add" and record["item"]["id"] in dropped
+                                 and record["item"].get("blob")]
+                records = [record for record in records
+                           if record.get("id", record.get("item", {}).get("id")) not in dropped]
+            for uid, item_id in added.items():
+                if item_id not in dropped:
+                    replicator.alias(uid, item_id)
+            if records:
+                self._apply(records, index_texts=index_texts, replicate=False)
+            # Never stored, but the blob may be shared with a removal still on its way to disk
+            self._drop_blobs(dropped_blobs)
+            return len(records)
+
+    def export(self, path: str, fmt: str, selected_ids: Optional[Set[int]] = None,
+               progress: Optional[Callable[[int, int], None]] = None,
+               cancelled: Optional[threading.Event] = None) -> int:
+        """Stream the history (or just ``selected_ids``) to ``path``, item by item.
+
+        Only one item body is held at a time, and blob bodies are read as they
+        are written. The file appears under ``path`` only once complete; a
+        cancelled or failed export leaves nothing behind. Returns the number
+        of items written.
+        """
+        writer_class = EXPORT_WRITERS.get(fmt)
+        if writer_class is None:
+            raise ValueError(f"Unknown export format: {fmt}")
+        total = len(selected_ids) if selected_ids else self.count()
+        part_file = path + ".part"
+        if os.path.exists(part_file):
+            os.remove(part_file)
+        writer = writer_class(part_file)
+        written = 0
+        try:
+            with metrics.timer("history.export"):
+                for item in self.storage.iter_history():
+                    if selected_ids and item["id"] not in selected_ids:
+                        continue
+                    if cancelled is not None and cancelled.is_set():
+                        raise ExportCancelled(path)
+                    exported = {key: value for key, value in item.items() if key != "blob"}
+                    exported["content"] = self._item_content(item) or ""
+                    writer.write_item(exported)
+                    written += 1
+                    if progress is not None and written % EXPORT_PROGRESS_EVERY == 0:
+                        progress(written, total)
+                writer.finish()
+        except BaseException:
+            writer.abort()
+            if os.path.exists(part_file):
+                os.remove(part_file)
+            raise
+        os.replace(part_file, path)
+        metrics.incr("history.items_exported", written)
+        if progress is not None:
+            progress(written, written)
+        return written
+
+    def export_as_txt(self, selected_ids: Optional[Set[int]] = None) -> Optional[str]:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_name = f"clipstack_export_{timestamp}.txt"
+        try:
+            self.export(file_name, "txt", selected_ids)
+            return file_name
+        except IOError as e:
+            print(f"Error exporting to text: {e}")
+            return None
+    
+    def export_as_json(self, selected_ids: Optional[Set[int]] = None) -> Optional[str]:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_name = f"clipstack_export_{timestamp}.json"
+        try:
+            self.export(file_name, "json", selected_ids)
+            return file_name
+        except IOError as e:
+            print(f"Error exporting to JSON: {e}")
+            return None
+
+
+class ExportCancelled(Exception):
+    """Raised out of ClipboardManager.export when its cancel event is set."""
+
+
+class ExportWriter:
+    """Writes exported items to a file one at a time."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write_item(self, item: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> None:
+        """Write any trailer and close the file."""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Close the file without completing it."""
+        raise NotImplementedError
+
+
+class _TextExportWriter(ExportWriter):
+    newline: Optional[str] = None
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = open(path, "w", encoding='utf-8', newline=self.newline)
+
+    def finish(self) -> None:
+        self.file.close()
+
+    def abort(self) -> None:
+        self.file.close()
+
+
+class NdjsonExportWriter(_TextExportWriter):
+    def write_item(self, item: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+class JsonExportWriter(_TextExportWriter):
+    """A JSON array, written element by element."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file.write("[")
+        self._separator = "\n  "
+
+    def write_item(self, item: Dict[str, Any]) -> None:
+        self.file.write(self._separator + json.dumps(item, ensure_ascii=False))
+        self._separator = ",\n  "
+
+    def finish(self) -> None:
+        self.file.write("\n]\n")
+        super().finish()
+
+
+class CsvExportWriter(_TextExportWriter):
+    newline = ""
+    FIELDS = ("id", "formatted_time", "timestamp", "pinned", "content")
+
+    def __init__(self, path: str):
+        import csv
+        super().__init__(path)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.FIELDS)
+
+    def write_item(self, item: Dict[str, Any]) -> None:
+        self.writer.writerow([item.get(field, "") for field in self.FIELDS])
+
+
+class TxtExportWriter(_TextExportWriter):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file.write("ClipStack Export\n")
+        self.file.write("=" * 50 + "\n\n")
+
+    def write_item(self, item: Dict[str, Any]) -> None:
+        self.file.write(f"ID: {item.get('id')}\n")
+        self.file.write(f"Time: {item.get('formatted_time', 'Unknown')}\n")
+        self.file.write(f"Pinned: {'Yes' if item.get('pinned') else 'No'}\n")
+        self.file.write(f"Content:\n{item.get('content', '')}\n")
+        self.file.write("-" * 50 + "\n\n")
+
+
+class SQLiteExportWriter(ExportWriter):
+    """A standalone database with the same ``history`` columns as the SQLite backend."""
+
+    def __init__(self, path: str):
+        import sqlite3
+        super().__init__(path)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE history (id INTEGER PRIMARY KEY, content TEXT NOT NULL, preview TEXT, "
+            "timestamp REAL NOT NULL, formatted_time TEXT, pinned INTEGER NOT NULL DEFAULT 0, "
+            "hash TEXT, blob INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._rows: List[tuple] = []
+
+    def write_item(self, item: Dict[str, Any]) -> None:
+        self._rows.append((item["id"], item.get("content", ""), item.get("preview"),
+                           item.get("timestamp", 0), item.get("formatted_time"),
+                           int(bool(item.get("pinned"))), item.get("hash")))
+        if len(self._rows) >= EXPORT_PAGE_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO history "
+            "(id, content, preview, timestamp, formatted_time, pinned, hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", self._rows
+        )
+        self._rows = []
+
+    def finish(self) -> None:
+        self._flush()
+        self._conn.commit()
+        self._conn.close()
+
+    def abort(self) -> None:
+        self._conn.close()
+
+
+EXPORT_WRITERS = {
+    "ndjson": NdjsonExportWriter,
+    "csv": CsvExportWriter,
+    "txt": TxtExportWriter,
+    "json": JsonExportWriter,
+    "sqlite": SQLiteExportWriter,
+}
+
+EXPORT_EXTENSIONS = {
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".csv": "csv",
+    ".txt": "txt",
+    ".json": "json",
+    ".db": "sqlite",
+    ".sqlite": "sqlite",
+    ".sqlite3": "sqlite",
+}
+
+
+def export_format_for(path: str) -> Optional[str]:
+    return EXPORT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+class ExportJob:
+    """Runs ``export`` on a worker thread; poll ``done``/``total`` and ``finished``."""
+
+    def __init__(self, clipboard_manager: "AnyClipboardManager", path: str, fmt: str,
+                 selected_ids: Optional[Set[int]] = None):
+        self.clipboard_manager = clipboard_manager
+        self.path = path
+        self.format = fmt
+        self.selected_ids = set(selected_ids) if selected_ids else None
+        self.done = 0
+        self.total = len(self.selected_ids) if self.selected_ids else 0
+        self.written: Optional[int] = None
+        self.error: Optional[str] = None
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "ExportJob":
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def _progress(self, done: int, total: int) -> None:
+        self.done, self.total = done, total
+
+    def _run(self) -> None:
+        import sqlite3
+        try:
+            self.written = self.clipboard_manager.export(
+                self.path, self.format, self.selected_ids,
+                progress=self._progress, cancelled=self.cancelled
+            )
+        except ExportCancelled:
+            pass
+        except (IOError, OSError, ValueError, sqlite3.Error, ClipStackError) as e:
+            self.error = str(e)
+        finally:
+            self.finished.set()
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str) and value.strip():
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return datetime.datetime.strptime(value.strip(), "%Y-%m-%d %H:%M:%S").timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _clip_from(value: Any) -> Dict[str, Any]:
+    """Normalise one source record into ``{"content", "timestamp", "pinned"}``.
+
+    Accepts bare strings (e.g. Clipman's JSON list) and objects using
+    ClipStack's field names or the common ``text``/``value`` alternatives.
+    """
+    if isinstance(value, str):
+        return {"content": value}
+    if not isinstance(value, dict):
+        return {}
+    content = next((value[key] for key in ("content", "text", "value")
+                    if isinstance(value.get(key), str)), None)
+    timestamp = _parse_timestamp(value.get("timestamp"))
+    if timestamp is None:
+        timestamp = _parse_timestamp(value.get("formatted_time") or value.get("time"))
+    pinned = value.get("pinned")
+    if isinstance(pinned, str):
+        pinned = pinned.strip().lower() in ("1", "true", "yes")
+    return {"content": content, "timestamp": timestamp, "pinned": bool(pinned)}
+
+
+def _iter_json_array(f: TextIO) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(IMPORT_READ_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array")
+    pos = 1
+    eof = False
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = f.read(IMPORT_READ_SIZE), 0
+            eof = not buffer
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        try:
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The element continues past the end of the buffer
+            more = f.read(IMPORT_READ_SIZE)
+            eof = not more
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield value
+        if pos > IMPORT_READ_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+
+def _iter_txt_export(f: TextIO) -> Iterator[Dict[str, Any]]:
+    """Parse ClipStack's own text export (see TxtExportWriter).
+
+    Content is written as is, so a separator line only ends a clip when a
+    blank line and the next clip's ``ID:`` line, or the end of the file,
+    follow it; otherwise it is part of the content.
+    """
+    separator = "-" * 50
+    clip: Optional[Dict[str, Any]] = None
+    content_lines: Optional[List[str]] = None
+    # A separator met in the content and the blank line after it, until the next line tells
+    held: List[str] = []
+    for line in f:
+        line = line[:-1] if line.endswith("\n") else line
+        if clip is not None and content_lines is not None:
+            if held:
+                if len(held) == 1 and line == "":
+                    held.append(line)
+                    continue
+                if len(held) == 2 and line.startswith("ID: "):
+                    clip["content"] = "\n".join(content_lines)
+                    yield clip
+                    clip, content_lines, held = {}, None, []
+                    continue
+                content_lines.extend(held)
+                held = []
+            if line == separator:
+                held = [line]
+            else:
+                content_lines.append(line)
+        elif line.startswith("ID: "):
+            clip = {}
+        elif clip is not None and line.startswith("Time: "):
+            clip["time"] = line[len("Time: "):]
+        elif clip is not None and line.startswith("Pinned: "):
+            clip["pinned"] = line[len("Pinned: "):] == "Yes"
+        elif clip is not None and line == "Content:":
+            content_lines = []
+    if clip is not None and content_lines is not None and held:
+        clip["content"] = "\n".join(content_lines)
+        yield clip
+
+
+def import_format_for(path: str) -> str:
+    """Guess a source format from the extension, peeking at the file when ambiguous."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".db", ".sqlite", ".sqlite3"):
+        return "sqlite"
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    with open(path, "r", encoding='utf-8', errors="replace") as f:
+        head = f.read(4096)
+    if extension == ".json" or head.lstrip().startswith(("[", "{")):
+        return "json" if head.lstrip().startswith("[") else "ndjson"
+    if head.startswith("ClipStack Export\n"):
+        return "txt"
+    return "lines"
+
+
+def iter_import_file(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream normalised clips out of an export or another manager's history file.
+
+    Formats: ``json`` (an array of objects or strings), ``ndjson``, ``csv``
+    (a ``content`` or ``text`` column), ``txt`` (ClipStack's text export),
+    ``sqlite`` (a ClipStack database or SQLite export) and ``lines`` (one
+    clip per line, e.g. ``cliphist``/``clipman`` dumps).
+    """
+    fmt = fmt or import_format_for(path)
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    if fmt == "sqlite":
+        import sqlite3
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            # Rows whose body lives in a blob store have no content here and are skipped
+            for content, timestamp, pinned in conn.execute(
+                "SELECT content, timestamp, pinned FROM history ORDER BY timestamp, id"
+            ):
+                yield {"content": content, "timestamp": timestamp, "pinned": bool(pinned)}
+        except sqlite3.Error as e:
+            raise ValueError(f"Not a ClipStack database: {e}")
+        finally:
+            conn.close()
+        return
+    newline = "" if fmt == "csv" else None
+    with open(path, "r", encoding='utf-8', newline=newline) as f:
+        if fmt == "json":
+            for value in _iter_json_array(f):
+                yield _clip_from(value)
+        elif fmt == "ndjson":
+            for line in f:
+                if line.strip():
+                    yield _clip_from(json.loads(line))
+        elif fmt == "csv":
+            import csv
+            csv.field_size_limit(max(csv.field_size_limit(), MAX_CONTENT_LENGTH * 4))
+            for row in csv.DictReader(f):
+                yield _clip_from(row)
+        elif fmt == "txt":
+            for clip in _iter_txt_export(f):
+                yield _clip_from(clip)
+        else:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.strip():
+                    yield {"content": line}
+
+
+class SearchWorker:
+    """Runs history queries off the Tk thread.
+
+    Each ``submit`` supersedes the previous query: the worker waits out a
+    short debounce window and drops results for any query that has been
+    replaced in the meantime.
+    """
+
+    def __init__(self, clipboard_manager: "AnyClipboardManager", debounce: float = SEARCH_DEBOUNCE):
+        self.clipboard_manager = clipboard_manager
+        self.debounce = debounce
+        self.results: "queue.Queue[tuple]" = queue.Queue()
+        self._condition = threading.Condition()
+        self._pending: Optional[tuple] = None
+        self._generation = 0
+        self._cancelled = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, mode: str = "substring", tag: Optional[str] = None) -> int:
+        with self._condition:
+            self._generation += 1
+            self._cancelled.set()
+            self._pending = (self._generation, query, mode, tag, time.monotonic())
+            self._condition.notify()
+            return self._generation
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._cancelled.set()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and self._pending is None:
+                    self._condition.wait()
+                if not self._running or self._pending is None:
+                    return
+                generation, query, mode, tag, submitted = self._pending
+                delay = submitted + self.debounce - time.monotonic()
+                if delay > 0:
+                    # Keep waiting in case a newer keystroke replaces this query
+                    self._condition.wait(delay)
+                    continue
+                self._pending = None
+                self._cancelled = cancelled = threading.Event()
+            try:
+                items = self.clipboard_manager.search(query, mode=mode, cancelled=cancelled,
+                                                      tag=tag)
+            except Exception as e:
+                print(f"Search error: {e}")
+                items = []
+            if not cancelled.is_set() and generation == self._generation:
+                self.results.put((generation, query, items))
+
+
+class ClipboardBackend:
+    """Reads and writes the system clipboard."""
+
+    def paste(self) -> str:
+        raise NotImplementedError
+
+    def copy(self, text: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class PyperclipBackend(ClipboardBackend):
+    """pyperclip, which forks xclip/xsel for every call on Linux."""
+
+    def paste(self) -> str:
+        import pyperclip
+        return str(pyperclip.paste())
+
+    def copy(self, text: str) -> None:
+        import pyperclip
+        pyperclip.copy(text)
+
+
+class HelperProcessBackend(ClipboardBackend):
+    """Clipboard access through one long-lived helper process.
+
+    The helper (``main.py --clipboard-helper``) keeps a single Tk display
+    connection open and answers JSON-line requests on stdin, so a read costs
+    a pipe round-trip instead of a fork and exec. It also stays the selection
+    owner for copied text, which is what an ``xclip`` child does per copy.
+    Falls back to pyperclip if the helper cannot be started.
+    """
+
+    def __init__(self, fallback: Optional[ClipboardBackend] = None):
+        self.fallback = fallback or PyperclipBackend()
+        self._process: Optional["subprocess.Popen[str]"] = None
+        self._lock = threading.Lock()
+        self._failed = False
+
+    @staticmethod
+    def _command() -> List[str]:
+        if getattr(sys, "frozen", False):
+            return [sys.executable, "--clipboard-helper"]
+        entry_point = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        return [sys.executable, entry_point, "--clipboard-helper"]
+
+    def _request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        import subprocess
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._process is None or self._process.poll() is not None:
+                        self._process = subprocess.Popen(
+                            self._command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            text=True, encoding="utf-8", bufsize=1
+                        )
+                    stdin, stdout = self._process.stdin, self._process.stdout
+                    if stdin is None or stdout is None:
+                        raise IOError("clipboard helper has no pipes")
+                    stdin.write(json.dumps(request) + "\n")
+                    stdin.flush()
+                    line = stdout.readline()
+                    if not line:
+                        raise IOError("clipboard helper exited")
+                    response: Dict[str, Any] = json.loads(line)
+                    if not response.get("ok"):
+                        raise IOError(response.get("error", "clipboard helper error"))
+                    return response
+                except (IOError, OSError, ValueError) as e:
+                    self._stop_process()
+                    if attempt:
+                        raise IOError(f"clipboard helper unavailable: {e}")
+        return {}
+
+    def paste(self) -> str:
+        if not self._failed:
+            try:
+                return str(self._request({"op": "paste"}).get("text", ""))
+            except IOError as e:
+                print(f"Warning: {e}; falling back to pyperclip")
+                self._failed = True
+        return self.fallback.paste()
+
+    def copy(self, text: str) -> None:
+        if not self._failed:
+            try:
+                self._request({"op": "copy", "text": text})
+                return
+            except IOError as e:
+                print(f"Warning: {e}; falling back to pyperclip")
+                self._failed = True
+        self.fallback.copy(text)
+
+    def _stop_process(self) -> None:
+        import subprocess
+        if self._process is not None:
+            try:
+                if self._process.stdin is not None:
+                    self._process.stdin.close()
+                self._process.terminate()
+                self._process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+            self._process = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop_process()
+
+
+def run_clipboard_helper() -> None:
+    """Serve clipboard requests from stdin until it closes."""
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.withdraw()
+
+    def respond(response: Dict[str, Any]) -> None:
+        sys.stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+    def handle(fileobj: Any, mask: int) -> None:
+        line = sys.stdin.readline()
+        if not line:
+            root.quit()
+            return
+        try:
+            request = json.loads(line)
+            if request.get("op") == "paste":
+                try:
+                    text = root.clipboard_get()
+                except tk.TclError:
+                    # Empty clipboard or no text representation
+                    text = ""
+                respond({"ok": True, "text": text})
+            elif request.get("op") == "copy":
+                root.clipboard_clear()
+                root.clipboard_append(request.get("text", ""))
+                root.update_idletasks()
+                respond({"ok": True})
+            else:
+                respond({"ok": False, "error": f"unknown op {request.get('op')!r}"})
+        except Exception as e:
+            respond({"ok": False, "error": str(e)})
+
+    root.createfilehandler(sys.stdin, tk.READABLE, handle)
+    root.mainloop()
+
+
+def create_clipboard_backend() -> ClipboardBackend:
+    """Use the persistent helper on X11, where pyperclip forks per call."""
+    if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        return HelperProcessBackend()
+    return PyperclipBackend()
+
+
+class ClipboardWatcher:
+    """Decides when BackgroundClipboardMonitor should read the clipboard."""
+
+    def __init__(self) -> None:
+        self.wakeups = 0
+        self._interrupted = threading.Event()
+
+    def wait_for_change(self) -> bool:
+        """Block until the clipboard may have changed.
+
+        Returns True when woken by a change notification, False when the
+        wait simply timed out.
+        """
+        raise NotImplementedError
+
+    def record_result(self, changed: bool) -> None:
+        pass
+
+    def interrupt(self) -> None:
+        self._interrupted.set()
+
+    def close(self) -> None:
+        pass
+
+
+class AdaptivePollingWatcher(ClipboardWatcher):
+    """Polls quickly right after activity and backs off while idle."""
+
+    def __init__(self, min_interval: float = MIN_POLL_INTERVAL,
+                 max_interval: float = MAX_POLL_INTERVAL, backoff: float = POLL_BACKOFF):
+        super().__init__()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+    def wait_for_change(self) -> bool:
+        self._interrupted.wait(self.interval)
+        self.wakeups += 1
+        return False
+
+    def record_result(self, changed: bool) -> None:
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+
+class XFixesClipboardWatcher(ClipboardWatcher):
+    """Waits for X11 CLIPBOARD owner changes through the XFixes extension.
+
+    Every copy in practically every X11 application re-acquires selection
+    ownership, so the monitor only wakes when something was copied. A slow
+    timeout still triggers a read in case an owner updates silently.
+    """
+
+    _SET_SELECTION_OWNER_NOTIFY_MASK = 1
+    _SELECTION_NOTIFY = 0
+
+    def __init__(self, selection: str = "CLIPBOARD", idle_timeout: float = IDLE_CHECK_INTERVAL):
+        super().__init__()
+        import ctypes.util
+        self.idle_timeout = idle_timeout
+        x11_path = ctypes.util.find_library("X11")
+        xfixes_path = ctypes.util.find_library("Xfixes")
+        if not x11_path or not xfixes_path:
+            raise OSError("libX11 or libXfixes not available")
+        x11 = self._x11 = ctypes.CDLL(x11_path)
+        xfixes = ctypes.CDLL(xfixes_path)
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        x11.XInternAtom.restype = ctypes.c_ulong
+        x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        x11.XPending.argtypes = [ctypes.c_void_p]
+        x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        x11.XFlush.argtypes = [ctypes.c_void_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xfixes.XFixesQueryExtension.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)
+        ]
+        xfixes.XFixesQueryVersion.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)
+        ]
+        xfixes.XFixesSelectSelectionInput.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong
+        ]
+
+        self._display = x11.XOpenDisplay(None)
+        if not self._display:
+            raise OSError("Cannot open X display")
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not xfixes.XFixesQueryExtension(self._display, ctypes.byref(event_base),
+                                           ctypes.byref(error_base)):
+            x11.XCloseDisplay(self._display)
+            raise OSError("X server lacks the XFixes extension")
+        major, minor = ctypes.c_int(5), ctypes.c_int(0)
+        xfixes.XFixesQueryVersion(self._display, ctypes.byref(major), ctypes.byref(minor))
+        self._notify_type = event_base.value + self._SELECTION_NOTIFY
+
+        atom = x11.XInternAtom(self._display, selection.encode(), 0)
+        root = x11.XDefaultRootWindow(self._display)
+        xfixes.XFixesSelectSelectionInput(self._display, root, atom,
+                                          self._SET_SELECTION_OWNER_NOTIFY_MASK)
+        x11.XFlush(self._display)
+        self._fd = x11.XConnectionNumber(self._display)
+        # XEvent is a union padded to 24 longs
+        self._event = ctypes.create_string_buffer(ctypes.sizeof(ctypes.c_long) * 24)
+        self._wake_r, self._wake_w = os.pipe()
+
+    def _drain(self) -> bool:
+        import ctypes
+        notified = False
+        while self._x11.XPending(self._display):
+            self._x11.XNextEvent(self._display, self._event)
+            if ctypes.c_int.from_buffer(self._event).value == self._notify_type:
+                notified = True
+        return notified
+
+    def wait_for_change(self) -> bool:
+        if self._drain():
+            return True
+        readable, _, _ = select.select([self._fd, self._wake_r], [], [], self.idle_timeout)
+        self.wakeups += 1
+        return self._drain()
+
+    def interrupt(self) -> None:
+        super().interrupt()
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        if self._display:
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+        for fd in (self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def create_clipboard_watcher() -> ClipboardWatcher:
+    """Use X11 owner-change notifications when available, else adaptive polling."""
+    if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        try:
+            return XFixesClipboardWatcher()
+        except OSError as e:
+            print(f"Clipboard notifications unavailable, polling instead: {e}")
+    return AdaptivePollingWatcher()
+
+
+class BackgroundClipboardMonitor:
+    def __init__(self, clipboard_manager: "AnyClipboardManager",
+                 watcher_factory: Callable[[], ClipboardWatcher] = create_clipboard_watcher,
+                 clipboard: Optional[ClipboardBackend] = None):
+        self.clipboard_manager = clipboard_manager
+        self.clipboard = clipboard or PyperclipBackend()
+        self.watcher_factory = watcher_factory
+        self.watcher: Optional[ClipboardWatcher] = None
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+    
+    def start_tracking(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._tracking_loop, daemon=True)
+        self.thread.start()
+    
+    def _tracking_loop(self) -> None:
+        # The watcher is created here so an X connection stays on this thread
+        self.watcher = watcher = self.watcher_factory()
+        try:
+            while self.running:
+                try:
+                    with metrics.timer("clipboard.read"):
+                        current_clipboard = self.clipboard.paste()
+                    changed = current_clipboard != self.clipboard_manager.last_copied
+                    metrics.incr("clipboard.wakeups")
+                    if changed:
+                        self.clipboard_manager.add_clipboard_item(current_clipboard)
+                    watcher.record_result(changed)
+                except Exception as e:
+                    print(f"Clipboard tracking error: {e}")
+                if self.running:
+                    watcher.wait_for_change()
+        finally:
+            watcher.close()
+    
+    def stop_tracking(self) -> None:
+        self.running = False
+        if self.watcher is not None:
+            self.watcher.interrupt()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1)
+
+
+class RetentionSweeper:
+    """Enforces the retention policy off the capture and UI threads.
+
+    Wakes for the next clip due to expire, or every ``interval`` seconds
+    to catch policy changes, whichever is sooner.
+    """
+
+    def __init__(self, clipboard_manager: ClipboardManager,
+                 interval: float = RETENTION_SWEEP_INTERVAL):
+        self.clipboard_manager = clipboard_manager
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._sweep_loop, daemon=True)
+        self.thread.start()
+
+    def _sweep_loop(self) -> None:
+        while True:
+            timeout = self.interval
+            next_expiry = self.clipboard_manager.next_expiry()
+            if next_expiry is not None:
+                timeout = min(timeout, max(0.0, next_expiry - time.time()))
+            if self._stop.wait(timeout):
+                return
+            try:
+                self.clipboard_manager.enforce_retention()
+            except Exception as e:
+                print(f"Retention sweep error: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=1)
+        self.thread = None
+
+
+class MemoryMonitor:
+    """Holds a process's resident memory to a budget, checking every ``interval`` seconds.
+
+    Publishes the ``memory.rss`` and ``memory.content_cache`` gauges. Over
+    budget, it has the manager trim: cached bodies are dropped, garbage is
+    collected and freed heap is handed back to the OS. It only trims again
+    once memory has grown since, so a budget below what the process needs
+    anyway does not cost a collection every check.
+    """
+
+    def __init__(self, clipboard_manager: "AnyClipboardManager", budget: int,
+                 interval: float = MEMORY_CHECK_INTERVAL):
+        self.clipboard_manager = clipboard_manager
+        self.budget = budget
+        self.interval = interval
+        self._trimmed_at: Optional[int] = None
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        metrics.memory_budget = self.budget
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._check_loop, daemon=True)
+        self.thread.start()
+
+    def _check_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Memory check error: {e}")
+
+    def check(self) -> Optional[int]:
+        """Trim if over budget; returns resident memory in bytes, if known."""
+        rss = resident_memory()
+        if rss is None:
+            return None
+        cache = getattr(self.clipboard_manager, "content_cache", None)
+        metrics.gauge("memory.rss", rss)
+        if cache is not None:
+            metrics.gauge("memory.content_cache", cache.size)
+        if rss > self.budget and (self._trimmed_at is None or rss > self._trimmed_at * 1.05):
+            self.clipboard_manager.trim_memory()
+            metrics.incr("memory.trims")
+            rss = self._trimmed_at = resident_memory()
+        elif rss <= self.budget:
+            self._trimmed_at = None
+        return rss
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=1)
+        self.thread = None
+
+
+class ClipClassifier:
+    """Tags a clip's content type and flags text that looks like a secret.
+
+    Secret patterns are keyed by a literal every match contains. The
+    lowercased clip is searched for those literals with ``str.find``, and
+    only the hits are checked against the precompiled patterns, anchored at
+    the hit, so text with nothing suspicious costs one fast pass per
+    literal. Type tags (url, json, code, path) are decided from the first
+    ``sample`` characters.
+    """
+
+    _ASSIGNMENT = re.compile(
+        r"(?:pass(?:word|wd|phrase)?|pwd|secret|token|api[_-]?key)[\w-]*[\"']?[ \t]*[:=][ \t]*[\"']?"
+        # A value of 8+ characters with a letter and a digit, not a call or a longer name
+        r"(?=[^\s\"'`,;]*\d)(?=[^\s\"'`,;]*[a-z])[^\s\"'`,;()]{8,}(?![(\w])",
+        re.IGNORECASE,
+    )
+    # (literal, offset of the match start before it, pattern)
+    SECRET_PATTERNS = (
+        ("-----begin ", 0, re.compile(r"-----BEGIN (?:[A-Z0-9]+ )*PRIVATE KEY-----")),
+        ("akia", 0, re.compile(r"AKIA[0-9A-Z]{16}(?![0-9A-Za-z])")),
+        ("asia", 0, re.compile(r"ASIA[0-9A-Z]{16}(?![0-9A-Za-z])")),
+        ("aiza", 0, re.compile(r"AIza[\w-]{35}")),
+        ("gh", 0, re.compile(r"gh[pousr]_[A-Za-z0-9]{36,}|github_pat_\w{22,}")),
+        ("xox", 0, re.compile(r"xox[abprs]-[A-Za-z0-9-]{10,}")),
+        ("k_live_", 1, re.compile(r"[rs]k_live_[A-Za-z0-9]{20,}")),
+        ("eyj", 0, re.compile(r"eyJ[\w-]{8,}\.eyJ[\w-]{8,}\.[\w-]{8,}")),
+        # user:password@ in a URL
+        ("://", 0, re.compile(r"://[^\s/:@]+:[^\s/@]+@")),
+        ("pass", 0, _ASSIGNMENT),
+        ("pwd", 0, _ASSIGNMENT),
+        ("secret", 0, _ASSIGNMENT),
+        ("token", 0, _ASSIGNMENT),
+        ("api", 0, _ASSIGNMENT),
+    )
+    # Words joined by separators, e.g. v2.0.1-Beta, myVar2.toString(), List<Item2>.size(), #Theme-2.css
+    _IDENTIFIER_SHAPE = re.compile(
+        r"[#@$]?[\w$]+(?:<[\w$,.]+>)?(?:[.\-:,@]{1,2}[\w$]+(?:<[\w$,.]+>)?)*(?:\(\))?[;,]?")
+    _URL = re.compile(r"\b(?:https?|ftp)://[^\s<>\"']+|\bwww\.[\w-]+\.[a-z]{2,}")
+    _PATH = re.compile(r"(?:~|\.{1,2})?(?:/[^/\0\n]+)+/?|[A-Za-z]:\\[^\n]*|\\\\[^\\\n]+\\[^\n]*")
+    _CODE = re.compile(
+        r"^[ \t]*(?:def|class|import|from|return|function|const|let|var|public|private|static"
+        r"|func|fn|package|#include|#define|if|for|while|SELECT|INSERT|UPDATE)\b|[;{][ \t]*$|=>",
+        re.MULTILINE,
+    )
+
+    def __init__(self, sample: int = CLASSIFY_SAMPLE):
+        self.sample = sample
+
+    def classify(self, text: str) -> List[str]:
+        """The clip's tags, e.g. ``["code", "secret"]``."""
+        head = text[:self.sample]
+        tags = []
+        stripped = text.strip()
+        if stripped[:1] in ("{", "[") and stripped[-1:] in ("}", "]") and self._is_json(stripped):
+            tags.append("json")
+        elif self._looks_like_code(head):
+            tags.append("code")
+        if self._URL.search(head):
+            tags.append("url")
+        lines = head.strip().splitlines()
+        if lines and all(self._PATH.fullmatch(line.strip()) for line in lines if line.strip()):
+            tags.append("path")
+        if self.is_secret(text):
+            tags.append(SECRET_TAG)
+        return sorted(tags)
+
+    def is_secret(self, text: str) -> bool:
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters change length when lowercased; fall back to the slower search
+            return any(pattern.search(text) for _, _, pattern in self.SECRET_PATTERNS)
+        for literal, offset, pattern in self.SECRET_PATTERNS:
+            position = lowered.find(literal)
+            while position >= 0:
+                if pattern.match(text, max(0, position - offset)):
+                    return True
+                position = lowered.find(literal, position + 1)
+        return self._looks_like_password(text.strip())
+
+    @staticmethod
+    def _is_json(text: str) -> bool:
+        try:
+            json.loads(text)
+        except ValueError:
+            return False
+        return True
+
+    def _looks_like_code(self, head: str) -> bool:
+        hits = len(self._CODE.findall(head))
+        return hits >= max(2, head.count("\n") // 4)
+
+    @classmethod
+    def _looks_like_password(cls, text: str) -> bool:
+        """A lone, long, high-entropy token mixing cases, digits and symbols.
+
+        Version strings, dotted names, e-mail addresses, paths and other
+        words joined by punctuation are not passwords, however mixed.
+        """
+        if not PASSWORD_MIN_LENGTH <= len(text) <= PASSWORD_MAX_LENGTH:
+            return False
+        if (any(c.isspace() for c in text) or "/" in text or "\\" in text
+                or cls._IDENTIFIER_SHAPE.fullmatch(text)):
+            return False
+        if not (any(c.islower() for c in text) and any(c.isupper() for c in text)
+                and any(c.isdigit() for c in text) and any(not c.isalnum() for c in text)):
+            return False
+        counts = collections.Counter(text).values()
+        entropy = -sum(count / len(text) * math.log2(count / len(text)) for count in counts)
+        return entropy >= PASSWORD_MIN_ENTROPY
+
+
+class ClassificationPipeline:
+    """Classifies captured clips on a worker pool before they are stored.
+
+    Once started, ``ClipboardManager.add_clipboard_item`` hands new clips
+    here rather than storing them, so capture never waits on a scan. A
+    store thread saves them with their tags in capture order as scans
+    complete. Secrets are tagged ``SECRET_TAG``, which the retention
+    policy's ``secret_max_age`` expires, or with ``skip_secrets`` never
+    stored.
+    """
+
+    def __init__(self, clipboard_manager: ClipboardManager,
+                 classifier: Optional[ClipClassifier] = None, workers: int = CLASSIFY_WORKERS,
+                 skip_secrets: bool = False):
+        self.clipboard_manager = clipboard_manager
+        self.classifier = classifier or ClipClassifier()
+        self.skip_secrets = skip_secrets
+        import concurrent.futures
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="clipstack-classify"
+        )
+        # Clips in capture order: (future, content, digest)
+        self._pending: "collections.deque[tuple]" = collections.deque()
+        self._changed = threading.Condition()
+        self._stopping = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._store_loop, daemon=True)
+        self.thread.start()
+        self.clipboard_manager.classifier = self
+
+    def submit(self, content: str, digest: str) -> None:
+        future = self._executor.submit(self._classify, content)
+        with self._changed:
+            self._pending.append((future, content, digest))
+            metrics.gauge("classify.pending", len(self._pending))
+        # Only wakes the store thread, so it is cheap even when run here at once
+        future.add_done_callback(self._wake)
+
+    def _classify(self, content: str) -> List[str]:
+        with metrics.timer("classify.scan"):
+            tags = self.classifier.classify(content)
+        metrics.incr("classify.bytes", len(content))
+        return tags
+
+    def _wake(self, _future: "concurrent.futures.Future[List[str]]") -> None:
+        with self._changed:
+            self._changed.notify_all()
+
+    def _store_loop(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: (self._pending and self._pending[0][0].done())
+                                       or (self._stopping and not self._pending))
+                if not self._pending:
+                    return
+                future, content, digest = self._pending[0]
+            try:
+                tags = future.result()
+            except Exception as e:
+                print(f"Classification error: {e}")
+                tags = []
+            self._store(content, digest, tags)
+            # Dequeued only once stored, so flush() never returns early
+            with self._changed:
+                self._pending.popleft()
+                metrics.gauge("classify.pending", len(self._pending))
+                self._changed.notify_all()
+
+    def _store(self, content: str, digest: str, tags: List[str]) -> None:
+        metrics.incr("classify.clips")
+        if SECRET_TAG in tags:
+            metrics.incr("classify.secrets")
+            if self.skip_secrets:
+                return
+        try:
+            self.clipboard_manager._store_clip(content, digest, tags)
+        except Exception as e:
+            print(f"Error storing classified clip: {e}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted clip is stored; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._pending, timeout)
+
+    def stop(self) -> None:
+        """Store whatever is still queued, then stop; new clips are stored directly."""
+        if self.clipboard_manager.classifier is self:
+            self.clipboard_manager.classifier = None
+        self._executor.shutdown(wait=True)
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+class SyncClient:
+    """Replicates a ClipboardManager with other machines through a sync server.
+
+    Local mutations become deltas keyed by clip uid (``node:id``, where the
+    node id is random per history) and are pushed in zlib-compressed
+    batches; changes from other nodes are pulled with a long poll and
+    merged by ``ClipboardManager.merge_remote``. Traffic is proportional to
+    the number of changes, not to the history size. On first start the
+    existing history is queued once so other nodes receive it, and clips
+    captured while sync was off are queued on the next start. Evictions
+    are not replicated, since each machine applies its own retention
+    policy. State (node id, pull position, pin stamps, uid map and any
+    unsent changes) lives in ``<history>.sync``; run one syncing instance
+    per history file.
+    """
+
+    def __init__(self, clipboard_manager: ClipboardManager, url: str,
+                 state_file: Optional[str] = None):
+        self.clipboard_manager = clipboard_manager
+        self.url = url.rstrip("/")
+        self.state_file = state_file or clipboard_manager.history_file + SYNC_STATE_SUFFIX
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.changes_sent = 0
+        self.changes_received = 0
+        self._lock = threading.RLock()
+        # Serializes state file writes, which the push and pull threads both make
+        self._save_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._error: Optional[str] = None
+        state = self._load_state()
+        self.node: str = state.get("node") or os.urandom(6).hex()
+        self.pulled: int = state.get("pulled", 0)
+        self._sent: int = state.get("sent", 0)
+        # The highest n on disk: no n up to it may be handed out again after a crash
+        self._saved_sent = self._sent
+        self._outbox: List[Dict[str, Any]] = state.get("outbox", [])
+        # Last (time, node) stamp that set each item's pin state
+        self._pins: Dict[int, List[Any]] = {int(k): v for k, v in state.get("pins", {}).items()}
+        # Remote uids -> local ids, including clips both machines captured
+        self._uids: Dict[str, int] = dict(state.get("uids", {}))
+        history = clipboard_manager.load_history()
+        for item in history:
+            if item.get("uid"):
+                self._uids[item["uid"]] = item["id"]
+        live = {item["id"] for item in history}
+        self._uids = {uid: item_id for uid, item_id in self._uids.items() if item_id in live}
+        self._pins = {item_id: stamp for item_id, stamp in self._pins.items() if item_id in live}
+        # Highest local id already queued; clips captured while sync was off sit above it
+        seen = state.get("seen", 0) if "node" in state else -1
+        self._seen: int = max(live, default=seen)
+        # Oldest first, so other nodes see the history in capture order
+        self._queue([self._add_change(item) for item in reversed(history)
+                     if item["id"] > seen and not item.get("uid")])
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state: Dict[str, Any] = json.load(f)
+                return state
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not load sync state: {e}")
+            return {}
+
+    def _save_state(self) -> bool:
+        """Write the state with the unsent changes; False if it could not be written.
+
+        Changes already pushed may still be in a saved outbox; the server
+        skips them by their ``n`` if they are pushed again.
+        """
+        with self._lock:
+            state = {"node": self.node, "pulled": self.pulled, "sent": self._sent,
+                     "seen": self._seen,
+                     "pins": self._pins, "uids": self._uids,
+                     "outbox": self._outbox}
+            data = json.dumps(state, ensure_ascii=False)
+            sent = self._sent
+        temp_file = self.state_file + ".tmp"
+        try:
+            with self._save_lock:
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(temp_file, self.state_file)
+        except (IOError, OSError) as e:
+            print(f"Error: Could not save sync state: {e}")
+            return False
+        with self._lock:
+            self._saved_sent = max(self._saved_sent, sent)
+        return True
+
+    def uid_of(self, item: Dict[str, Any]) -> str:
+        return item.get("uid") or f"{self.node}:{item['id']}"
+
+    def local_id(self, uid: Optional[str]) -> Optional[int]:
+        if not uid:
+            return None
+        with self._lock:
+            item_id = self._uids.get(uid)
+        if item_id is None and uid.startswith(self.node + ":"):
+            item_id = int(uid[len(self.node) + 1:])
+        return item_id
+
+    def alias(self, uid: str, item_id: int) -> None:
+        with self._lock:
+            self._uids[uid] = item_id
+
+    def newer_pin(self, item_id: int, stamp: Optional[List[Any]]) -> bool:
+        """Record ``stamp`` for the item's pin state if it beats the last one."""
+        stamp = list(stamp) if stamp else [0, ""]
+        with self._lock:
+            current = self._pins.get(item_id)
+            if current is not None and stamp <= current:
+                return False
+            self._pins[item_id] = stamp
+            return True
+
+    def _add_change(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        content = self.clipboard_manager._item_content(item)
+        if content is None:
+            return None
+        change = {"op": "add", "uid": self.uid_of(item), "content": content,
+                  "timestamp": item["timestamp"], "pinned": bool(item.get("pinned"))}
+        if item.get("tags"):
+            change["tags"] = list(item["tags"])
+        if change["pinned"]:
+            change["stamp"] = self._pins.setdefault(item["id"], [item["timestamp"], self.node])
+        return change
+
+    def record(self, records: List[Dict[str, Any]], removed: List[Dict[str, Any]]) -> None:
+        """Queue deltas for records just applied locally; ``removed`` holds the items they removed."""
+        removed_uids = {item["id"]: self.uid_of(item) for item in removed}
+        storage = self.clipboard_manager.storage
+        changes: List[Optional[Dict[str, Any]]] = []
+        with self._lock:
+            self._record(records, removed_uids, storage, changes)
+        self._queue(changes)
+
+    def _record(self, records: List[Dict[str, Any]], removed_uids: Dict[int, str],
+                storage: HistoryStorage, changes: List[Optional[Dict[str, Any]]]) -> None:
+        for record in records:
+            op = record.get("op")
+            if op == "add":
+                self._seen = max(self._seen, record["item"]["id"])
+                changes.append(self._add_change(record["item"]))
+            elif op == "remove":
+                uid = removed_uids.get(record.get("id", 0))
+                if uid is not None and not record.get("evicted"):
+                    changes.append({"op": "remove", "uid": uid})
+                self._pins.pop(record.get("id", 0), None)
+            elif op == "clear":
+                changes.extend({"op": "remove", "uid": uid} for uid in removed_uids.values())
+                self._pins.clear()
+            elif op in ("touch", "pin", "unpin", "tag", "untag"):
+                item = storage.get_item(record.get("id", 0))
+                if item is None:
+                    continue
+                change = {"op": op, "uid": self.uid_of(item)}
+                if op == "touch":
+                    change["timestamp"] = record.get("timestamp")
+                elif op in ("pin", "unpin"):
+                    change["stamp"] = self._pins[item["id"]] = [time.time(), self.node]
+                else:
+                    change["tags"] = list(record.get("tags", ()))
+                changes.append(change)
+
+    def _queue(self, changes: Iterable[Optional[Dict[str, Any]]]) -> None:
+        with self._lock:
+            for change in changes:
+                if change is not None:
+                    self._sent += 1
+                    change["n"] = self._sent
+                    self._outbox.append(change)
+            if self._outbox:
+                self._wake.set()
+
+    def _request(self, path: str, payload: Optional[Dict[str, Any]] = None,
+                 timeout: float = 10.0) -> Dict[str, Any]:
+        import urllib.request
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8")) \
+            if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data)
+        request.add_header("Accept-Encoding", "deflate")
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+            request.add_header("Content-Encoding", "deflate")
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+        sent = len(data) if data else 0
+        self.bytes_sent += sent
+        self.bytes_received += len(body)
+        metrics.incr("sync.bytes_sent", sent)
+        metrics.incr("sync.bytes_received", len(body))
+        result: Dict[str, Any] = json.loads(zlib.decompress(body))
+        return result
+
+    def _report(self, error: Optional[Exception]) -> None:
+        message = None if error is None else str(error)
+        if message != self._error:
+            if message is not None:
+                print(f"Sync with {self.url} failed, retrying: {message}")
+            elif self._error is not None:
+                print(f"Sync with {self.url} resumed")
+            self._error = message
+
+    def push(self, timeout: float = 10.0) -> bool:
+        """Send queued changes, a batch at a time; False if the server could not be reached."""
+        while True:
+            with self._lock:
+                batch = self._outbox[:SYNC_BATCH]
+                unsaved = bool(batch) and batch[-1]["n"] > self._saved_sent
+            if not batch:
+                return True
+            # Once the server has an n it ignores it from then on, so a restart must
+            # not reuse it for another change
+            if unsaved and not self._save_state():
+                return False
+            try:
+                self._request("/push", {"node": self.node, "changes": batch}, timeout)
+            except (OSError, ValueError, zlib.error) as e:
+                self._report(e)
+                return False
+            self._report(None)
+            with self._lock:
+                # Only appended to meanwhile, so the batch is still at the front
+                del self._outbox[:len(batch)]
+            self.changes_sent += len(batch)
+            metrics.incr("sync.changes_sent", len(batch))
+
+    def pull(self, wait: float = 0.0) -> int:
+        """Fetch and merge one batch of other nodes' changes; returns how many arrived.
+
+        The server answers at once if it has anything newer, else after up
+        to ``wait`` seconds. Raises OSError if it cannot be reached.
+        """
+        import urllib.parse
+        query = urllib.parse.urlencode({"since": self.pulled, "node": self.node,
+                                        "limit": SYNC_BATCH, "wait": wait})
+        result = self._request(f"/pull?{query}", timeout=wait + 10.0)
+        changes = result.get("changes", [])
+        if self._stop.is_set():
+            return 0
+        if changes:
+            with metrics.timer("sync.merge"):
+                self.clipboard_manager.merge_remote(changes, self)
+            self.changes_received += len(changes)
+            metrics.incr("sync.changes_received", len(changes))
+        self.pulled = result.get("seq", self.pulled)
+        self._save_state()
+        return len(changes)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self.clipboard_manager.replicator = self
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._push_loop, daemon=True),
+                         threading.Thread(target=self._pull_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def _push_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            # Coalesce a burst of local changes into one request
+            if self._stop.wait(SYNC_DEBOUNCE):
+                return
+            self._wake.clear()
+            if not self.push():
+                if self._stop.wait(SYNC_RETRY_INTERVAL):
+                    return
+                self._wake.set()
+
+    def _pull_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.pull(SYNC_LONG_POLL)
+            except (OSError, ValueError, zlib.error) as e:
+                self._report(e)
+                self._stop.wait(SYNC_RETRY_INTERVAL)
+                continue
+            except Exception as e:
+                print(f"Sync merge error: {e}")
+                self._stop.wait(SYNC_RETRY_INTERVAL)
+                continue
+            self._report(None)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout=1)
+        self._threads = []
+        if self.clipboard_manager.replicator is self:
+            self.clipboard_manager.replicator = None
+        # A last attempt, so changes made just before exiting are not held back
+        self.push(timeout=2.0)
+        self._save_state()
+
+
+def _public_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """An item as sent over the daemon socket: metadata and preview, no body."""
+    return {key: value for key, value in item.items() if key != "content"}
+
+
+def _event_to_dict(event: ChangeEvent) -> Dict[str, Any]:
+    return {
+        "kind": event.kind,
+        "item_id": event.item_id,
+        "item": _public_item(event.item) if event.item is not None else None,
+        "group": event.group,
+    }
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """Serves newline-delimited JSON requests on one client connection."""
+
+    def handle(self) -> None:
+        daemon: "ClipStackDaemon" = getattr(self.server, "clipstack_daemon")
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if request.get("cmd") == "stream-events":
+                    self._stream_events(daemon)
+                    return
+                response = {"ok": True, "result": daemon.dispatch(request)}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            try:
+                self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            except OSError:
+                return
+
+    def _stream_events(self, daemon: "ClipStackDaemon") -> None:
+        events: "queue.Queue[ChangeEvent]" = queue.Queue()
+        daemon.clipboard_manager.add_listener(events.put)
+        try:
+            while daemon.running:
+                try:
+                    event = events.get(timeout=1)
+                except queue.Empty:
+                    continue
+                self.wfile.write((json.dumps(_event_to_dict(event), ensure_ascii=False) + "\n")
+                                 .encode("utf-8"))
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            daemon.clipboard_manager.remove_listener(events.put)
+
+
+class ClipStackDaemon:
+    """Headless clipboard capture serving history over a local Unix socket."""
+
+    def __init__(self, clipboard_manager: ClipboardManager, clipboard: ClipboardBackend,
+                 socket_path: Optional[str] = None):
+        self.clipboard_manager = clipboard_manager
+        self.clipboard = clipboard
+        self.socket_path = socket_path or default_socket_path()
+        self.monitor = BackgroundClipboardMonitor(clipboard_manager, clipboard=clipboard)
+        self.sweeper = RetentionSweeper(clipboard_manager)
+        self.memory_monitor = None
+        if clipboard_manager.memory_budget is not None:
+            self.memory_monitor = MemoryMonitor(clipboard_manager, clipboard_manager.memory_budget)
+        self.running = False
+        self.server: Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def dispatch(self, request: Dict[str, Any]) -> Any:
+        cmd = request.get("cmd")
+        manager = self.clipboard_manager
+        if cmd == "ping":
+            return "pong"
+        if cmd == "stats":
+            if request.get("enable") is not None:
+                metrics.enabled = bool(request["enable"])
+            if request.get("reset"):
+                metrics.reset()
+            return metrics.snapshot()
+        if cmd == "profile":
+            metrics.profile_next(request["name"])
+            return None
+        if cmd == "list":
+            items = manager.load_history(request.get("pinned"), request.get("tag"))
+            offset = request.get("offset", 0)
+            limit = request.get("limit")
+            items = items[offset:offset + limit] if limit is not None else items[offset:]
+            return [_public_item(item) for item in items]
+        if cmd == "count":
+            return manager.count(request.get("pinned"))
+        if cmd == "tags":
+            return manager.tag_counts()
+        if cmd == "groups":
+            # JSON object keys would turn the ids into strings
+            return sorted(manager.similar_groups().items())
+        if cmd == "similar":
+            return [_public_item(item) for item in manager.similar_items(request["id"])]
+        if cmd == "search":
+            items = manager.search(request["query"], limit=request.get("limit", 100),
+                                   mode=request.get("mode", "substring"), tag=request.get("tag"))
+            return [_public_item(item) for item in items]
+        if cmd == "add":
+            return manager.add_clipboard_item(request["content"])
+        if cmd == "clear":
+            manager.clear_history()
+            return None
+        if cmd == "import":
+            return manager.import_file(request["path"], request.get("format"))._asdict()
+        if cmd == "export":
+            ids = set(request["ids"]) if request.get("ids") else None
+            if request.get("path"):
+                path = request["path"]
+                fmt = request.get("format") or export_format_for(path) or "ndjson"
+                return manager.export(path, fmt, ids)
+            if request.get("format") == "json":
+                return manager.export_as_json(ids)
+            return manager.export_as_txt(ids)
+
+        if request.get("ids") is not None:
+            ids = request["ids"]
+            if cmd in ("get", "copy"):
+                # Several items read or copied as one clip
+                content = manager.concatenated_content(ids, request.get("separator", "\n"))
+                if cmd == "get":
+                    return {"content": content}
+                self.clipboard.copy(content)
+                return len(ids)
+            if cmd == "pin":
+                return manager.pin_items(ids)
+            if cmd == "unpin":
+                return manager.unpin_items(ids)
+            if cmd == "delete":
+                return manager.remove_items(ids)
+            if cmd == "tag":
+                return manager.tag_items(ids, request.get("tags", []))
+            if cmd == "untag":
+                return manager.untag_items(ids, request.get("tags", []))
+            raise ValueError(f"Unknown command: {cmd}")
+
+        item_id = request.get("id")
+        item = manager.get_item(item_id) if isinstance(item_id, int) else None
+        if item is None or not isinstance(item_id, int):
+            raise ValueError(f"No item with id {item_id}")
+        if cmd == "get":
+            result = _public_item(item)
+            if request.get("content", True):
+                result["content"] = manager.get_content(item_id)
+            return result
+        if cmd == "copy":
+            self.clipboard.copy(manager.get_content(item_id) or "")
+            return None
+        if cmd == "pin":
+            manager.pin_item(item_id)
+            return None
+        if cmd == "unpin":
+            manager.unpin_item(item_id)
+            return None
+        if cmd == "delete":
+            manager.remove_item(item_id)
+            return None
+        raise ValueError(f"Unknown command: {cmd}")
+
+    def serve_forever(self) -> None:
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            raise OSError("The ClipStack daemon needs Unix domain sockets")
+        if os.path.exists(self.socket_path):
+            try:
+                ClipStackClient(self.socket_path, timeout=1).request("ping")
+                raise OSError(f"A ClipStack daemon is already listening on {self.socket_path}")
+            except ClipStackError:
+                # Left behind by a daemon that did not shut down cleanly
+                os.remove(self.socket_path)
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, _DaemonRequestHandler)
+        self.server.daemon_threads = True
+        setattr(self.server, "clipstack_daemon", self)
+        os.chmod(self.socket_path, 0o600)
+        self.running = True
+        self.monitor.start_tracking()
+        self.sweeper.start()
+        if self.memory_monitor is not None:
+            self.memory_monitor.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.running = False
+            self.monitor.stop_tracking()
+            self.sweeper.stop()
+            if self.memory_monitor is not None:
+                self.memory_monitor.stop()
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self) -> None:
+        if self.server is not None:
+            # serve_forever blocks the calling thread, so stop it from another
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class RemoteClipboardManager:
+    """The ClipboardManager API, served by a running ClipStack daemon."""
+
+    is_remote = True
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.client = ClipStackClient(socket_path)
+        self.client.request("ping")
+        self.last_copied = ""
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[ChangeEvent], None]] = []
+        self._event_thread: Optional[threading.Thread] = None
+
+    def _request(self, cmd: str, **params: Any) -> Any:
+        with self._lock:
+            return self.client.request(cmd, **params)
+
+    def load_history(self, pinned: Optional[bool] = None,
+                     tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        return cast(List[Dict[str, Any]], self._request("list", pinned=pinned, tag=tag))
+
+    def tag_counts(self) -> Dict[str, int]:
+        return cast(Dict[str, int], self._request("tags"))
+
+    def similar_groups(self) -> Dict[int, int]:
+        return {item_id: key for item_id, key in self._request("groups")}
+
+    def similar_items(self, item_id: int) -> List[Dict[str, Any]]:
+        return cast(List[Dict[str, Any]], self._request("similar", id=item_id))
+
+    def stats(self, enable: Optional[bool] = None, reset: bool = False) -> Dict[str, Any]:
+        """The daemon's metrics snapshot."""
+        return cast(Dict[str, Any], self._request("stats", enable=enable, reset=reset))
+
+    def profile_next(self, name: str) -> None:
+        self._request("profile", name=name)
+
+    def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            return cast(Optional[Dict[str, Any]], self._request("get", id=item_id, content=False))
+        except ClipStackError:
+            return None
+
+    def get_content(self, item_id: int) -> Optional[str]:
+        try:
+            return cast(Optional[str], self._request("get", id=item_id)["content"])
+        except ClipStackError:
+            return None
+
+    def count(self, pinned: Optional[bool] = None) -> int:
+        return cast(int, self._request("count", pinned=pinned))
+
+    def search(self, query: str, limit: int = 100, mode: str = "substring",
+               cancelled: Optional[threading.Event] = None,
+               tag: Optional[str] = None) -> List[Dict[str, Any]]:
+        return cast(List[Dict[str, Any]],
+                    self._request("search", query=query, limit=limit, mode=mode, tag=tag))
+
+    def add_clipboard_item(self, item_content: str) -> bool:
+        return cast(bool, self._request("add", content=item_content))
+
+    def remove_item(self, item_id: int) -> None:
+        self._request("delete", id=item_id)
+
+    def pin_item(self, item_id: int) -> None:
+        self._request("pin", id=item_id)
+
+    def unpin_item(self, item_id: int) -> None:
+        self._request("unpin", id=item_id)
+
+    def remove_items(self, item_ids: Iterable[int]) -> int:
+        return cast(int, self._request("delete", ids=sorted(set(item_ids))))
+
+    def pin_items(self, item_ids: Iterable[int]) -> int:
+        return cast(int, self._request("pin", ids=sorted(set(item_ids))))
+
+    def unpin_items(self, item_ids: Iterable[int]) -> int:
+        return cast(int, self._request("unpin", ids=sorted(set(item_ids))))
+
+    def tag_items(self, item_ids: Iterable[int], tags: Iterable[str]) -> int:
+        return cast(int, self._request("tag", ids=sorted(set(item_ids)), tags=list(tags)))
+
+    def untag_items(self, item_ids: Iterable[int], tags: Iterable[str]) -> int:
+        return cast(int, self._request("untag", ids=sorted(set(item_ids)), tags=list(tags)))
+
+    def concatenated_content(self, item_ids: Iterable[int], separator: str = "\n") -> str:
+        result = self._request("get", ids=sorted(set(item_ids)), separator=separator)
+        return cast(str, result["content"])
+
+    def clear_history(self) -> None:
+        self._request("clear")
+
+    def export_as_txt(self, selected_ids: Optional[Set[int]] = None) -> Optional[str]:
+        return cast(Optional[str],
+                    self._request("export", format="txt", ids=sorted(selected_ids or [])))
+
+    def export_as_json(self, selected_ids: Optional[Set[int]] = None) -> Optional[str]:
+        return cast(Optional[str],
+                    self._request("export", format="json", ids=sorted(selected_ids or [])))
+
+    def export(self, path: str, fmt: str, selected_ids: Optional[Set[int]] = None,
+               progress: Optional[Callable[[int, int], None]] = None,
+               cancelled: Optional[threading.Event] = None) -> int:
+        """Have the daemon stream the export to ``path``.
+
+        The daemon writes the file itself, so there is no progress and the
+        export cannot be cancelled once it has started.
+        """
+        if cancelled is not None and cancelled.is_set():
+            raise ExportCancelled(path)
+        # A large export can take longer than the usual request timeout
+        client = ClipStackClient(self.client.socket_path, timeout=None)
+        try:
+            return cast(int, client.request("export", path=os.path.abspath(path), format=fmt,
+                                            ids=sorted(selected_ids or [])))
+        finally:
+            client.close()
+
+    def import_file(self, path: str, fmt: Optional[str] = None,
+                    progress: Optional[Callable[[ImportReport], None]] = None) -> ImportReport:
+        """Have the daemon read and import ``path``; there is no progress."""
+        client = ClipStackClient(self.client.socket_path, timeout=None)
+        try:
+            return ImportReport(**client.request("import", path=os.path.abspath(path), format=fmt))
+        finally:
+            client.close()
+
+    def add_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        self._listeners.append(callback)
+        if self._event_thread is None:
+            self._event_thread = threading.Thread(target=self._stream_events, daemon=True)
+            self._event_thread.start()
+
+    def remove_listener(self, callback: Callable[[ChangeEvent], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _stream_events(self) -> None:
+        stream = ClipStackClient(self.client.socket_path, timeout=None)
+        try:
+            for data in stream.stream_events():
+                event = ChangeEvent(data["kind"], data.get("item_id"), data.get("item"),
+                                    data.get("group"))
+                for callback in list(self._listeners):
+                    callback(event)
+        except (ClipStackError, OSError, ValueError) as e:
+            print(f"Lost ClipStack daemon event stream: {e}")
+        finally:
+            stream.close()
+
+    def trim_memory(self) -> None:
+        """Free what this process can; the daemon trims its own memory."""
+        release_memory()
+
+    def close(self) -> None:
+        with self._lock:
+            self.client.close()
+
+
+# What the GUI and the workers it starts accept: a local history or a daemon's
+AnyClipboardManager = Union[ClipboardManager, RemoteClipboardManager]
+
+
+def run_daemon(clipboard_manager: ClipboardManager, socket_path: Optional[str] = None) -> None:
+    clipboard = create_clipboard_backend()
+    daemon = ClipStackDaemon(clipboard_manager, clipboard, socket_path)
+
+    def signal_handler(signum: int, frame: Any) -> None:
+        daemon.shutdown()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    print(f"ClipStack daemon listening on {daemon.socket_path}")
+    try:
+        daemon.serve_forever()
+    finally:
+        clipboard.close()
+        clipboard_manager.close()
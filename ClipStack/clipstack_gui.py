@@ -0,0 +1,1317 @@
+import customtkinter as ctk
+import tkinter as tk
+from tkinter import filedialog
+import os
+import datetime
+import time
+import atexit
+import sys
+import signal
+import platform
+import queue
+from typing import Iterator, List, Dict, Any, Callable, Optional, Sequence, Set, Union, overload
+
+from clipstack_cli import ClipStackError, format_stats
+from clipstack_core import (
+    EVENT_ADDED, EVENT_CLEARED, EVENT_REGROUPED, EVENT_RELOADED, EVENT_REMOVED, EVENT_TAGGED,
+    AnyClipboardManager, BackgroundClipboardMonitor,
+    ChangeEvent, ClipboardManager, ExportJob, MemoryMonitor,
+    RemoteClipboardManager, RetentionSweeper, SearchWorker,
+    apply_change_events, create_clipboard_backend, export_format_for, metrics,
+)
+
+HOTKEY = 'ctrl+alt+c'
+SEARCH_POLL_MS = 50
+ROW_HEIGHT = 64
+ROW_OVERSCAN = 3
+EVENT_DRAIN_MS = 100
+STATS_REFRESH_MS = 1000
+EXPORT_POLL_MS = 100
+# Under a memory budget, rows are released once the window has been hidden this long
+HIDDEN_TRIM_MS = 60_000
+ALL_TAGS = "All tags"
+EXPORT_FILETYPES = [
+    ("NDJSON", "*.ndjson"),
+    ("CSV", "*.csv"),
+    ("Text", "*.txt"),
+    ("JSON array", "*.json"),
+    ("SQLite database", "*.db"),
+]
+
+
+class HotkeyManager:
+    def __init__(self, app_callback: Optional[Callable[[], None]]):
+        self.hotkey_registered = False
+        self.app_callback = app_callback
+
+    def register(self) -> bool:
+        try:
+            import keyboard
+            keyboard.add_hotkey(HOTKEY, self._hotkey_activated)
+            self.hotkey_registered = True
+            return True
+        except Exception as e:
+            print(f"Failed to register hotkey {HOTKEY}: {e}")
+            return False
+
+    def unregister(self) -> None:
+        try:
+            if self.hotkey_registered:
+                import keyboard
+                keyboard.unhook_all_hotkeys()
+                self.hotkey_registered = False
+        except Exception as e:
+            print(f"Error unregistering hotkey: {e}")
+
+    def _hotkey_activated(self) -> None:
+        if self.app_callback:
+            try:
+                self.app_callback()
+            except Exception as e:
+                print(f"Error handling hotkey callback: {e}")
+
+
+ctk.set_appearance_mode("system")
+ctk.set_default_color_theme("blue")
+
+
+class ClipStackApp(ctk.CTk):    
+    def __init__(self, *args: Any, clipboard_manager: Optional[AnyClipboardManager] = None,
+                 started_at: Optional[float] = None, start_hidden: bool = False,
+                 report_timings: bool = False, exit_when_ready: bool = False,
+                 memory_budget: Optional[int] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        
+        self.started_at = started_at if started_at is not None else time.time()
+        self.report_timings = report_timings
+        self.exit_when_ready = exit_when_ready
+        self.timings: Dict[str, float] = {}
+        self._hotkey_pressed: Optional[float] = None
+        self._stats_window: Optional["StatsWindow"] = None
+        self._export_job: Optional[ExportJob] = None
+        
+        self.clipboard_manager = clipboard_manager or ClipboardManager()
+        self.clipboard = create_clipboard_backend()
+        self.background_monitor = BackgroundClipboardMonitor(
+            self.clipboard_manager, clipboard=self.clipboard
+        )
+        # A daemon-backed history is kept trimmed by the daemon
+        self.retention_sweeper: Optional[RetentionSweeper] = None
+        if isinstance(self.clipboard_manager, ClipboardManager):
+            self.retention_sweeper = RetentionSweeper(self.clipboard_manager)
+        # Watches this process's memory, also when the history is the daemon's
+        self.memory_monitor = None
+        if memory_budget is not None:
+            self.memory_monitor = MemoryMonitor(self.clipboard_manager, memory_budget)
+        self._trim_job: Optional[str] = None
+        # Set while rows are released for a hidden window
+        self._trimmed = False
+        self.hotkey_manager = HotkeyManager(self._hotkey_callback)
+        
+        self.selected_items: Set[int] = set()
+        # Rows currently shown (search results while searching), for Select All
+        self._displayed: Sequence[Dict[str, Any]] = []
+        self.search_worker = SearchWorker(self.clipboard_manager)
+        self._search_generation = 0
+        self._search_results: Optional[List[Dict[str, Any]]] = None
+        self._rows: List[Dict[str, Any]] = []
+        # Item id -> group key for near-duplicate clips, key -> member ids, and the
+        # groups shown expanded
+        self._groups: Dict[int, int] = {}
+        self._group_members: Dict[int, Set[int]] = {}
+        self._expanded: Set[int] = set()
+        self._events: "queue.Queue[ChangeEvent]" = queue.Queue()
+        self.clipboard_manager.add_listener(self._events.put)
+        
+        self._setup_window()
+        if start_hidden:
+            # Everything below is still built and rendered; the hotkey only maps it
+            self.withdraw()
+        self._setup_ui()
+        
+        self.protocol("WM_DELETE_WINDOW", self._hide_window)
+        self.bind("<Map>", self._on_map, add="+")
+        
+        self._setup_cleanup()
+        self.refresh_ui()
+        self.after_idle(self._on_ready)
+        self.after(EVENT_DRAIN_MS, self._drain_events)
+    
+    def _setup_window(self) -> None:
+        """Configure main window."""
+        self.title("ClipStack")
+        self.geometry("900x700")
+        self.minsize(600, 400)
+        
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+    
+    def _setup_ui(self) -> None:
+        """Setup user interface components."""
+        self.app_content = ctk.CTkFrame(self)
+        self.app_content.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
+        self.app_content.grid_rowconfigure(2, weight=1)
+        self.app_content.grid_columnconfigure(0, weight=1)
+        
+        self._setup_header()
+        self.status_label = ctk.CTkLabel(
+            self.app_content, 
+            text="", 
+            font=ctk.CTkFont(size=13, slant='italic')
+        )
+        self.status_label.grid(row=1, column=0, padx=10, pady=2, sticky="ew")
+        
+        self.history_list = VirtualHistoryList(self.app_content, row_factory=self._create_row)
+        self.history_list.grid(row=2, column=0, padx=10, pady=5, sticky="nsew")
+        
+        self._setup_export_progress()
+    
+    def _setup_export_progress(self) -> None:
+        """Progress bar and Cancel button, shown only while an export runs."""
+        self.export_frame = ctk.CTkFrame(self.app_content)
+        self.export_frame.grid(row=3, column=0, padx=10, pady=5, sticky="ew")
+        self.export_frame.grid_columnconfigure(1, weight=1)
+        self.export_label = ctk.CTkLabel(self.export_frame, text="")
+        self.export_label.grid(row=0, column=0, padx=10, pady=5)
+        self.export_progress = ctk.CTkProgressBar(self.export_frame)
+        self.export_progress.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
+        self.export_cancel = ctk.CTkButton(
+            self.export_frame,
+            text="Cancel",
+            width=80,
+            command=self._cancel_export
+        )
+        self.export_cancel.grid(row=0, column=2, padx=10, pady=5)
+        self.export_frame.grid_remove()
+    
+    def _create_row(self, parent: Any) -> "ClipboardItemWidget":
+        return ClipboardItemWidget(
+            parent,
+            copy_callback=self._copy_item,
+            delete_callback=self._delete_item,
+            pin_callback=self._pin_item,
+            unpin_callback=self._unpin_item,
+            select_callback=self._select_item,
+            group_callback=self._toggle_group
+        )
+    
+    def _setup_header(self) -> None:
+        header_frame = ctk.CTkFrame(self.app_content)
+        header_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
+        header_frame.grid_columnconfigure(1, weight=1)
+        
+        title_label = ctk.CTkLabel(
+            header_frame, 
+            text="📋 ClipStack", 
+            font=ctk.CTkFont(family="monospace", size=20, weight="bold")
+        )
+        title_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
+        
+        search_frame = ctk.CTkFrame(header_frame, fg_color="transparent")
+        search_frame.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
+        search_frame.grid_columnconfigure(0, weight=1)
+        
+        self.search_var = ctk.StringVar()
+        self.search_entry = ctk.CTkEntry(
+            search_frame,
+            textvariable=self.search_var,
+            placeholder_text="Search history..."
+        )
+        self.search_entry.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        self.search_var.trace_add("write", lambda *_: self._on_search_changed())
+        
+        self.search_mode = ctk.CTkSegmentedButton(
+            search_frame,
+            values=["Substring", "Fuzzy"],
+            command=lambda _: self._on_search_changed()
+        )
+        self.search_mode.grid(row=0, column=1, padx=5, pady=5)
+        self.search_mode.set("Substring")
+        
+        # Shows only items with the chosen tag, e.g. url or secret
+        self.tag_filter = ctk.CTkOptionMenu(
+            search_frame,
+            values=[ALL_TAGS],
+            width=120,
+            command=lambda _: self._on_search_changed()
+        )
+        self.tag_filter.grid(row=0, column=2, padx=5, pady=5)
+        self.tag_filter.set(ALL_TAGS)
+        
+        buttons_frame = ctk.CTkFrame(header_frame)
+        buttons_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        
+        self.select_all_var = ctk.BooleanVar()
+        select_all_cb = ctk.CTkCheckBox(
+            buttons_frame, 
+            text="Select All", 
+            variable=self.select_all_var, 
+            command=self._toggle_select_all
+        )
+        select_all_cb.grid(row=0, column=0, padx=5, pady=5)
+        
+        export_selected_btn = ctk.CTkButton(
+            buttons_frame, 
+            text="Export Selected...", 
+            command=self._export_selected
+        )
+        export_selected_btn.grid(row=0, column=1, padx=5, pady=5)
+        
+        export_all_btn = ctk.CTkButton(
+            buttons_frame, 
+            text="Export All...", 
+            command=self._export_all
+        )
+        export_all_btn.grid(row=0, column=2, padx=5, pady=5)
+        
+        clear_btn = ctk.CTkButton(
+            buttons_frame, 
+            text="Clear History", 
+            command=self._clear_history
+        )
+        clear_btn.grid(row=0, column=3, padx=5, pady=5)
+        
+        refresh_btn = ctk.CTkButton(
+            buttons_frame, 
+            text="Refresh", 
+            command=self.refresh_ui
+        )
+        refresh_btn.grid(row=0, column=4, padx=5, pady=5)
+        
+        stats_btn = ctk.CTkButton(
+            buttons_frame, 
+            text="Stats", 
+            command=self._show_stats
+        )
+        stats_btn.grid(row=0, column=5, padx=5, pady=5)
+        
+        self.theme_selector = ctk.CTkOptionMenu(
+            buttons_frame,
+            values=["System", "Dark", "Light"],
+            command=self._change_theme
+        )
+        self.theme_selector.grid(row=0, column=6, padx=5, pady=5)
+        self.theme_selector.set("System")
+        
+        # Actions on the selected items; each is one batch write and one re-render
+        for column, (text, command) in enumerate((
+            ("Copy Selected", self._copy_selected),
+            ("Pin Selected", self._pin_selected),
+            ("Unpin Selected", self._unpin_selected),
+            ("Tag Selected...", self._tag_selected),
+            ("Delete Selected", self._delete_selected),
+        ), start=1):
+            ctk.CTkButton(
+                buttons_frame,
+                text=text,
+                command=command
+            ).grid(row=1, column=column, padx=5, pady=5)
+    
+    def _start_background_services(self) -> None:
+        # A daemon-backed history is already being captured by the daemon
+        if not self.clipboard_manager.is_remote:
+            self.background_monitor.start_tracking()
+        if self.retention_sweeper is not None:
+            self.retention_sweeper.start()
+        if self.memory_monitor is not None:
+            self.memory_monitor.start()
+        if not self.hotkey_manager.register():
+            self._update_status("Warning: Could not register global hotkey")
+    
+    def _stop_background_services(self) -> None:
+        if self._export_job is not None:
+            self._export_job.cancel()
+        self.search_worker.stop()
+        self.background_monitor.stop_tracking()
+        if self.retention_sweeper is not None:
+            self.retention_sweeper.stop()
+        if self.memory_monitor is not None:
+            self.memory_monitor.stop()
+        self.hotkey_manager.unregister()
+    
+    def _setup_cleanup(self) -> None:
+        def cleanup() -> None:
+            self._stop_background_services()
+            self.clipboard.close()
+            self.clipboard_manager.close()
+        
+        atexit.register(cleanup)
+        
+        def signal_handler(signum: int, frame: Any) -> None:
+            cleanup()
+            sys.exit(0)
+        
+        signal.signal(signal.SIGINT, signal_handler)
+        if hasattr(signal, 'SIGTERM') and platform.system() != 'Windows':
+            signal.signal(signal.SIGTERM, signal_handler)
+    
+    def _hide_window(self) -> None:
+        self.withdraw()
+        self._schedule_trim()
+    
+    def _schedule_trim(self) -> None:
+        if self.memory_monitor is None or self._trim_job is not None:
+            return
+        self._trim_job = self.after(HIDDEN_TRIM_MS, self._trim_hidden)
+    
+    def _trim_hidden(self) -> None:
+        """Release the row widgets and loaded history while the window stays hidden."""
+        self._trim_job = None
+        if self.winfo_viewable():
+            return
+        self._trimmed = True
+        self._rows = []
+        self._displayed = []
+        self._search_results = None
+        self.history_list.release()
+        self.clipboard_manager.trim_memory()
+        metrics.incr("ui.trims")
+    
+    def _restore_rows(self) -> None:
+        """Reload what ``_trim_hidden`` released, before the window is shown."""
+        self._trimmed = False
+        self.refresh_ui()
+        if self._filtering():
+            self._on_search_changed()
+    
+    def _on_ready(self) -> None:
+        self._record_timing("start_to_ready", (time.time() - self.started_at) * 1000)
+        if self.exit_when_ready:
+            self.quit()
+            return
+        # Importing keyboard and starting the watcher wait until the window is usable
+        self._start_background_services()
+        if not self.winfo_viewable():
+            self._schedule_trim()
+    
+    def _record_timing(self, name: str, milliseconds: float) -> None:
+        self.timings[name] = milliseconds
+        if self.report_timings:
+            print(f"Timing: {name} {milliseconds:.1f}ms")
+    
+    def _hotkey_callback(self) -> None:
+        # Called on the keyboard hook thread; the toggle itself runs in the Tk loop
+        self._hotkey_pressed = time.perf_counter()
+        self.after(0, self._toggle_window)
+    
+    def _toggle_window(self) -> None:
+        try:
+            if self.state() == 'withdrawn' or not self.winfo_viewable():
+                if self._trim_job is not None:
+                    self.after_cancel(self._trim_job)
+                    self._trim_job = None
+                if self._trimmed:
+                    self._restore_rows()
+                else:
+                    # Rows are kept current while hidden, so only a few events can be pending
+                    self._apply_pending_events()
+                self.deiconify()
+                self.lift()
+                self.focus_force()
+            else:
+                self._hotkey_pressed = None
+                self._hide_window()
+        except Exception as e:
+            print(f"Hotkey callback error: {e}")
+    
+    def _on_map(self, event: Any) -> None:
+        if event.widget is not self or self._hotkey_pressed is None:
+            return
+        pressed, self._hotkey_pressed = self._hotkey_pressed, None
+        # Idle callbacks run after the first redraw of the mapped window
+        self.after_idle(lambda: self._record_timing(
+            "hotkey_to_visible", (time.perf_counter() - pressed) * 1000
+        ))
+    
+    def _change_theme(self, theme: str) -> None:
+        theme_map = {
+            "Dark": "dark",
+            "Light": "light", 
+            "System": "system"
+        }
+        ctk.set_appearance_mode(theme_map.get(theme, "system"))
+    
+    def _show_stats(self) -> None:
+        if self._stats_window is not None and self._stats_window.winfo_exists():
+            self._stats_window.lift()
+            return
+        self._stats_window = StatsWindow(self)
+    
+    def _update_status(self, message: str) -> None:
+        self.status_label.configure(text=message)
+    
+    def _selected_tag(self) -> Optional[str]:
+        tag = self.tag_filter.get()
+        return None if tag == ALL_TAGS else tag
+    
+    def _filtering(self) -> bool:
+        return bool(self.search_var.get().strip()) or self._selected_tag() is not None
+    
+    def _update_tag_filter(self) -> None:
+        """Offer the tags currently in use; drop the filter if its tag is gone."""
+        try:
+            tags = sorted(self.clipboard_manager.tag_counts())
+        except ClipStackError:
+            return
+        self.tag_filter.configure(values=[ALL_TAGS] + tags)
+        if self._selected_tag() not in (None, *tags):
+            self.tag_filter.set(ALL_TAGS)
+            self._on_search_changed()
+    
+    def _on_search_changed(self) -> None:
+        query = self.search_var.get()
+        tag = self._selected_tag()
+        if not query.strip() and tag is None:
+            self._search_generation = self.search_worker.submit("")
+            self._search_results = None
+            self._render_rows()
+            return
+        mode = self.search_mode.get().lower()
+        self._search_generation = self.search_worker.submit(query, mode, tag)
+        self.after(SEARCH_POLL_MS, self._poll_search_results)
+    
+    def _poll_search_results(self) -> None:
+        if self._trimmed:
+            # Searched again when the window is shown
+            return
+        latest = None
+        while True:
+            try:
+                latest = self.search_worker.results.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None and latest[0] == self._search_generation:
+            self._search_results = latest[2]
+            self._render_rows()
+        elif self._filtering():
+            self.after(SEARCH_POLL_MS, self._poll_search_results)
+    
+    def _toggle_select_all(self) -> None:
+        select_all = self.select_all_var.get()
+        
+        if select_all:
+            self.selected_items = {item['id'] for item in self._displayed}
+        else:
+            self.selected_items.clear()
+        
+        self._render_rows()
+    
+    def _select_item(self, item_id: int, selected: bool) -> None:
+        if selected:
+            self.selected_items.add(item_id)
+        else:
+            self.selected_items.discard(item_id)
+        
+        self._update_status(f"Selected {len(self.selected_items)} items")
+    
+    def _copy_item(self, item_id: int) -> None:
+        content = self.clipboard_manager.get_content(item_id)
+        if content is None:
+            return
+        try:
+            self.clipboard.copy(content)
+            self._update_status(f"Copied item {item_id} to clipboard")
+        except Exception as e:
+            self._update_status(f"Error copying item: {e}")
+    
+    def _delete_item(self, item_id: int) -> None:
+        self.clipboard_manager.remove_item(item_id)
+        self.selected_items.discard(item_id)
+        self._apply_pending_events()
+        self._update_status(f"Item {item_id} deleted")
+    
+    def _pin_item(self, item_id: int) -> None:
+        self.clipboard_manager.pin_item(item_id)
+        self._apply_pending_events()
+        self._update_status(f"Item {item_id} pinned")
+    
+    def _unpin_item(self, item_id: int) -> None:
+        self.clipboard_manager.unpin_item(item_id)
+        self._apply_pending_events()
+        self._update_status(f"Item {item_id} unpinned")
+    
+    def _selection(self) -> Optional[Set[int]]:
+        if not self.selected_items:
+            self._update_status("No items selected")
+            return None
+        return set(self.selected_items)
+    
+    def _copy_selected(self) -> None:
+        selected = self._selection()
+        if selected is None:
+            return
+        try:
+            self.clipboard.copy(self.clipboard_manager.concatenated_content(selected))
+            self._update_status(f"Copied {len(selected)} items to clipboard")
+        except Exception as e:
+            self._update_status(f"Error copying items: {e}")
+    
+    def _pin_selected(self) -> None:
+        selected = self._selection()
+        if selected is None:
+            return
+        self.clipboard_manager.pin_items(selected)
+        self._apply_pending_events()
+        self._update_status(f"Pinned {len(selected)} items")
+    
+    def _unpin_selected(self) -> None:
+        selected = self._selection()
+        if selected is None:
+            return
+        self.clipboard_manager.unpin_items(selected)
+        self._apply_pending_events()
+        self._update_status(f"Unpinned {len(selected)} items")
+    
+    def _tag_selected(self) -> None:
+        selected = self._selection()
+        if selected is None:
+            return
+        tag = ctk.CTkInputDialog(
+            title="Tag Selected",
+            text=f"Tag to add to {len(selected)} items:"
+        ).get_input()
+        if not tag or not tag.strip():
+            return
+        self.clipboard_manager.tag_items(selected, [tag])
+        self._apply_pending_events()
+        self._update_status(f"Tagged {len(selected)} items with {tag.strip()}")
+    
+    def _delete_selected(self) -> None:
+        selected = self._selection()
+        if selected is None:
+            return
+        if len(selected) > 1:
+            result = self._message_box(
+                title="Delete Selected",
+                message=f"Delete {len(selected)} selected items?",
+                option_1="Yes",
+                option_2="No"
+            ).get()
+            if result != "Yes":
+                return
+        self.clipboard_manager.remove_items(selected)
+        self.selected_items -= selected
+        self._apply_pending_events()
+        self._update_status(f"Deleted {len(selected)} items")
+    
+    def _message_box(self, **kwargs: Any) -> Any:
+        # CTkMessagebox takes ~100ms to import and most sessions never open one
+        import CTkMessagebox
+        return CTkMessagebox.CTkMessagebox(**kwargs)
+    
+    def _clear_history(self) -> None:
+        result = self._message_box(
+            title="Clear History",
+            message="Are you sure you want to clear all clipboard history?",
+            option_1="Yes",
+            option_2="No"
+        ).get()
+        
+        if result == "Yes":
+            self.clipboard_manager.clear_history()
+            self.selected_items.clear()
+            self._apply_pending_events()
+            self._update_status("History cleared successfully")
+        else:
+            self._update_status("History preserved")
+    
+    def _export_selected(self) -> None:
+        if not self.selected_items:
+            self._message_box(
+                title="No Selection",
+                message="Please select items to export",
+                icon="warning"
+            )
+            return
+        self._start_export(set(self.selected_items))
+    
+    def _export_all(self) -> None:
+        self._start_export(None)
+    
+    def _start_export(self, selected_ids: Optional[Set[int]]) -> None:
+        if self._export_job is not None and not self._export_job.finished.is_set():
+            self._update_status("An export is already running")
+            return
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="Export ClipStack history",
+            initialfile=f"clipstack_export_{timestamp}.ndjson",
+            defaultextension=".ndjson",
+            filetypes=EXPORT_FILETYPES
+        )
+        if not path:
+            return
+        fmt = export_format_for(path)
+        if fmt is None:
+            self._message_box(
+                title="Unknown Format",
+                message="Choose a .ndjson, .csv, .txt, .json or .db file name",
+                icon="warning"
+            )
+            return
+        self._export_job = ExportJob(self.clipboard_manager, path, fmt, selected_ids).start()
+        self.export_label.configure(text=f"Exporting to {os.path.basename(path)}")
+        self.export_progress.set(0)
+        self.export_cancel.configure(state="normal")
+        self.export_frame.grid()
+        self.after(EXPORT_POLL_MS, self._poll_export)
+    
+    def _cancel_export(self) -> None:
+        if self._export_job is not None:
+            self._export_job.cancel()
+            self.export_cancel.configure(state="disabled")
+            self._update_status("Cancelling export...")
+    
+    def _poll_export(self) -> None:
+        job = self._export_job
+        if job is None:
+            return
+        if not job.finished.is_set():
+            if job.total:
+                self.export_progress.set(job.done / job.total)
+                self.export_label.configure(
+                    text=f"Exporting {job.done:,}/{job.total:,} to {os.path.basename(job.path)}"
+                )
+            self.after(EXPORT_POLL_MS, self._poll_export)
+            return
+        self.export_frame.grid_remove()
+        self._export_job = None
+        if job.error is not None:
+            self._update_status(f"Export failed: {job.error}")
+        elif job.written is None:
+            self._update_status("Export cancelled")
+        else:
+            self._update_status(f"Exported {job.written:,} items to {job.path}")
+    
+    def _drain_events(self) -> None:
+        self._apply_pending_events()
+        self.after(EVENT_DRAIN_MS, self._drain_events)
+    
+    def _apply_pending_events(self) -> None:
+        """Fold queued change events into the row list and re-render once."""
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+        if not events or self._trimmed:
+            # Released rows are reloaded in full when the window is shown
+            return
+        if any(event.kind == EVENT_RELOADED for event in events):
+            # Another instance compacted history this one had not caught up with
+            self.refresh_ui()
+            return
+        with metrics.timer("ui.apply_events"):
+            self._rows = apply_change_events(self._rows, events)
+            removed = {event.item_id for event in events if event.kind == EVENT_REMOVED}
+            if any(event.kind == EVENT_CLEARED for event in events):
+                self.selected_items.clear()
+            else:
+                self.selected_items -= removed
+            if any(event.kind in (EVENT_ADDED, EVENT_TAGGED, EVENT_REMOVED, EVENT_CLEARED)
+                   for event in events):
+                self._update_tag_filter()
+            self._apply_group_events(events)
+            if self._search_results is not None and self._filtering():
+                # Added or retagged items may now match the active query or tag
+                if any(event.kind in (EVENT_ADDED, EVENT_TAGGED) for event in events):
+                    self._on_search_changed()
+            self._render_rows()
+        metrics.incr("ui.events_applied", len(events))
+    
+    def refresh_ui(self) -> None:
+        """Reload the full history from storage and re-render."""
+        with metrics.timer("ui.refresh"):
+            while True:
+                try:
+                    self._events.get_nowait()
+                except queue.Empty:
+                    break
+            self._rows = self.clipboard_manager.load_history()
+            # Keep the selection, minus anything deleted elsewhere
+            self.selected_items &= {item['id'] for item in self._rows}
+            self._update_tag_filter()
+            self._update_groups()
+            self._render_rows()
+    
+    def _update_groups(self) -> None:
+        """Re-read every group of similar clips, e.g. after a reload."""
+        try:
+            groups = self.clipboard_manager.similar_groups()
+        except ClipStackError:
+            return
+        self._groups = groups
+        self._group_members = {}
+        for item_id, key in groups.items():
+            self._group_members.setdefault(key, set()).add(item_id)
+        self._expanded &= self._group_members.keys()
+    
+    def _apply_group_events(self, events: List[ChangeEvent]) -> None:
+        """Follow the groups of similar clips through a burst of change events."""
+        if any(event.kind == EVENT_REGROUPED for event in events):
+            self._update_groups()
+            return
+        for event in events:
+            if event.kind == EVENT_CLEARED:
+                self._groups.clear()
+                self._group_members.clear()
+            elif event.kind == EVENT_ADDED and event.group is not None and event.item_id is not None:
+                members = self._group_members.get(event.group)
+                if members is None:
+                    # A new group is keyed by its base, the clip the added one matched
+                    members = self._group_members[event.group] = {event.group}
+                    self._groups[event.group] = event.group
+                members.add(event.item_id)
+                self._groups[event.item_id] = event.group
+            elif event.kind == EVENT_REMOVED and event.item_id is not None:
+                key = self._groups.pop(event.item_id, None)
+                if key is None:
+                    continue
+                members = self._group_members[key]
+                members.discard(event.item_id)
+                if len(members) < 2:
+                    # The clip left on its own is no longer grouped
+                    for member in members:
+                        del self._groups[member]
+                    del self._group_members[key]
+        self._expanded &= self._group_members.keys()
+    
+    def _toggle_group(self, item_id: int) -> None:
+        key = self._groups.get(item_id)
+        if key is None:
+            return
+        self._expanded.symmetric_difference_update({key})
+        self._render_rows()
+    
+    def _group_items(self, item_id: int) -> List[Dict[str, Any]]:
+        try:
+            return self.clipboard_manager.similar_items(item_id)
+        except ClipStackError:
+            return []
+    
+    def _render_rows(self) -> None:
+        results = self._search_results if self._filtering() else None
+        searching = results is not None
+        if results is not None:
+            # Re-resolve results so rows deleted or pinned since the query ran are current
+            current = (self.clipboard_manager.get_item(item['id']) for item in results)
+            history = [item for item in current if item is not None]
+        else:
+            history = self._rows
+        shown: Sequence[Dict[str, Any]] = history
+        sizes: Dict[int, int] = {}
+        variants: Set[int] = set()
+        group_count = 0
+        if not searching and self._group_members:
+            folded = CollapsedRows(history, self._groups, self._group_members, self._expanded,
+                                   self._group_items)
+            shown, sizes, variants = folded, folded.sizes, folded.variants
+            group_count = folded.group_count
+        self._displayed = shown
+        
+        if searching and not shown:
+            query = self.search_var.get().strip()
+            tag = self._selected_tag()
+            if not query:
+                self.history_list.show_empty(f"🏷 No items tagged #{tag}")
+            elif tag is not None:
+                self.history_list.show_empty(f"🔍 No items tagged #{tag} match \"{query}\"")
+            else:
+                self.history_list.show_empty(f"🔍 No items match \"{query}\"")
+            self._update_status("No matching items")
+            return
+        
+        if not shown:
+            self.history_list.show_empty(
+                "📋 No clipboard items yet\n\nCopy some text to get started!\nPress Ctrl+Alt+C to show/hide this window"
+            )
+            self._update_status("No items in clipboard history")
+            return
+        
+        self.history_list.set_items(shown, self.selected_items, sizes, variants)
+        metrics.gauge("ui.rows", len(shown))
+        
+        if searching:
+            self._update_status(
+                f"🔍 {len(shown)} matching items ({len(self.selected_items)} selected)"
+            )
+            return
+        # Pinned rows sort first, so counting stops at the first unpinned one
+        pinned_count = next(
+            (i for i, item in enumerate(history) if not item.get('pinned')), len(history)
+        )
+        grouped = f", {group_count} groups of similar clips" if group_count else ""
+        self._update_status(
+            f"📋 {len(self._rows)} items ({pinned_count} pinned{grouped}, "
+            f"{len(self.selected_items)} selected)"
+        )
+
+
+class StatsWindow(ctk.CTkToplevel):
+    """Live view of the hot-path metrics, refreshed while it is open."""
+
+    def __init__(self, app: ClipStackApp):
+        super().__init__(app)
+        self.app = app
+        self.title("ClipStack Stats")
+        self.geometry("780x520")
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        
+        controls = ctk.CTkFrame(self)
+        controls.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.enabled_var = ctk.BooleanVar(value=metrics.enabled)
+        ctk.CTkCheckBox(
+            controls,
+            text="Collect metrics",
+            variable=self.enabled_var,
+            command=self._toggle_metrics
+        ).grid(row=0, column=0, padx=5, pady=5)
+        ctk.CTkButton(
+            controls,
+            text="Profile next refresh",
+            command=self._profile_refresh
+        ).grid(row=0, column=1, padx=5, pady=5)
+        ctk.CTkButton(
+            controls,
+            text="Profile next save",
+            command=self._profile_save
+        ).grid(row=0, column=2, padx=5, pady=5)
+        ctk.CTkButton(
+            controls,
+            text="Reset",
+            command=self._reset
+        ).grid(row=0, column=3, padx=5, pady=5)
+        
+        self.text = ctk.CTkTextbox(self, wrap="none", font=ctk.CTkFont(family="monospace", size=12))
+        self.text.grid(row=1, column=0, padx=10, pady=(5, 10), sticky="nsew")
+        self._update()
+    
+    def _toggle_metrics(self) -> None:
+        metrics.enabled = self.enabled_var.get()
+        if self.app.clipboard_manager.is_remote:
+            self._daemon_stats(enable=metrics.enabled)
+    
+    def _profile_refresh(self) -> None:
+        metrics.profile_next("ui.refresh")
+        self.app.refresh_ui()
+    
+    def _profile_save(self) -> None:
+        # Saves happen wherever the history lives, so profile the daemon if there is one
+        if isinstance(self.app.clipboard_manager, RemoteClipboardManager):
+            self.app.clipboard_manager.profile_next("history.save")
+        else:
+            metrics.profile_next("history.save")
+    
+    def _reset(self) -> None:
+        metrics.reset()
+        if self.app.clipboard_manager.is_remote:
+            self._daemon_stats(reset=True)
+    
+    def _daemon_stats(self, **params: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(self.app.clipboard_manager, RemoteClipboardManager):
+            return None
+        try:
+            return self.app.clipboard_manager.stats(**params)
+        except ClipStackError as e:
+            print(f"Could not query daemon stats: {e}")
+            return None
+    
+    def _update(self) -> None:
+        if not self.winfo_exists():
+            return
+        sections = [format_stats(metrics.snapshot())]
+        if self.app.clipboard_manager.is_remote:
+            daemon_stats = self._daemon_stats()
+            if daemon_stats is not None:
+                sections.append("Daemon\n" + format_stats(daemon_stats))
+        top = self.text.yview()[0]
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", "\n\n".join(sections))
+        self.text.configure(state="disabled")
+        self.text.yview_moveto(top)
+        self.after(STATS_REFRESH_MS, self._update)
+
+
+class CollapsedRows(Sequence[Dict[str, Any]]):
+    """History rows with each group of similar unpinned clips shown as its newest clip.
+
+    Rows are folded only as far as they are read, so showing the top of a long
+    history never walks all of it. The members of an expanded group, fetched
+    with ``members_of``, are shown under its head.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], groups: Dict[int, int],
+                 group_members: Dict[int, Set[int]], expanded: Set[int],
+                 members_of: Callable[[int], List[Dict[str, Any]]]):
+        self.rows = rows
+        self.groups = groups
+        self.expanded = expanded
+        self.members_of = members_of
+        # Pinned rows sort first and are never folded
+        pinned_count = next(
+            (i for i, item in enumerate(rows) if not item.get('pinned')), len(rows)
+        )
+        pinned = {item['id'] for item in rows[:pinned_count]}
+        # Group key -> how many unpinned clips it holds, for groups that fold
+        self._group_sizes: Dict[int, int] = {}
+        for key, members in group_members.items():
+            size = len(members - pinned) if pinned else len(members)
+            if size > 1:
+                self._group_sizes[key] = size
+        self.group_count = len(self._group_sizes)
+        # Each folded head's group size, and ids of rows shown under an expanded head,
+        # as far as rows have been folded
+        self.sizes: Dict[int, int] = {}
+        self.variants: Set[int] = set()
+        self._shown = rows[:pinned_count]
+        self._next = pinned_count
+        self._heads: Set[int] = set()
+        self._length = len(rows) - sum(size - 1 for key, size in self._group_sizes.items()
+                                       if key not in expanded)
+
+    def _fold(self, count: Optional[int] = None) -> None:
+        """Fold rows until ``count`` are shown (all of them if None) or the rows run out."""
+        rows, shown = self.rows, self._shown
+        while (count is None or len(shown) < count) and self._next < len(rows):
+            item = rows[self._next]
+            self._next += 1
+            key = self.groups.get(item['id'])
+            if key is None or key not in self._group_sizes:
+                shown.append(item)
+            elif key not in self._heads:
+                self._heads.add(key)
+                self.sizes[item['id']] = self._group_sizes[key]
+                shown.append(item)
+                if key in self.expanded:
+                    members = [member for member in self.members_of(item['id'])
+                               if member['id'] != item['id'] and not member.get('pinned')]
+                    members.sort(key=lambda member: (member['timestamp'], member['id']),
+                                 reverse=True)
+                    shown.extend(members)
+                    self.variants.update(member['id'] for member in members)
+        if self._next == len(rows):
+            # Exact now, should the groups have disagreed with the rows
+            self._length = len(shown)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> Dict[str, Any]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Dict[str, Any]]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(index, slice):
+            self._fold(None if index.stop is None or index.stop < 0 else index.stop)
+        else:
+            self._fold(None if index < 0 else index + 1)
+        return self._shown[index]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self._fold()
+        return iter(self._shown)
+
+
+class VirtualHistoryList(ctk.CTkFrame):
+    """Scrollable history list that only renders the rows in view.
+
+    A fixed pool of row widgets (visible rows plus a small overscan) is built
+    once and rebound to whichever items fall inside the viewport as the user
+    scrolls, so rendering cost does not grow with history size.
+    """
+
+    def __init__(self, parent: Any, row_factory: Callable[[Any], "ClipboardItemWidget"],
+                 row_height: int = ROW_HEIGHT, overscan: int = ROW_OVERSCAN):
+        super().__init__(parent)
+        self.row_factory = row_factory
+        self.row_height = row_height
+        self.overscan = overscan
+        self.items: Sequence[Dict[str, Any]] = []
+        self.selected: Set[int] = set()
+        # Group sizes by head row id, and ids of rows shown under an expanded head
+        self.group_sizes: Dict[int, int] = {}
+        self.variants: Set[int] = set()
+        self.first_index = 0
+        self.rows: List[ClipboardItemWidget] = []
+        
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, padx=(0, 2), pady=2, sticky="ns")
+        self.empty_label = ctk.CTkLabel(
+            self.body,
+            text="",
+            font=ctk.CTkFont(size=14),
+            text_color="gray"
+        )
+        
+        self.body.bind("<Configure>", lambda e: self._ensure_pool())
+        self._bind_scroll(self.body)
+    
+    def _bind_scroll(self, widget: Any) -> None:
+        widget.bind("<MouseWheel>", self._on_mousewheel)
+        widget.bind("<Button-4>", lambda e: self.scroll_by(-1))
+        widget.bind("<Button-5>", lambda e: self.scroll_by(1))
+    
+    def _visible_count(self) -> int:
+        if self.body.winfo_ismapped():
+            height = self.body.winfo_height()
+        else:
+            # Not laid out yet (e.g. started hidden): size the pool for the
+            # screen so showing the window never has to build rows
+            height = self.winfo_screenheight()
+        return int(-(-max(height, self.row_height) // self.row_height))
+    
+    def _ensure_pool(self) -> None:
+        needed = self._visible_count() + self.overscan
+        while len(self.rows) < needed:
+            row = self.row_factory(self.body)
+            for widget in row.scroll_targets():
+                self._bind_scroll(widget)
+            self.rows.append(row)
+        metrics.gauge("ui.row_widgets", len(self.rows))
+        self._render()
+    
+    def release(self) -> None:
+        """Destroy the row pool and drop the items; ``set_items`` rebuilds both."""
+        for row in self.rows:
+            row.destroy()
+        self.rows = []
+        self.items = []
+        self.first_index = 0
+        metrics.gauge("ui.row_widgets", 0)
+    
+    def set_items(self, items: Sequence[Dict[str, Any]], selected: Set[int],
+                  group_sizes: Optional[Dict[int, int]] = None,
+                  variants: Optional[Set[int]] = None) -> None:
+        """Show ``items``; only the rows in view are read, e.g. from a CollapsedRows.
+
+        ``group_sizes`` and ``variants`` are looked up per shown row, so they may
+        fill in as the rows are read.
+        """
+        self.items = items
+        self.selected = selected
+        self.group_sizes = group_sizes if group_sizes is not None else {}
+        self.variants = variants if variants is not None else set()
+        self.empty_label.place_forget()
+        self.first_index = min(self.first_index, self._max_first_index())
+        self._ensure_pool()
+    
+    def show_empty(self, text: str) -> None:
+        self.items = []
+        self.first_index = 0
+        self._render()
+        self.empty_label.configure(text=text)
+        self.empty_label.place(relx=0.5, y=50, anchor="n")
+    
+    def _max_first_index(self) -> int:
+        return max(0, len(self.items) - self._visible_count() + 1)
+    
+    def scroll_by(self, rows: int) -> None:
+        self.scroll_to(self.first_index + rows)
+    
+    def scroll_to(self, index: int) -> None:
+        index = max(0, min(index, self._max_first_index()))
+        if index != self.first_index:
+            self.first_index = index
+            self._render()
+    
+    def _on_mousewheel(self, event: Any) -> None:
+        if event.delta:
+            # Windows reports multiples of 120, macOS small deltas
+            step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+            self.scroll_by(-step)
+    
+    def _on_scrollbar(self, *args: str) -> None:
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.items)))
+        elif args[0] == "scroll":
+            amount = int(float(args[1]))
+            if len(args) > 2 and args[2] == "pages":
+                amount *= max(1, self._visible_count() - 1)
+            self.scroll_by(amount)
+    
+    def _render(self) -> None:
+        window = self.items[self.first_index:self.first_index + len(self.rows)]
+        for slot, row in enumerate(self.rows):
+            if slot < len(window):
+                item = window[slot]
+                row.bind_item(item, item['id'] in self.selected,
+                              self.group_sizes.get(item['id'], 0), item['id'] in self.variants)
+                row.place(x=0, y=slot * self.row_height, relwidth=1.0)
+            else:
+                row.unbind_item()
+                row.place_forget()
+        total = len(self.items)
+        if total:
+            visible = self._visible_count()
+            self.scrollbar.set(self.first_index / total,
+                               min(1.0, (self.first_index + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+class ClipboardItemWidget(ctk.CTkFrame):    
+    def __init__(self, parent: Any, copy_callback: Callable[[int], None],
+                 delete_callback: Callable[[int], None], pin_callback: Callable[[int], None],
+                 unpin_callback: Callable[[int], None], select_callback: Callable[[int, bool], None],
+                 group_callback: Optional[Callable[[int], None]] = None,
+                 height: int = ROW_HEIGHT):
+        super().__init__(parent, height=height - 4)
+        
+        # Only what the row's callbacks need, so rows do not keep history items alive
+        self.item_id: Optional[int] = None
+        self.pinned = False
+        # Size of the group of similar clips this row heads, 0 if none
+        self.group_size = 0
+        self._bound_state: Optional[tuple] = None
+        self.copy_callback = copy_callback
+        self.delete_callback = delete_callback
+        self.pin_callback = pin_callback
+        self.unpin_callback = unpin_callback
+        self.select_callback = select_callback
+        self.group_callback = group_callback
+        
+        self._setup_ui()
+        self._setup_bindings()
+    
+    def _setup_ui(self) -> None:
+        self.grid_propagate(False)
+        self.grid_columnconfigure(1, weight=1)
+        self.select_var = ctk.BooleanVar()
+        self.checkbox = ctk.CTkCheckBox(
+            self, 
+            text="", 
+            variable=self.select_var, 
+            width=20,
+            command=self._on_selection_change
+        )
+        self.checkbox.grid(row=0, column=0, padx=5, pady=2, sticky="nw")
+        self.content_frame = ctk.CTkFrame(self)
+        self.content_frame.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.content_frame.grid_columnconfigure(0, weight=1)
+        self.time_label = ctk.CTkLabel(
+            self.content_frame,
+            text="",
+            font=ctk.CTkFont(size=10),
+            text_color="gray",
+            height=16
+        )
+        self.time_label.grid(row=0, column=0, padx=5, pady=0, sticky="w")
+        self.content_font = ctk.CTkFont(size=12, weight="normal")
+        self.content_label = ctk.CTkLabel(
+            self.content_frame,
+            text="",
+            font=self.content_font,
+            anchor="w",
+            justify="left",
+            height=20
+        )
+        self.content_label.grid(row=1, column=0, padx=5, pady=0, sticky="ew")
+    
+    def bind_item(self, item_data: Dict[str, Any], selected: bool, group_size: int = 0,
+                  variant: bool = False) -> None:
+        """Point this row at another history item, skipping no-op updates."""
+        self.item_id = item_data['id']
+        self.pinned = pinned = bool(item_data.get('pinned'))
+        self.group_size = group_size
+        tags = item_data.get('tags') or ()
+        state = (item_data['id'], pinned, selected, item_data.get('formatted_time'),
+                 item_data.get('preview'), tuple(tags), group_size, variant)
+        if state == self._bound_state:
+            return
+        self._bound_state = state
+        pin_indicator = "📌 " if pinned else ""
+        tag_text = "".join(f"  #{tag}" for tag in tags)
+        group_text = f"  ⧉ {group_size - 1} similar" if group_size else ""
+        self.time_label.configure(
+            text=f"{pin_indicator}{item_data.get('formatted_time', 'Unknown')}{tag_text}{group_text}"
+        )
+        # Rows have a fixed height, so multi-line previews are shown on one line
+        preview = item_data.get('preview', '').replace("\r", "").replace("\n", " ↵ ")
+        if variant:
+            preview = "↳ " + preview
+        self.content_label.configure(text=preview)
+        self.content_font.configure(weight="bold" if pinned else "normal")
+        self.select_var.set(selected)
+    
+    def unbind_item(self) -> None:
+        self.item_id = None
+        self.group_size = 0
+        self._bound_state = None
+    
+    def scroll_targets(self) -> List[Any]:
+        return [self, self.content_frame, self.time_label, self.content_label]
+    
+    def _setup_bindings(self) -> None:
+        widgets = [self, self.content_frame, self.time_label, self.content_label]
+        for widget in widgets:
+            widget.bind("<Button-3>", self._show_context_menu)  # Right-click
+            widget.bind("<Double-Button-1>", lambda e: self._on_double_click())  # Double-click
+        self.time_label.bind("<Button-1>", lambda e: self._on_group_click())
+    
+    def _on_selection_change(self) -> None:
+        if self.item_id is not None:
+            self.select_callback(self.item_id, self.select_var.get())
+    
+    def _on_group_click(self) -> None:
+        if self.item_id is not None and self.group_size and self.group_callback is not None:
+            self.group_callback(self.item_id)
+    
+    def _on_double_click(self) -> None:
+        if self.item_id is not None:
+            self.copy_callback(self.item_id)
+    
+    def _show_context_menu(self, event: Any) -> None:
+        if self.item_id is None:
+            return
+        item_id = self.item_id
+        menu = tk.Menu(self, tearoff=0)
+        menu.add_command(
+            label="📋 Copy", 
+            command=lambda: self.copy_callback(item_id)
+        )
+        menu.add_separator()
+        if self.pinned:
+            menu.add_command(
+                label="📌 Unpin", 
+                command=lambda: self.unpin_callback(item_id)
+            )
+        else:
+            menu.add_command(
+                label="📌 Pin", 
+                command=lambda: self.pin_callback(item_id)
+            )
+        
+        group_callback = self.group_callback
+        if self.group_size and group_callback is not None:
+            menu.add_command(
+                label=f"⧉ Show/Hide {self.group_size - 1} similar",
+                command=lambda: group_callback(item_id)
+            )
+        
+        menu.add_separator()
+        menu.add_command(
+            label="🗑️ Delete", 
+            command=lambda: self.delete_callback(item_id)
+        )
+        
+        try:
+            menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            menu.grab_release()
+    
+    def update_selection(self, selected: bool) -> None:
+        self.select_var.set(selected)
+        if self._bound_state is not None:
+            self._bound_state = self._bound_state[:2] + (selected,) + self._bound_state[3:]
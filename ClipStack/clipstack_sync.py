@@ -0,0 +1,307 @@
+"""Sync server that relays ClipStack history changes between machines.
+
+Each ClipStack started with ``--sync URL`` pushes its changes here and
+long-polls for everyone else's. The server only keeps an ordered log of
+changes, so it never needs a node's whole history, and it imports nothing
+beyond the standard library. Run it with ``main.py --sync-server`` or::
+
+    python clipstack_sync.py 127.0.0.1:8765
+
+Requests and responses are JSON compressed with zlib (``Content-Encoding:
+deflate``):
+
+* ``POST /push`` with ``{"node", "changes"}`` appends the changes. Each
+  carries a per-node sequence number ``n``, so a retried push is not
+  applied twice. Returns ``{"seq"}``, the log position after the push.
+* ``GET /pull?since=SEQ&node=NODE&limit=N&wait=SECONDS`` returns
+  ``{"changes", "seq", "more"}``: up to ``limit`` changes after ``since``
+  from other nodes. If there are none yet, it waits up to ``wait`` seconds
+  for some to arrive.
+* ``GET /status`` returns the last position, how many changes are kept
+  and each node's last ``n``.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+SYNC_ADDRESS = "127.0.0.1:8765"
+SYNC_LOG_FILE = "clipstack_sync_log.ndjson"
+MAX_PULL = 1000
+MAX_WAIT = 60.0
+MAX_PUSH_BYTES = 256 * 1024 * 1024
+# Changes the log keeps at most; older ones are dropped
+MAX_CHANGES = 100_000
+
+
+class SyncLog:
+    """The ordered change log, persisted as NDJSON when ``path`` is given.
+
+    Positions are sequence numbers, so changes another one supersedes can
+    be dropped without moving anyone's place: a clip's ``remove`` replaces
+    everything logged for it before, and of two pin changes or touches of a
+    clip only the later stamp or timestamp is kept. Past ``max_changes`` the
+    oldest changes go as well; a node further behind than that catches up
+    from the oldest one kept. The file is rewritten once most of its lines
+    are gone from the log.
+    """
+
+    def __init__(self, path: Optional[str] = SYNC_LOG_FILE, max_changes: int = MAX_CHANGES):
+        self.path = path
+        self.max_changes = max_changes
+        # Kept changes by seq, oldest first, with their seqs in order for lookups;
+        # seqs of dropped changes linger in _order until it is rebuilt
+        self._changes: Dict[int, Dict[str, Any]] = {}
+        self._order: List[int] = []
+        # Seqs of the kept changes to each clip
+        self._by_uid: Dict[str, List[int]] = {}
+        self._seq = 0
+        self._last_n: Dict[str, int] = {}
+        self._changed = threading.Condition()
+        self._file: Optional[TextIO] = None
+        self._file_lines = 0
+        if path is not None:
+            self._load(path)
+            self._file = open(path, "a", encoding="utf-8")
+            if self._file_lines > len(self._changes):
+                self._rewrite()
+
+    def _load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    break
+                self._file_lines += 1
+                self._keep(change)
+                self._last_n[change["node"]] = max(self._last_n.get(change["node"], 0), change["n"])
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def _supersedes(self, change: Dict[str, Any], earlier: Dict[str, Any]) -> Optional[bool]:
+        """Whether ``change`` replaces an earlier change to the same clip; None if both stay."""
+        op, other = change.get("op"), earlier.get("op")
+        if op == "remove":
+            return True
+        if op in ("pin", "unpin") and other in ("pin", "unpin"):
+            return (change.get("stamp") or [0, ""]) >= (earlier.get("stamp") or [0, ""])
+        if op == "touch" and other == "touch":
+            return (change.get("timestamp") or 0) >= (earlier.get("timestamp") or 0)
+        return None
+
+    def _keep(self, change: Dict[str, Any]) -> None:
+        self._seq = max(self._seq, change["seq"])
+        uid = change.get("uid")
+        seqs = self._by_uid.setdefault(uid, []) if uid is not None else []
+        for seq in list(seqs):
+            superseded = self._supersedes(change, self._changes[seq])
+            if superseded:
+                self._drop(seq)
+            elif superseded is not None:
+                # An older pin stamp or timestamp arriving late changes nothing
+                return
+        seqs.append(change["seq"])
+        self._changes[change["seq"]] = change
+        self._order.append(change["seq"])
+        while len(self._changes) > self.max_changes:
+            self._drop(next(iter(self._changes)))
+        if len(self._order) > 2 * len(self._changes) + 1000:
+            self._order = list(self._changes)
+
+    def _drop(self, seq: int) -> None:
+        change = self._changes.pop(seq)
+        uid = change.get("uid", "")
+        seqs = self._by_uid.get(uid)
+        if seqs is not None:
+            seqs.remove(seq)
+            if not seqs:
+                del self._by_uid[uid]
+
+    def _rewrite(self) -> None:
+        """Replace the file with the changes still kept."""
+        if self.path is None or self._file is None:
+            return
+        temp_file = self.path + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(change, ensure_ascii=False) + "\n"
+                            for change in self._changes.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temp_file, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._file_lines = len(self._changes)
+
+    def push(self, node: str, changes: List[Dict[str, Any]]) -> int:
+        with self._changed:
+            last_n = self._last_n.get(node, 0)
+            accepted: List[Dict[str, Any]] = []
+            for change in changes:
+                n = change.get("n", 0)
+                if n <= last_n:
+                    continue
+                last_n = n
+                accepted.append(dict(change, node=node, seq=self._seq + len(accepted) + 1))
+            if accepted:
+                if self._file is not None:
+                    self._file.write("".join(json.dumps(change, ensure_ascii=False) + "\n"
+                                             for change in accepted))
+                    self._file.flush()
+                    self._file_lines += len(accepted)
+                for change in accepted:
+                    self._keep(change)
+                self._last_n[node] = last_n
+                if self._file is not None and self._file_lines > 2 * len(self._changes) + 1000:
+                    self._rewrite()
+                self._changed.notify_all()
+            return self._seq
+
+    def pull(self, since: int, node: str, limit: int = MAX_PULL,
+             wait: float = 0.0) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Changes after ``since`` not made by ``node``, the position reached, and whether more remain."""
+        with self._changed:
+            if wait > 0 and self._seq <= since:
+                self._changed.wait_for(lambda: self._seq > since, timeout=wait)
+            index = bisect.bisect_right(self._order, since)
+            window: List[Dict[str, Any]] = []
+            end = since
+            while index < len(self._order) and len(window) < limit:
+                end = self._order[index]
+                index += 1
+                change = self._changes.get(end)
+                if change is not None and change["node"] != node:
+                    window.append(change)
+            more = index < len(self._order)
+            return window, end if more else max(end, self._seq), more
+
+    def status(self) -> Dict[str, Any]:
+        with self._changed:
+            return {"seq": self._seq, "changes": len(self._changes), "nodes": dict(self._last_n)}
+
+    def close(self) -> None:
+        with self._changed:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _SyncHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    log: SyncLog
+
+
+class _SyncRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _SyncHTTPServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        body = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "deflate")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        log = self.server.log
+        try:
+            if url.path == "/pull":
+                changes, seq, more = log.pull(int(params.get("since", 0)), params.get("node", ""),
+                                              min(int(params.get("limit", MAX_PULL)), MAX_PULL),
+                                              min(float(params.get("wait", 0)), MAX_WAIT))
+                self._send(200, {"changes": changes, "seq": seq, "more": more})
+            elif url.path == "/status":
+                self._send(200, log.status())
+            else:
+                self._send(404, {"error": f"unknown path {url.path}"})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+
+    def do_POST(self) -> None:
+        if urllib.parse.urlsplit(self.path).path != "/push":
+            self._send(404, {"error": "unknown path"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_PUSH_BYTES:
+                raise ValueError("push too large")
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Encoding") == "deflate":
+                body = zlib.decompress(body)
+            request = json.loads(body)
+            seq = self.server.log.push(str(request["node"]), list(request["changes"]))
+        except (ValueError, KeyError, TypeError, zlib.error) as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(200, {"seq": seq})
+
+
+class SyncServer:
+    """The HTTP front end over a SyncLog; ``port`` 0 picks a free port."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765,
+                 log_file: Optional[str] = SYNC_LOG_FILE):
+        self.log = SyncLog(log_file)
+        self.httpd = _SyncHTTPServer((host, port), _SyncRequestHandler)
+        self.httpd.log = self.log
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def serve_forever(self) -> None:
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.log.close()
+
+    def start(self) -> None:
+        """Serve from a background thread, e.g. for tests and benchmarks."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """``HOST:PORT``, ``:PORT`` or ``PORT``; the host defaults to localhost."""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def run_sync_server(address: str = SYNC_ADDRESS, log_file: str = SYNC_LOG_FILE) -> None:
+    host, port = parse_address(address)
+    server = SyncServer(host, port, log_file)
+    print(f"ClipStack sync server listening on {server.url} ({server.log.seq} changes logged)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run_sync_server(sys.argv[1] if len(sys.argv) > 1 else SYNC_ADDRESS)
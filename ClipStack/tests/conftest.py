@@ -0,0 +1,29 @@
+import pytest
+
+import clipstack_core as core
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    """Open ClipboardManagers on histories under ``tmp_path``; all are closed afterwards.
+
+    ``name`` puts the history in a subdirectory of its own, e.g. one per sync node.
+    """
+    opened = []
+
+    def make(name=None, max_items=100, **kwargs):
+        directory = tmp_path if name is None else tmp_path / name
+        directory.mkdir(exist_ok=True)
+        manager = core.ClipboardManager(str(directory / core.HISTORY_FILE), max_items=max_items,
+                                        **kwargs)
+        opened.append(manager)
+        return manager
+
+    yield make
+    for manager in opened:
+        manager.close()
+
+
+@pytest.fixture
+def manager(make_manager):
+    return make_manager()
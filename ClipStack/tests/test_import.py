@@ -0,0 +1,74 @@
+import pytest
+
+import clipstack_core as core
+
+
+def test_imported_clips_are_indexed_when_first_searched(manager):
+    events = []
+    manager.add_listener(events.append)
+    clips = [{"content": f"imported clip number {i} about widgets"} for i in range(50)]
+    report = manager.import_clips(clips, batch_size=20)
+    assert report.imported == 50
+    assert core.EVENT_REGROUPED not in [event.kind for event in events]
+    assert len(manager.search("widgets")) == 50
+    assert [event.kind for event in events][-1] == core.EVENT_REGROUPED
+    # Only the first query pays for the indexing
+    events.clear()
+    assert len(manager.search("widgets")) == 50
+    assert events == []
+    assert [item["content"] for item in manager.search("number 7 ")] == ["imported clip number 7 about widgets"]
+    assert len(manager.similar_groups()) == 50
+
+
+def test_clips_evicted_before_indexing_are_not_found(make_manager):
+    manager = make_manager(max_items=10)
+    manager.add_clipboard_item("live clip")
+    manager.import_clips([{"content": f"clip {i} xyz"} for i in range(30)], batch_size=7)
+    assert manager.count() == 10
+    assert {item["content"] for item in manager.search("xyz")} == {f"clip {i} xyz" for i in range(20, 30)}
+    assert manager.search("live") == []
+
+
+def test_import_then_clear_leaves_nothing_to_index(manager):
+    manager.import_clips([{"content": "something"}])
+    manager.clear_history()
+    assert manager.search("some") == []
+
+
+def test_indexing_imported_clips_announces_the_new_groups(manager):
+    events = []
+    manager.add_listener(events.append)
+    line = "GET /api/orders returned 200 in {} ms for customer account lookup"
+    manager.import_clips([{"content": line.format(i)} for i in range(3)])
+    assert all(event.group is None for event in events)
+    events.clear()
+    assert len(manager.similar_groups()) == 3
+    assert [event.kind for event in events] == [core.EVENT_REGROUPED]
+    events.clear()
+    manager.search("orders")
+    assert events == []
+
+
+SEPARATOR = "-" * 50
+
+
+@pytest.mark.parametrize("fmt", core.EXPORT_FORMATS)
+def test_exports_round_trip_clips_containing_the_separator(tmp_path, make_manager, fmt):
+    clips = [
+        "plain clip",
+        f"before\n{SEPARATOR}\nafter",
+        f"{SEPARATOR}\n\nnot an ID line",
+        f"ends with the separator\n{SEPARATOR}",
+        f"ends with the separator and a blank line\n{SEPARATOR}\n",
+        "a, \"quoted\" clip\nover two lines",
+    ]
+    source = make_manager("source")
+    for clip in clips:
+        source.add_clipboard_item(clip)
+    path = str(tmp_path / f"export.{fmt}")
+    assert source.export(path, fmt) == len(clips)
+    source.close()
+    target = make_manager("target")
+    report = target.import_file(path, fmt)
+    assert report.imported == len(clips)
+    assert sorted(item["content"] for item in target.load_history()) == sorted(clips)
@@ -0,0 +1,75 @@
+import multiprocessing
+import random
+import sys
+import time
+
+import pytest
+
+import clipstack_core as core
+
+
+def _worker(history_file, worker_id, ops, results):
+    """One ClipStack instance sharing the history; reports the clips it ended up with."""
+    core.COMPACT_THRESHOLD = 20
+    rng = random.Random(worker_id)
+    manager = core.ClipboardManager(history_file, max_items=1_000_000)
+    expected = {}
+    for i in range(ops):
+        content = f"process {worker_id} clip {i}"
+        manager.add_clipboard_item(content)
+        expected[content] = False
+        target = f"process {worker_id} clip {rng.randrange(i + 1)}"
+        item_id = manager.find_by_content(target)
+        if item_id is None:
+            continue
+        action = rng.random()
+        if action < 0.2:
+            manager.pin_item(item_id)
+            expected[target] = True
+        elif action < 0.3:
+            manager.remove_item(item_id)
+            del expected[target]
+    manager.close()
+    results.put(expected)
+
+
+def _merged(manager):
+    return {manager.get_content(item["id"]): item["pinned"] for item in manager.load_history()}
+
+
+@pytest.mark.parametrize("watcher", ["inotify", "polling"])
+def test_processes_share_one_history(tmp_path, make_manager, monkeypatch, watcher):
+    if watcher == "inotify" and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is Linux only")
+    if watcher == "polling":
+        monkeypatch.setattr(core.HistoryFileWatcher, "_open_inotify", lambda self: None)
+    processes, ops = 3, 60
+    history_file = str(tmp_path / core.HISTORY_FILE)
+    # Only watches: it learns of the workers' changes through its file watcher
+    observer = make_manager(max_items=1_000_000)
+    assert (observer.storage._watcher._inotify_fd is not None) == (watcher == "inotify")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=_worker, args=(history_file, n, ops, results))
+               for n in range(processes)]
+    for process in workers:
+        process.start()
+    expected = {}
+    try:
+        for _ in workers:
+            expected.update(results.get(timeout=120))
+    finally:
+        for process in workers:
+            process.join(timeout=30)
+    assert all(process.exitcode == 0 for process in workers)
+
+    deadline = time.monotonic() + 10
+    while _merged(observer) != expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _merged(observer) == expected
+    observer.close()
+
+    reopened = make_manager(max_items=1_000_000)
+    assert _merged(reopened) == expected
+    ids = [item["id"] for item in reopened.load_history()]
+    assert len(set(ids)) == len(ids)
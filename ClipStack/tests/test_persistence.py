@@ -0,0 +1,109 @@
+import os
+import random
+import threading
+
+import pytest
+
+import clipstack_core as core
+
+
+def _add(storage, item_id):
+    storage.apply([{"op": "add", "item": {"id": item_id, "content": f"clip {item_id}",
+                                          "timestamp": float(item_id)}}])
+
+
+def _ids(history_file):
+    storage = core.JournalHistoryStorage(history_file)
+    try:
+        return {item["id"] for item in storage.load_history()}
+    finally:
+        storage.close()
+
+
+def test_failed_compactions_keep_every_record(tmp_path):
+    history_file = str(tmp_path / core.HISTORY_FILE)
+    compacting = history_file + core.JOURNAL_SUFFIX + core.COMPACTING_SUFFIX
+    storage = core.JournalHistoryStorage(history_file)
+    try:
+        for item_id in (1, 2, 3):
+            _add(storage, item_id)
+        # The snapshot's temp file cannot be created, so compaction fails after rotating
+        os.mkdir(history_file + ".tmp")
+        storage.compact()
+        assert os.path.exists(compacting)
+        for item_id in (4, 5, 6):
+            _add(storage, item_id)
+        storage.compact()
+        storage.writer.flush()
+        # As if the process had crashed here
+        assert _ids(history_file) == {1, 2, 3, 4, 5, 6}
+
+        os.rmdir(history_file + ".tmp")
+        storage.compact()
+        assert not os.path.exists(compacting)
+    finally:
+        storage.close()
+    assert _ids(history_file) == {1, 2, 3, 4, 5, 6}
+
+
+def test_interrupted_journal_append_is_replayed_once(tmp_path):
+    history_file = str(tmp_path / core.HISTORY_FILE)
+    journal = history_file + core.JOURNAL_SUFFIX
+    storage = core.JournalHistoryStorage(history_file)
+    for item_id in (1, 2):
+        _add(storage, item_id)
+    storage.close()
+    # A crash while folding the journal into a set-aside one leaves the records in both
+    with open(journal, "rb") as f:
+        records = f.read()
+    with open(journal + core.COMPACTING_SUFFIX, "wb") as f:
+        f.write(records + b'{"op": "add", "item": {"id": 3')
+    reopened = core.JournalHistoryStorage(history_file)
+    try:
+        assert [item["id"] for item in reopened.load_history()] == [2, 1]
+    finally:
+        reopened.close()
+
+
+@pytest.mark.parametrize("durability", core.DURABILITY_LEVELS)
+def test_concurrent_writers_survive_compaction(tmp_path, make_manager, monkeypatch, durability):
+    """Several threads add, pin and delete clips while compaction runs repeatedly."""
+    threads, ops = 4, 150
+    monkeypatch.setattr(core, "COMPACT_THRESHOLD", 40)
+    history_file = str(tmp_path / core.HISTORY_FILE)
+    storage = core.JournalHistoryStorage(history_file, durability=durability)
+    manager = make_manager(max_items=threads * ops + 1, storage=storage)
+    errors = []
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        try:
+            for i in range(ops):
+                manager.add_clipboard_item(f"worker {worker_id} clip {i}")
+                target = manager.find_by_content(f"worker {worker_id} clip {rng.randrange(i + 1)}")
+                if target is None:
+                    continue
+                action = rng.random()
+                if action < 0.2:
+                    manager.pin_item(target)
+                elif action < 0.3:
+                    manager.unpin_item(target)
+                elif action < 0.4:
+                    manager.remove_item(target)
+        except BaseException as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    expected = {item["id"]: item["pinned"] for item in manager.load_history()}
+    manager.close()
+
+    reopened = core.JournalHistoryStorage(history_file)
+    actual = {item["id"]: item["pinned"] for item in reopened.load_history()}
+    reopened.close()
+    assert not errors
+    assert storage.writer.batches > 1
+    assert actual == expected
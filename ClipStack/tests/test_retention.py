@@ -0,0 +1,76 @@
+import clipstack_core as core
+
+
+def _policy(max_items=100, max_bytes=None, max_age=None, size_tiers=(), secret_max_age=None):
+    return core.RetentionPolicy(max_items, max_bytes, max_age, size_tiers, secret_max_age)
+
+
+def _contents(manager):
+    return [item["content"] for item in manager.load_history()]
+
+
+def _later(monkeypatch, seconds):
+    now = core.time.time() + seconds
+    monkeypatch.setattr(core.time, "time", lambda: now)
+
+
+def test_oldest_clips_go_past_the_item_limit(make_manager):
+    manager = make_manager(retention=_policy(max_items=3))
+    for i in range(5):
+        manager.add_clipboard_item(f"clip {i}")
+    assert _contents(manager) == ["clip 4", "clip 3", "clip 2"]
+    assert manager.count() == 3
+
+
+def test_oldest_clips_go_past_the_byte_limit(make_manager, capsys):
+    manager = make_manager(retention=_policy(max_bytes=250))
+    for i in range(5):
+        manager.add_clipboard_item(f"{i}" * 100)
+    assert _contents(manager) == ["4" * 100, "3" * 100]
+    # A clip larger than the whole budget is not stored at all
+    assert not manager.add_clipboard_item("x" * 251)
+    assert "exceeds the retention policy" in capsys.readouterr().out
+    assert _contents(manager) == ["4" * 100, "3" * 100]
+
+
+def test_clips_expire_with_age(make_manager, monkeypatch):
+    manager = make_manager(retention=_policy(max_age=60))
+    manager.add_clipboard_item("old clip")
+    expires = manager.next_expiry()
+    assert expires is not None and expires - core.time.time() <= 60
+    assert manager.enforce_retention() == 0
+    _later(monkeypatch, 61)
+    manager.add_clipboard_item("new clip")
+    assert _contents(manager) == ["new clip"]
+    _later(monkeypatch, 200)
+    assert manager.enforce_retention() == 1
+    assert _contents(manager) == []
+    assert manager.next_expiry() is None
+
+
+def test_size_tiers_expire_large_clips_sooner(make_manager, monkeypatch):
+    manager = make_manager(retention=_policy(max_age=3600, size_tiers=[(1000, 60)]))
+    manager.add_clipboard_item("small clip")
+    manager.add_clipboard_item("L" * 1000)
+    _later(monkeypatch, 61)
+    assert manager.enforce_retention() == 1
+    assert _contents(manager) == ["small clip"]
+    _later(monkeypatch, 3601)
+    assert manager.enforce_retention() == 1
+    assert _contents(manager) == []
+
+
+def test_pinned_clips_are_never_evicted(make_manager, monkeypatch):
+    manager = make_manager(retention=_policy(max_items=2, max_bytes=250, max_age=60))
+    manager.add_clipboard_item("p" * 200)
+    manager.pin_item(manager.find_by_content("p" * 200))
+    for i in range(4):
+        manager.add_clipboard_item(f"clip {i}")
+    assert _contents(manager) == ["p" * 200, "clip 3", "clip 2"]
+    _later(monkeypatch, 61)
+    assert manager.enforce_retention() == 2
+    assert [item["content"] for item in manager.load_history(pinned=True)] == ["p" * 200]
+    # Unpinning hands it back to the policy
+    manager.unpin_item(manager.find_by_content("p" * 200))
+    assert manager.enforce_retention() == 1
+    assert manager.count() == 0
@@ -0,0 +1,138 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import clipstack_core as core
+
+
+def _storage(kind, tmp_path):
+    if kind == "journal":
+        return core.JournalHistoryStorage(str(tmp_path / core.HISTORY_FILE))
+    return core.SQLiteHistoryStorage(str(tmp_path / core.SQLITE_FILE))
+
+
+def _blob_files(tmp_path):
+    found = set()
+    for _, _, files in os.walk(tmp_path / core.BLOB_DIR):
+        found.update(name for name in files if not name.endswith((".tmp", core.LOCK_SUFFIX)))
+    return found
+
+
+@pytest.mark.parametrize("kind", ["journal", "sqlite"])
+def test_history_survives_reopening(tmp_path, make_manager, kind):
+    manager = make_manager(storage=_storage(kind, tmp_path))
+    for text in ("first", "second", "third"):
+        assert manager.add_clipboard_item(text)
+    manager.pin_item(manager.find_by_content("second"))
+    manager.remove_item(manager.find_by_content("first"))
+    manager.close()
+
+    manager = make_manager(storage=_storage(kind, tmp_path))
+    assert [item["content"] for item in manager.load_history()] == ["second", "third"]
+    assert [item["content"] for item in manager.load_history(pinned=True)] == ["second"]
+    assert manager.count() == 2
+    # Ids keep counting up from the reopened history
+    assert manager.add_clipboard_item("fourth")
+    assert manager.find_by_content("fourth") > manager.find_by_content("third")
+
+
+def test_recopied_content_moves_to_the_top(manager):
+    manager.add_clipboard_item("alpha")
+    manager.add_clipboard_item("beta")
+    alpha_id = manager.find_by_content("alpha")
+    manager.add_clipboard_item("alpha")
+    history = manager.load_history()
+    assert [item["content"] for item in history] == ["alpha", "beta"]
+    assert history[0]["id"] == alpha_id
+    # The same text copied twice in a row is not even touched
+    assert not manager.add_clipboard_item("alpha")
+
+
+def test_large_clips_go_to_the_blob_store(tmp_path, manager):
+    content = "large clip line\n" * (core.BLOB_THRESHOLD // 8)
+    manager.add_clipboard_item(content)
+    item_id = manager.find_by_content(content)
+    item = manager.get_item(item_id)
+    assert item["blob"] and "content" not in item
+    assert _blob_files(tmp_path) == {item["hash"]}
+    assert manager.get_content(item_id) == content
+    manager.remove_item(item_id)
+    manager.close()
+    assert _blob_files(tmp_path) == set()
+
+
+def test_blobs_outlive_removals_until_those_are_on_disk(tmp_path, manager):
+    content = "large clip line\n" * (core.BLOB_THRESHOLD // 8)
+    manager.add_clipboard_item(content)
+    item = manager.get_item(manager.find_by_content(content))
+    manager.storage.writer.flush()
+    # Holding the file lock keeps the writer from getting the removal to disk
+    with manager.storage._file_lock:
+        manager.remove_item(item["id"])
+        manager.add_clipboard_item("a later clip")
+        assert _blob_files(tmp_path) == {item["hash"]}
+    manager.storage.writer.flush()
+    manager.add_clipboard_item("and another")
+    assert _blob_files(tmp_path) == set()
+
+
+def test_recopying_a_removed_clip_keeps_its_blob(make_manager):
+    manager = make_manager()
+    content = "large clip line\n" * (core.BLOB_THRESHOLD // 8)
+    manager.add_clipboard_item(content)
+    item_id = manager.find_by_content(content)
+    with manager.storage._file_lock:
+        manager.remove_item(item_id)
+        manager.last_copied = ""
+        manager.add_clipboard_item(content)
+    manager.close()
+    manager = make_manager()
+    assert manager.get_content(manager.find_by_content(content)) == content
+
+
+def test_near_duplicates_are_stored_as_deltas(make_manager):
+    manager = make_manager(delta_variants=True)
+    base = "".join(f"line {i} of a long generated report\n" for i in range(400))
+    variant = base.replace("line 200 of", "line two hundred of")
+    manager.add_clipboard_item(base)
+    manager.add_clipboard_item(variant)
+    variant_id = manager.find_by_content(variant)
+    base_id = manager.find_by_content(base)
+    assert manager.blob_store._delta_base(manager.get_item(variant_id)["hash"]) is not None
+    manager.content_cache.clear()
+    assert manager.get_content(variant_id) == variant
+    manager.remove_item(base_id)
+    manager.close()
+    # Deleting the base rewrote the delta in full first
+    manager = make_manager(delta_variants=True)
+    assert manager.get_content(variant_id) == variant
+    assert manager.blob_store._delta_base(manager.get_item(variant_id)["hash"]) is None
+
+
+def test_added_events_carry_the_group_joined(manager):
+    events = []
+    manager.add_listener(events.append)
+    line = "GET /api/orders returned 200 in {} ms for customer account lookup"
+    manager.add_clipboard_item(line.format(12))
+    manager.add_clipboard_item("something else entirely")
+    manager.add_clipboard_item(line.format(15))
+    first, other, second = (event for event in events if event.kind == core.EVENT_ADDED)
+    assert first.group is None and other.group is None
+    assert second.group == first.item_id
+    assert manager.similar_groups() == {first.item_id: first.item_id,
+                                        second.item_id: first.item_id}
+
+
+def test_similarity_signatures_do_not_depend_on_the_hash_seed():
+    script = ("import clipstack_core as core; "
+              "features = core.SimilarityIndex._features('GET /api/orders returned 200 in 12 ms'); "
+              "print(core.SimilarityIndex._signature(features).hex())")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    signatures = {
+        subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True,
+                       check=True, env=dict(os.environ, PYTHONHASHSEED=str(seed))).stdout
+        for seed in (1, 2, 3)
+    }
+    assert len(signatures) == 1
@@ -0,0 +1,118 @@
+import pytest
+
+import clipstack_core as core
+from clipstack_sync import SyncLog, SyncServer
+
+
+@pytest.fixture
+def server():
+    server = SyncServer(port=0, log_file=None)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def _client(manager, url):
+    client = core.SyncClient(manager, url)
+    # Replicate local changes without the background threads
+    manager.replicator = client
+    return client
+
+
+def _contents(manager):
+    return {manager.get_content(item["id"]) for item in manager.load_history()}
+
+
+def test_changes_reach_the_other_node(make_manager, server):
+    a, b = make_manager("a"), make_manager("b")
+    sync_a, sync_b = _client(a, server.url), _client(b, server.url)
+    a.add_clipboard_item("first clip")
+    a.add_clipboard_item("second clip")
+    assert sync_a.push()
+    assert sync_b.pull() == 2
+    assert _contents(b) == {"first clip", "second clip"}
+
+    b.pin_item(b.find_by_content("first clip"))
+    b.remove_item(b.find_by_content("second clip"))
+    assert sync_b.push()
+    sync_a.pull()
+    assert [(item["pinned"], a.get_content(item["id"])) for item in a.load_history()] == [
+        (True, "first clip")]
+    for client in (sync_a, sync_b):
+        client.stop()
+
+
+def test_change_numbers_survive_a_crash(make_manager, server):
+    a, b = make_manager("a"), make_manager("b")
+    sync_a, sync_b = _client(a, server.url), _client(b, server.url)
+    a.add_clipboard_item("clip")
+    assert sync_a.push()
+    sync_a.pull()
+    a.pin_item(a.find_by_content("clip"))
+    assert sync_a.push()
+    # No stop(): the state file is all a restarted instance has
+    a.replicator = None
+    restarted = _client(a, server.url)
+    a.remove_item(a.find_by_content("clip"))
+    assert restarted.push()
+    sync_b.pull()
+    assert _contents(b) == set()
+    for client in (restarted, sync_b):
+        client.stop()
+
+
+def test_pull_keeps_unsent_changes_on_disk(make_manager):
+    a = make_manager("a")
+    # Nothing listens there, so the change stays queued
+    client = _client(a, "http://127.0.0.1:9")
+    a.add_clipboard_item("queued while offline")
+    assert not client.push(timeout=0.5)
+    client.pulled = 0
+    client._save_state()
+    a.replicator = None
+    restarted = core.SyncClient(a, "http://127.0.0.1:9")
+    assert [change["content"] for change in restarted._outbox] == ["queued while offline"]
+
+
+def _push(log, node, *changes):
+    numbered = [dict(change, n=log.status()["nodes"].get(node, 0) + i + 1)
+                for i, change in enumerate(changes)]
+    return log.push(node, numbered)
+
+
+def test_log_drops_changes_a_later_one_supersedes(tmp_path):
+    path = str(tmp_path / "sync.ndjson")
+    log = SyncLog(path)
+    _push(log, "a", {"op": "add", "uid": "a:1", "content": "x" * 1000},
+          {"op": "add", "uid": "a:2", "content": "kept"},
+          {"op": "pin", "uid": "a:2", "stamp": [1.0, "a"]})
+    _push(log, "b", {"op": "unpin", "uid": "a:2", "stamp": [2.0, "b"]},
+          {"op": "pin", "uid": "a:2", "stamp": [1.5, "b"]},
+          {"op": "remove", "uid": "a:1"})
+    changes, seq, more = log.pull(0, "c")
+    assert [(change["op"], change["uid"]) for change in changes] == [
+        ("add", "a:2"), ("unpin", "a:2"), ("remove", "a:1")]
+    assert seq == log.seq == 6 and not more
+    # A node part way through only gets what is still kept after its position
+    assert [change["op"] for change in log.pull(3, "c")[0]] == ["unpin", "remove"]
+    log.close()
+
+    reopened = SyncLog(path)
+    assert reopened.pull(0, "c")[0] == changes
+    assert reopened.seq == 6
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+    # Numbers already seen are still skipped
+    assert reopened.push("b", [{"op": "remove", "uid": "a:2", "n": 3}]) == 6
+    reopened.close()
+
+
+def test_log_is_bounded():
+    log = SyncLog(None, max_changes=10)
+    for i in range(25):
+        _push(log, "a", {"op": "add", "uid": f"a:{i}", "content": str(i)})
+    changes, seq, more = log.pull(0, "b", limit=4)
+    assert [change["content"] for change in changes] == ["15", "16", "17", "18"]
+    assert more
+    changes, seq, more = log.pull(seq, "b")
+    assert len(changes) == 6 and seq == 25 and not more